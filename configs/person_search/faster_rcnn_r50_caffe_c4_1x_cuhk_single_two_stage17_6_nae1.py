@@ -63,12 +63,29 @@ test_pipeline = [
             dict(type='Collect', keys=['img']),
         ])
 ]
+query_test_pipeline = [
+    dict(type='LoadImageFromFile'),
+    dict(type='LoadProposals'),
+    dict(
+        type='MultiScaleFlipAug',
+        img_scale=(1500, 900),
+        flip=False,
+        transforms=[
+            dict(type='Resize', keep_ratio=True),
+            dict(type='RandomFlip'),
+            dict(type='Normalize', **img_norm_cfg),
+            dict(type='Pad', size_divisor=32),
+            dict(type='DefaultFormatBundle'),
+            dict(type='Collect', keys=['img', 'proposals']),
+        ])
+]
 data = dict(
     samples_per_gpu=5,
     workers_per_gpu=5,
     train=dict(pipeline=train_pipeline),
     val=dict(pipeline=test_pipeline),
-    test=dict(pipeline=test_pipeline))
+    test=dict(
+        pipeline=test_pipeline, query_test_pipeline=query_test_pipeline))
 optimizer_config = dict(_delete_=True, grad_clip=None)
 
 # optimizer
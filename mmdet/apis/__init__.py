@@ -1,6 +1,12 @@
 # Copyright (c) OpenMMLab. All rights reserved.
-from .inference import (async_inference_detector, inference_detector,
+from .inference import (InferenceEngine, async_inference_detector,
+                        get_inference_engine, inference_detector,
                         init_detector, show_result_pyplot)
+from .query import extract_query_features, query_cache_key
+from .search import GallerySearchIndex, build_search_index
+from .serving import (MicroBatchServer, ServerOverloadedError,
+                      decode_detections, encode_detections,
+                      request_detections)
 from .test import multi_gpu_test, single_gpu_test
 from .train import (get_root_logger, init_random_seed, set_random_seed,
                     train_detector)
@@ -8,5 +14,9 @@ from .train import (get_root_logger, init_random_seed, set_random_seed,
 __all__ = [
     'get_root_logger', 'set_random_seed', 'train_detector', 'init_detector',
     'async_inference_detector', 'inference_detector', 'show_result_pyplot',
-    'multi_gpu_test', 'single_gpu_test', 'init_random_seed'
+    'multi_gpu_test', 'single_gpu_test', 'init_random_seed',
+    'extract_query_features', 'query_cache_key', 'GallerySearchIndex',
+    'build_search_index', 'InferenceEngine', 'get_inference_engine',
+    'MicroBatchServer', 'ServerOverloadedError', 'encode_detections',
+    'decode_detections', 'request_detections'
 ]
@@ -11,11 +11,17 @@ from mmcv.runner import load_checkpoint
 
 from mmdet.core import get_classes
 from mmdet.datasets import replace_ImageToTensor
-from mmdet.datasets.pipelines import Compose
+from mmdet.datasets.pipelines import (Compose, LoadImageFromFile,
+                                      LoadImageFromWebcam, Resize)
 from mmdet.models import build_detector
+from mmdet.models.utils import convert_to_deploy
 
 
-def init_detector(config, checkpoint=None, device='cuda:0', cfg_options=None):
+def init_detector(config,
+                  checkpoint=None,
+                  device='cuda:0',
+                  cfg_options=None,
+                  deploy=False):
     """Initialize a detector from config file.
 
     Args:
@@ -25,6 +31,9 @@ def init_detector(config, checkpoint=None, device='cuda:0', cfg_options=None):
             will not load any weights.
         cfg_options (dict): Options to override some settings in the used
             config.
+        deploy (bool | Sequence[str]): Convert the detector to its inference
+            graph with :func:`convert_to_deploy`, True for the default
+            converters or the names of the converters. Default: False.
 
     Returns:
         nn.Module: The constructed detector.
@@ -51,6 +60,8 @@ def init_detector(config, checkpoint=None, device='cuda:0', cfg_options=None):
             warnings.warn('Class names are not saved in the checkpoint\'s '
                           'meta data, use COCO classes by default.')
             model.CLASSES = get_classes('coco')
+    if deploy:
+        convert_to_deploy(model, None if deploy is True else deploy)
     model.cfg = config  # save the config in the model for convenience
     model.to(device)
     model.eval()
@@ -90,9 +101,250 @@ class LoadImage:
         return results
 
 
+class InferenceEngine:
+    """Reusable batched inference of a detector.
+
+    The test pipeline of ``model.cfg`` is compiled once. For the common
+    single-scale pipelines without flip (``LoadImageFromFile`` followed by a
+    ``MultiScaleFlipAug`` of ``Resize``, ``RandomFlip``, ``Normalize``,
+    ``Pad`` and ``ImageToTensor``/``DefaultFormatBundle``), only the loading
+    and resizing run image by image. The resized images are copied into one
+    padded batch which is normalized with vectorized ops, optionally on the
+    device of the model, and fed to the model in a single forward. Other
+    pipelines run through the cached ``Compose`` image by image.
+
+    Args:
+        model (nn.Module): The loaded detector, with its config in
+            ``model.cfg``.
+        preprocess_device (str | :obj:`torch.device`, optional): Device on
+            which the batch is normalized. Default: None (the device of the
+            model).
+    """
+
+    def __init__(self, model, preprocess_device=None):
+        self.model = model
+        self.cfg = model.cfg
+        self.device = next(model.parameters()).device
+        self.preprocess_device = torch.device(
+            preprocess_device) if preprocess_device is not None else \
+            self.device
+        pipeline = replace_ImageToTensor(self.cfg.data.test.pipeline)
+        self.pipelines = {}
+        for load_type in ('LoadImageFromFile', 'LoadImageFromWebcam'):
+            load_cfg = pipeline[0].copy()
+            load_cfg['type'] = load_type
+            self.pipelines[load_type] = Compose([load_cfg] + pipeline[1:])
+        self._compile(pipeline)
+        if self.device.type != 'cuda':
+            for m in model.modules():
+                assert not isinstance(
+                    m, RoIPool
+                ), 'CPU inference with RoIPool is not supported currently.'
+
+    def _compile(self, pipeline):
+        """Set up the batched path if the pipeline allows it."""
+        self.batched = False
+        if len(pipeline) != 2 or pipeline[1]['type'] != 'MultiScaleFlipAug':
+            return
+        aug = pipeline[1]
+        img_scale = aug.get('img_scale')
+        if isinstance(img_scale, list):
+            img_scale = img_scale[0] if len(img_scale) == 1 else None
+        if img_scale is None or aug.get('flip', False):
+            return
+        transforms = aug['transforms']
+        types = [t['type'] for t in transforms]
+        if types[:4] != ['Resize', 'RandomFlip', 'Normalize', 'Pad'] or \
+                types[4:-1] not in (['ImageToTensor'],
+                                    ['DefaultFormatBundle']) or \
+                types[-1] != 'Collect' or \
+                list(transforms[-1]['keys']) != ['img']:
+            return
+        resize_cfg, _, norm_cfg, pad_cfg = [
+            dict(t) for t in transforms[:4]
+        ]
+        pad_val = pad_cfg.get('pad_val', 0)
+        if isinstance(pad_val, dict):
+            pad_val = pad_val.get('img', 0)
+        if pad_val != 0 or pad_cfg.get('pad_to_square', False):
+            return
+
+        load_cfg = dict(pipeline[0])
+        load_cfg.pop('type')
+        self.load_transforms = dict(
+            LoadImageFromFile=LoadImageFromFile(**load_cfg),
+            LoadImageFromWebcam=LoadImageFromWebcam(**load_cfg))
+        resize_cfg.pop('type')
+        self.resize = Resize(**resize_cfg)
+        self.img_scale = img_scale
+        self.mean = torch.tensor(norm_cfg['mean'], dtype=torch.float32)
+        # multiply by the inverse std like `mmcv.imnormalize`
+        self.stdinv = torch.tensor(
+            1 / np.float64(norm_cfg['std']), dtype=torch.float32)
+        self.to_rgb = norm_cfg.get('to_rgb', True)
+        self.img_norm_cfg = dict(
+            mean=np.array(norm_cfg['mean'], dtype=np.float32),
+            std=np.array(norm_cfg['std'], dtype=np.float32),
+            to_rgb=self.to_rgb)
+        self.pad_size = pad_cfg.get('size')
+        self.pad_size_divisor = pad_cfg.get('size_divisor')
+        self.meta_keys = transforms[-1].get(
+            'meta_keys', ('filename', 'ori_filename', 'ori_shape',
+                          'img_shape', 'pad_shape', 'scale_factor', 'flip',
+                          'flip_direction', 'img_norm_cfg'))
+        self.batched = True
+
+    def load(self, imgs):
+        """Load and resize the images.
+
+        Args:
+            imgs (list[str | ndarray]): Image files or loaded images.
+
+        Returns:
+            list[dict]: Results of the loading and resizing transforms.
+        """
+        results = []
+        for img in imgs:
+            if isinstance(img, np.ndarray):
+                data = self.load_transforms['LoadImageFromWebcam'](
+                    dict(img=img))
+            else:
+                data = self.load_transforms['LoadImageFromFile'](
+                    dict(img_info=dict(filename=img), img_prefix=None))
+            data['scale'] = self.img_scale
+            data['flip'] = False
+            data['flip_direction'] = None
+            self.resize._resize_img(data)
+            results.append(data)
+        return results
+
+    def collate(self, results):
+        """Normalize and pad the resized images into one batch.
+
+        Args:
+            results (list[dict]): Results of :meth:`load`.
+
+        Returns:
+            dict: ``img`` and ``img_metas`` to be fed to the model.
+        """
+        pad_shapes = []
+        for data in results:
+            h, w = data['img'].shape[:2]
+            if self.pad_size is not None:
+                pad_h, pad_w = self.pad_size
+            else:
+                divisor = self.pad_size_divisor
+                pad_h = int(np.ceil(h / divisor)) * divisor
+                pad_w = int(np.ceil(w / divisor)) * divisor
+            pad_shapes.append((pad_h, pad_w))
+        batch_h = max(h for h, _ in pad_shapes)
+        batch_w = max(w for _, w in pad_shapes)
+        imgs = [data['img'] for data in results]
+        dtype = np.uint8 if all(img.dtype == np.uint8
+                                for img in imgs) else np.float32
+        batch = np.zeros((len(imgs), batch_h, batch_w, imgs[0].shape[2]),
+                         dtype=dtype)
+        mask = np.zeros((len(imgs), batch_h, batch_w, 1), dtype=np.bool_)
+        for i, img in enumerate(imgs):
+            batch[i, :img.shape[0], :img.shape[1]] = img
+            mask[i, :img.shape[0], :img.shape[1]] = True
+
+        device = self.preprocess_device
+        batch = torch.from_numpy(batch).to(device, non_blocking=True)
+        mask = torch.from_numpy(mask).to(device, non_blocking=True)
+        batch = batch.float()
+        if self.to_rgb:
+            batch = batch.flip(-1)
+        batch = (batch - self.mean.to(device)) * self.stdinv.to(device)
+        # the pads are zeros after normalization
+        batch = batch.masked_fill_(~mask, 0).permute(0, 3, 1, 2)
+        batch = batch.to(self.device).contiguous()
+
+        img_metas = []
+        for data, (pad_h, pad_w) in zip(results, pad_shapes):
+            data['pad_shape'] = (pad_h, pad_w) + data['img_shape'][2:]
+            data['img_norm_cfg'] = self.img_norm_cfg
+            img_metas.append({key: data[key] for key in self.meta_keys})
+        return dict(img=[batch], img_metas=[img_metas])
+
+    def preprocess(self, imgs):
+        """Prepare the input of the model for a batch of images.
+
+        Args:
+            imgs (list[str | ndarray]): Image files or loaded images.
+
+        Returns:
+            dict: ``img`` and ``img_metas`` to be fed to the model.
+        """
+        if self.batched:
+            return self.collate(self.load(imgs))
+        datas = []
+        for img in imgs:
+            if isinstance(img, np.ndarray):
+                data = self.pipelines['LoadImageFromWebcam'](dict(img=img))
+            else:
+                data = self.pipelines['LoadImageFromFile'](
+                    dict(img_info=dict(filename=img), img_prefix=None))
+            datas.append(data)
+        data = collate(datas, samples_per_gpu=len(imgs))
+        # just get the actual data from DataContainer
+        data['img_metas'] = [
+            img_metas.data[0] for img_metas in data['img_metas']
+        ]
+        data['img'] = [img.data[0] for img in data['img']]
+        if self.device.type == 'cuda':
+            # scatter to specified GPU
+            data = scatter(data, [self.device])[0]
+        return data
+
+    def forward(self, data):
+        """Run the model on the output of :meth:`preprocess`."""
+        with torch.no_grad():
+            return self.model(return_loss=False, rescale=True, **data)
+
+    def __call__(self, imgs):
+        """Inference a batch of images.
+
+        Args:
+            imgs (str | ndarray | list[str | ndarray]): Image files or
+                loaded images.
+
+        Returns:
+            If imgs is a list or tuple, the same length list type results
+            will be returned, otherwise return the detection results
+            directly.
+        """
+        if isinstance(imgs, (list, tuple)):
+            return self.forward(self.preprocess(imgs))
+        return self.forward(self.preprocess([imgs]))[0]
+
+
+def get_inference_engine(model):
+    """Get the inference engine of a detector, built on first use.
+
+    The engine is rebuilt when ``model.cfg`` is replaced or the model is
+    moved to another device.
+
+    Args:
+        model (nn.Module): The loaded detector.
+
+    Returns:
+        :obj:`InferenceEngine`: The engine of the model.
+    """
+    engine = getattr(model, '_inference_engine', None)
+    if engine is None or engine.cfg is not model.cfg or \
+            engine.device != next(model.parameters()).device:
+        engine = InferenceEngine(model)
+        model._inference_engine = engine
+    return engine
+
+
 def inference_detector(model, imgs):
     """Inference image(s) with the detector.
 
+    The images are run as one batch by the :class:`InferenceEngine` cached on
+    the model.
+
     Args:
         model (nn.Module): The loaded detector.
         imgs (str/ndarray or list[str/ndarray] or tuple[str/ndarray]):
@@ -102,58 +354,7 @@ def inference_detector(model, imgs):
         If imgs is a list or tuple, the same length list type results
         will be returned, otherwise return the detection results directly.
     """
-
-    if isinstance(imgs, (list, tuple)):
-        is_batch = True
-    else:
-        imgs = [imgs]
-        is_batch = False
-
-    cfg = model.cfg
-    device = next(model.parameters()).device  # model device
-
-    if isinstance(imgs[0], np.ndarray):
-        cfg = cfg.copy()
-        # set loading pipeline type
-        cfg.data.test.pipeline[0].type = 'LoadImageFromWebcam'
-
-    cfg.data.test.pipeline = replace_ImageToTensor(cfg.data.test.pipeline)
-    test_pipeline = Compose(cfg.data.test.pipeline)
-
-    datas = []
-    for img in imgs:
-        # prepare data
-        if isinstance(img, np.ndarray):
-            # directly add img
-            data = dict(img=img)
-        else:
-            # add information into dict
-            data = dict(img_info=dict(filename=img), img_prefix=None)
-        # build the data pipeline
-        data = test_pipeline(data)
-        datas.append(data)
-
-    data = collate(datas, samples_per_gpu=len(imgs))
-    # just get the actual data from DataContainer
-    data['img_metas'] = [img_metas.data[0] for img_metas in data['img_metas']]
-    data['img'] = [img.data[0] for img in data['img']]
-    if next(model.parameters()).is_cuda:
-        # scatter to specified GPU
-        data = scatter(data, [device])[0]
-    else:
-        for m in model.modules():
-            assert not isinstance(
-                m, RoIPool
-            ), 'CPU inference with RoIPool is not supported currently.'
-
-    # forward the model
-    with torch.no_grad():
-        results = model(return_loss=False, rescale=True, **data)
-
-    if not is_batch:
-        return results[0]
-    else:
-        return results
+    return get_inference_engine(model)(imgs)
 
 
 async def async_inference_detector(model, imgs):
@@ -0,0 +1,140 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import copy
+import hashlib
+import os.path as osp
+
+import numpy as np
+from mmcv.utils import print_log
+
+from mmdet.core import ReidResultStore, ReidResultWriter
+from mmdet.core.evaluation.bbox_overlaps import bbox_overlaps
+from mmdet.datasets import build_dataloader
+from .test import single_gpu_test
+
+
+def query_cache_key(checkpoint, query_infos):
+    """Key of the cached query features of a checkpoint and a probe list.
+
+    Args:
+        checkpoint (str): Checkpoint file of the model.
+        query_infos (list[dict]): Probes as returned by
+            ``CuhkDataset.load_query_infos``.
+
+    Returns:
+        str: Hex digest of the checkpoint content and the probes.
+    """
+    sha = hashlib.sha1()
+    with open(checkpoint, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    for info in query_infos:
+        roi = ','.join(f'{v:.1f}' for v in info['roi'].ravel())
+        sha.update(f'{osp.basename(info["filename"])}:{roi};'.encode())
+    return sha.hexdigest()
+
+
+def _select_query_dets(results, query_infos, query_groups=None):
+    """Keep, for each probe, the output box overlapping its roi the most.
+
+    Args:
+        results (list[list[np.ndarray]]): Results of every query sample.
+        query_infos (list[dict]): Probes of the dataset.
+        query_groups (list[list[int]], optional): Probes of every query
+            sample. Default: None (one probe per sample).
+
+    Returns:
+        list[list[np.ndarray]]: One (1, 5 + D) result per probe.
+    """
+    if query_groups is None:
+        query_groups = [[i] for i in range(len(query_infos))]
+    feat_dim = max(
+        (result[0].shape[1] - 5 for result in results if len(result[0])),
+        default=0)
+    query_dets = [None] * len(query_infos)
+    for result, group in zip(results, query_groups):
+        dets = result[0]
+        rois = np.concatenate([query_infos[i]['roi'] for i in group])
+        if len(dets) == 0:
+            det = np.zeros((len(group), 5 + feat_dim), dtype=np.float32)
+            det[:, :4] = rois
+        else:
+            ious = bbox_overlaps(rois, dets[:, :4])
+            det = dets[ious.argmax(axis=1)]
+        for i, probe_idx in enumerate(group):
+            query_dets[probe_idx] = [det[i:i + 1]]
+    return query_dets
+
+
+def extract_query_features(model,
+                           dataset,
+                           checkpoint=None,
+                           cache_dir=None,
+                           samples_per_gpu=1,
+                           workers_per_gpu=2,
+                           group_by_image=False):
+    """Extract the ReID features of all probes of a person search dataset.
+
+    A shallow copy of the dataset is switched to query mode and the probes
+    are run through the model in batches of ``samples_per_gpu``, so that
+    ``dataset`` keeps its gallery samples and pipeline. Detectors with a RoI
+    head pool the feature of the given probe box directly, for the others
+    the output box overlapping the probe box the most is kept.
+
+    With ``group_by_image``, the probes sharing an image are run as one
+    sample: the backbone runs once per image and the RoI head pools all its
+    probe boxes at once.
+
+    When both ``checkpoint`` and ``cache_dir`` are given, the features are
+    cached in a result store keyed by the checkpoint content and the probe
+    list, and reused by later calls.
+
+    Args:
+        model (nn.Module): The detector wrapped by ``MMDataParallel``.
+        dataset (:obj:`CuhkDataset`): Test dataset with a
+            ``query_test_pipeline``.
+        checkpoint (str, optional): Checkpoint file loaded into ``model``.
+        cache_dir (str, optional): Directory of the feature cache.
+        samples_per_gpu (int): Number of probes per forward. Pipelines using
+            ``ImageToTensor`` must be converted with
+            ``replace_ImageToTensor`` when it is larger than 1. Default: 1.
+        workers_per_gpu (int): Number of data loading workers. Default: 2.
+        group_by_image (bool): Whether to run the probes of an image as one
+            sample. Default: False.
+
+    Returns:
+        list[list[np.ndarray]] | :obj:`ReidResultStore`: One (1, 5 + D)
+            result per probe, usable as ``query_results`` of
+            ``CuhkDataset.evaluate``.
+    """
+    query_infos = dataset.load_query_infos()
+    cache_path = None
+    if checkpoint is not None and cache_dir is not None:
+        cache_path = osp.join(cache_dir,
+                              query_cache_key(checkpoint, query_infos))
+        if ReidResultStore.is_store(cache_path):
+            return ReidResultStore(cache_path)
+
+    # the copy shares the parsed probes, ``load_query`` only rebinds the
+    # attributes of the samples
+    dataset = copy.copy(dataset)
+    dataset.load_query(group_by_image=group_by_image)
+    num_samples = len(dataset.query_groups)
+    print_log(
+        f'{len(query_infos)} probes in {num_samples} samples, '
+        f'{len(query_infos) - num_samples} backbone passes saved')
+    data_loader = build_dataloader(
+        dataset,
+        samples_per_gpu=samples_per_gpu,
+        workers_per_gpu=workers_per_gpu,
+        dist=False,
+        shuffle=False)
+    results = single_gpu_test(model, data_loader)
+    query_results = _select_query_dets(results, query_infos,
+                                       dataset.query_groups)
+    if cache_path is None:
+        return query_results
+
+    writer = ReidResultWriter(cache_path)
+    for result in query_results:
+        writer.append(result)
+    return writer.close()
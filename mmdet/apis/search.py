@@ -0,0 +1,331 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import json
+import os
+import os.path as osp
+
+import mmcv
+import numpy as np
+
+from mmdet.core import ReidResultStore
+
+
+class GallerySearchIndex:
+    """Persisted index of person embeddings for top-k gallery search.
+
+    The index is a directory holding the L2-normalized embeddings in
+    fixed-size blocks (``feats_{i}.npy``) together with the box and score
+    (``meta_{i}.npy``) and the int64 image id (``ids_{i}.npy``) of every
+    embedding, the image names, one JSON string per line appended as images
+    are added (``images.jsonl``), and the index metadata (``index.json``).
+    Blocks are memory-mapped when searching, so the gallery never needs to
+    fit in memory, and new detections can be appended at any time.
+
+    Args:
+        index_dir (str): Directory of the index. An empty index is created
+            if it does not exist yet.
+        feat_dim (int, optional): Dimension of the embeddings. Only needed
+            for a new index, it is inferred from the first appended results
+            otherwise.
+        block_size (int): Number of boxes per block. Ignored when opening an
+            existing index. Default: 65536.
+        feat_dtype (str): Storage dtype of the embeddings, ``'float16'``
+            halves the index size. Ignored when opening an existing index.
+            Default: 'float32'.
+    """
+
+    def __init__(self,
+                 index_dir,
+                 feat_dim=None,
+                 block_size=65536,
+                 feat_dtype='float32'):
+        self.index_dir = index_dir
+        if osp.exists(osp.join(index_dir, 'index.json')):
+            with open(osp.join(index_dir, 'index.json')) as f:
+                self.meta = json.load(f)
+            self.img_names = self._load_img_names()
+        else:
+            assert feat_dtype in ('float32', 'float16')
+            mmcv.mkdir_or_exist(index_dir)
+            self.meta = dict(
+                feat_dim=feat_dim,
+                block_size=block_size,
+                feat_dtype=feat_dtype,
+                block_sizes=[],
+                num_images=0)
+            self.img_names = []
+            open(osp.join(index_dir, 'images.jsonl'), 'w').close()
+            self._save_meta()
+        self._pending_feats = []
+        self._pending_meta = []
+        self._pending_ids = []
+        self._num_pending = 0
+        self._blocks = {}
+        self._dirty = False
+
+    def __len__(self):
+        """Number of boxes in the index, including unflushed ones."""
+        return sum(self.meta['block_sizes']) + self._num_pending
+
+    @property
+    def num_images(self):
+        return len(self.img_names)
+
+    @property
+    def num_blocks(self):
+        return len(self.meta['block_sizes'])
+
+    def _block_path(self, prefix, idx):
+        return osp.join(self.index_dir, f'{prefix}_{idx:05d}.npy')
+
+    def _load_img_names(self):
+        path = osp.join(self.index_dir, 'images.jsonl')
+        num_images = self.meta['num_images']
+        with open(path) as f:
+            lines = f.readlines()
+        img_names = [json.loads(line) for line in lines[:num_images]]
+        if len(lines) > num_images:
+            # names appended after the last flush, e.g. by an interrupted
+            # process, are dropped with their boxes
+            with open(path, 'w') as f:
+                f.writelines(json.dumps(name) + '\n' for name in img_names)
+        return img_names
+
+    def _save_meta(self):
+        # only the new image names are appended, index.json is written last
+        # so that it never refers to missing names
+        num_saved = self.meta['num_images']
+        if len(self.img_names) > num_saved:
+            with open(osp.join(self.index_dir, 'images.jsonl'), 'a') as f:
+                f.writelines(
+                    json.dumps(name) + '\n'
+                    for name in self.img_names[num_saved:])
+            self.meta['num_images'] = len(self.img_names)
+        with open(osp.join(self.index_dir, 'index.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    def add_image(self, img_name, dets, det_thresh=0.):
+        """Append the detections of one image.
+
+        Args:
+            img_name (str): Name of the image or frame.
+            dets (ndarray | list[ndarray]): Detections of shape (n, 5 + D)
+                holding boxes, scores and embeddings, or the per-class list
+                returned by ``bbox2result_reid`` of which the first class is
+                used.
+            det_thresh (float): Detections with lower scores are dropped.
+                Default: 0.
+        """
+        if isinstance(dets, (list, tuple)):
+            dets = dets[0]
+        dets = np.asarray(dets, dtype=np.float32)
+        dets = dets[dets[:, 4] >= det_thresh]
+        self._add(img_name, dets[:, :4], dets[:, 4], dets[:, 5:])
+
+    def _add(self, img_name, boxes, scores, feats):
+        if self.meta['feat_dim'] is None:
+            self.meta['feat_dim'] = feats.shape[1]
+        assert feats.shape[1] == self.meta['feat_dim'] or len(feats) == 0
+        img_id = len(self.img_names)
+        self.img_names.append(img_name)
+        self._dirty = True
+        if len(feats) == 0:
+            return
+        norms = np.linalg.norm(feats, axis=1, keepdims=True)
+        self._pending_feats.append(feats / np.maximum(norms, 1e-12))
+        meta = np.empty((len(boxes), 5), dtype=np.float32)
+        meta[:, :4] = boxes
+        meta[:, 4] = scores
+        self._pending_meta.append(meta)
+        # float32 ids would not be exact beyond 2**24 images
+        self._pending_ids.append(np.full(len(boxes), img_id, dtype=np.int64))
+        self._num_pending += len(meta)
+        if self._num_pending >= self.meta['block_size']:
+            self.flush()
+
+    def add_results(self, results, img_names, det_thresh=0.):
+        """Append the test results of a sequence of images.
+
+        Args:
+            results (list | :obj:`ReidResultStore`): Per-image results of a
+                ReID detector, or a result store holding them.
+            img_names (list[str]): Name of every image.
+            det_thresh (float): Detections with lower scores are dropped.
+                Default: 0.
+        """
+        assert len(results) == len(img_names)
+        if isinstance(results, ReidResultStore):
+            for idx, img_name in enumerate(img_names):
+                boxes, scores, feats, labels = results.image_slice(idx)
+                keep = (labels == 0) & (scores >= det_thresh)
+                self._add(img_name, boxes[keep], scores[keep], feats[keep])
+        else:
+            for result, img_name in zip(results, img_names):
+                self.add_image(img_name, result, det_thresh)
+        self.flush()
+
+    def flush(self):
+        """Write the appended boxes to blocks on disk.
+
+        The last block is filled up first, so appending a few boxes at a
+        time does not fragment the index.
+        """
+        if not self._dirty:
+            return
+        if self._pending_feats:
+            feats = np.concatenate(self._pending_feats)
+            meta = np.concatenate(self._pending_meta)
+            ids = np.concatenate(self._pending_ids)
+            self._pending_feats = []
+            self._pending_meta = []
+            self._pending_ids = []
+            self._num_pending = 0
+            block_size = self.meta['block_size']
+            block_sizes = self.meta['block_sizes']
+            if block_sizes and block_sizes[-1] < block_size:
+                idx = len(block_sizes) - 1
+                old_feats, old_meta, old_ids = self._load_block(idx)
+                feats = np.concatenate([old_feats, feats])
+                meta = np.concatenate([old_meta, meta])
+                ids = np.concatenate([old_ids, ids])
+                block_sizes.pop()
+                del self._blocks[idx]
+            for start in range(0, len(feats), block_size):
+                idx = len(block_sizes)
+                self._save_block(
+                    'feats', idx, feats[start:start + block_size].astype(
+                        self.meta['feat_dtype']))
+                self._save_block('meta', idx, meta[start:start + block_size])
+                self._save_block('ids', idx, ids[start:start + block_size])
+                block_sizes.append(len(meta[start:start + block_size]))
+        self._save_meta()
+        self._dirty = False
+
+    def _save_block(self, prefix, idx, array):
+        # write to a new file so that readers of the old block are not
+        # affected
+        path = self._block_path(prefix, idx)
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(path + '.tmp', path)
+
+    def _load_block(self, idx):
+        if idx not in self._blocks:
+            self._blocks[idx] = tuple(
+                np.load(self._block_path(prefix, idx), mmap_mode='r')
+                for prefix in ('feats', 'meta', 'ids'))
+        return self._blocks[idx]
+
+    def search(self, query_feats, topk=10, query_block_size=1024):
+        """Find the most similar gallery boxes of each query.
+
+        The gallery is scanned block by block. Every block is scored against
+        a block of queries with one matrix multiplication, and its top-k is
+        merged into the running top-k of every query, so memory only
+        depends on the block sizes.
+
+        Args:
+            query_feats (ndarray): Query embeddings, shape (Q, D).
+            topk (int): Number of results per query. Default: 10.
+            query_block_size (int): Number of queries scored at once.
+                Default: 1024.
+
+        Returns:
+            tuple[ndarray]: Cosine similarities of shape (Q, k), in
+                descending order, and the index of the matching boxes of
+                shape (Q, k). When the gallery holds fewer than ``topk``
+                boxes, the missing entries have similarity ``-inf`` and
+                index -1.
+        """
+        self.flush()
+        query_feats = np.asarray(query_feats, dtype=np.float32)
+        if query_feats.ndim == 1:
+            query_feats = query_feats[None]
+        norms = np.linalg.norm(query_feats, axis=1, keepdims=True)
+        query_feats = query_feats / np.maximum(norms, 1e-12)
+
+        num_queries = len(query_feats)
+        top_sims = np.full((num_queries, topk), -np.inf, dtype=np.float32)
+        top_inds = np.full((num_queries, topk), -1, dtype=np.int64)
+        offset = 0
+        for idx, block_len in enumerate(self.meta['block_sizes']):
+            feats = self._load_block(idx)[0]
+            feats = np.asarray(feats, dtype=np.float32)
+            k = min(topk, block_len)
+            for q_start in range(0, num_queries, query_block_size):
+                q = slice(q_start, q_start + query_block_size)
+                sims = query_feats[q].dot(feats.T)
+                part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                top_sims[q], top_inds[q] = _merge_topk(
+                    top_sims[q], top_inds[q],
+                    np.take_along_axis(sims, part, axis=1), part + offset,
+                    topk)
+            offset += block_len
+        return top_sims, top_inds
+
+    def get_boxes(self, inds):
+        """Look up the boxes found by :meth:`search`.
+
+        Args:
+            inds (ndarray): Box indices of any shape, -1 entries are
+                ignored.
+
+        Returns:
+            list[dict]: ``img_name``, ``bbox`` (x1, y1, x2, y2), ``score``
+                and ``index`` of every valid index, in the order of
+                ``inds.ravel()``.
+        """
+        self.flush()
+        inds = np.asarray(inds, dtype=np.int64).ravel()
+        starts = np.cumsum([0] + self.meta['block_sizes'])
+        block_inds = np.searchsorted(starts, inds, side='right') - 1
+        boxes = []
+        for ind, block_idx in zip(inds, block_inds):
+            if ind < 0:
+                continue
+            _, meta, ids = self._load_block(block_idx)
+            row = meta[ind - starts[block_idx]]
+            boxes.append(
+                dict(
+                    img_name=self.img_names[ids[ind - starts[block_idx]]],
+                    bbox=np.array(row[:4]),
+                    score=float(row[4]),
+                    index=int(ind)))
+        return boxes
+
+
+def _merge_topk(sims1, inds1, sims2, inds2, topk):
+    """Merge two per-row top-k lists, breaking ties by the box index."""
+    sims = np.concatenate([sims1, sims2], axis=1)
+    inds = np.concatenate([inds1, inds2], axis=1)
+    order = np.lexsort((inds, -sims), axis=1)[:, :topk]
+    return (np.take_along_axis(sims, order, axis=1),
+            np.take_along_axis(inds, order, axis=1))
+
+
+def build_search_index(results,
+                       img_names,
+                       index_dir,
+                       det_thresh=0.5,
+                       block_size=65536,
+                       feat_dtype='float32'):
+    """Build a :class:`GallerySearchIndex` from the outputs of a detector.
+
+    Args:
+        results (list | :obj:`ReidResultStore`): Per-image results as
+            returned by ``bbox2result_reid``, or a result store.
+        img_names (list[str]): Name of every image.
+        index_dir (str): Directory of the index. Boxes are appended when an
+            index already exists there.
+        det_thresh (float): Detections with lower scores are dropped.
+            Default: 0.5.
+        block_size (int): Number of boxes per block. Default: 65536.
+        feat_dtype (str): Storage dtype of the embeddings. Default:
+            'float32'.
+
+    Returns:
+        :obj:`GallerySearchIndex`: The index.
+    """
+    index = GallerySearchIndex(
+        index_dir, block_size=block_size, feat_dtype=feat_dtype)
+    index.add_results(results, img_names, det_thresh)
+    return index
@@ -0,0 +1,336 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import asyncio
+import struct
+import time
+from collections import deque
+
+import mmcv
+import numpy as np
+import torch.nn as nn
+
+from mmdet.core import unpack_reid_results
+from .inference import get_inference_engine
+
+_MAGIC = b'RDET'
+# magic, version, dtype of the embeddings, embedding width, number of boxes
+_HEADER = struct.Struct('<4sBBHI')
+_FEAT_DTYPES = {0: np.float32, 1: np.float16}
+_LENGTH = struct.Struct('<I')
+
+
+def encode_detections(dets, feat_dtype='float16'):
+    """Encode the detections of a ReID detector into a compact buffer.
+
+    The buffer holds a 12-byte header followed by the boxes and scores as
+    float32, shape (n, 5), and the embeddings as ``feat_dtype``, shape
+    (n, D).
+
+    Args:
+        dets (ndarray): Detections of shape (n, 5 + D).
+        feat_dtype (str): Dtype of the encoded embeddings, 'float16' or
+            'float32'. Default: 'float16'.
+
+    Returns:
+        bytes: The encoded detections.
+    """
+    dtype_code = {'float32': 0, 'float16': 1}[feat_dtype]
+    dets = np.asarray(dets, dtype=np.float32)
+    assert dets.ndim == 2 and dets.shape[1] >= 5
+    feat_dim = dets.shape[1] - 5
+    header = _HEADER.pack(_MAGIC, 1, dtype_code, feat_dim, len(dets))
+    boxes = np.ascontiguousarray(dets[:, :5])
+    feats = np.ascontiguousarray(dets[:, 5:], dtype=_FEAT_DTYPES[dtype_code])
+    return header + boxes.tobytes() + feats.tobytes()
+
+
+def decode_detections(buf):
+    """Decode a buffer of :func:`encode_detections`.
+
+    Returns:
+        tuple[ndarray]: Boxes and scores of shape (n, 5) and embeddings of
+            shape (n, D), as float32.
+    """
+    magic, version, dtype_code, feat_dim, num = _HEADER.unpack_from(buf)
+    assert magic == _MAGIC and version == 1, 'not an encoded detection'
+    offset = _HEADER.size
+    boxes = np.frombuffer(buf, np.float32, num * 5, offset).reshape(num, 5)
+    offset += boxes.nbytes
+    feats = np.frombuffer(buf, _FEAT_DTYPES[dtype_code], num * feat_dim,
+                          offset).reshape(num, feat_dim)
+    return boxes.copy(), feats.astype(np.float32)
+
+
+class ServerOverloadedError(RuntimeError):
+    """Raised when the request queue of a :class:`MicroBatchServer` is
+    full."""
+
+
+class MicroBatchServer:
+    """Serve a ReID detector with dynamic micro-batching.
+
+    Incoming frames are queued and grouped into batches of at most
+    ``max_batch_size`` frames. A batch is run as soon as it is full or when
+    its oldest frame has waited ``max_latency`` seconds, so the batch size
+    adapts to the load. The model runs in a worker thread while the event
+    loop keeps accepting requests, and a full queue rejects new frames with
+    :class:`ServerOverloadedError` instead of growing the latency without
+    bound.
+
+    Each frame is answered with its detections of the first class above
+    ``det_thresh``, boxes with their ReID embeddings, in the format of
+    :func:`encode_detections`. Two-stage detectors serve their RoI
+    embeddings, see :func:`unpack_reid_results`.
+
+    Example:
+        >>> server = MicroBatchServer(model, max_batch_size=8)
+        >>> async def main(frames):
+        ...     async with server:
+        ...         bufs = await asyncio.gather(
+        ...             *[server.infer(frame) for frame in frames])
+        ...     return [decode_detections(buf) for buf in bufs]
+
+    Args:
+        model (nn.Module | callable): The detector, run through its
+            :class:`InferenceEngine`, or a callable mapping a list of images
+            to their results.
+        max_batch_size (int): Largest number of frames per forward.
+            Default: 8.
+        max_latency (float): Longest time in seconds a frame waits for its
+            batch to fill up. Default: 0.01.
+        max_queue_size (int): Number of queued frames beyond which requests
+            are rejected. Default: 64.
+        det_thresh (float): Detections with lower scores are dropped.
+            Default: 0.
+        feat_dtype (str): Dtype of the encoded embeddings. Default:
+            'float16'.
+        num_latencies (int): Number of recent requests the latency metrics
+            are computed over. Default: 1000.
+    """
+
+    def __init__(self,
+                 model,
+                 max_batch_size=8,
+                 max_latency=0.01,
+                 max_queue_size=64,
+                 det_thresh=0.,
+                 feat_dtype='float16',
+                 num_latencies=1000):
+        self.engine = get_inference_engine(model) if isinstance(
+            model, nn.Module) else model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.max_queue_size = max_queue_size
+        self.det_thresh = det_thresh
+        self.feat_dtype = feat_dtype
+        self._queue = None
+        self._task = None
+        # frames taken off the queue and not answered yet
+        self._batch = None
+        self._latencies = deque(maxlen=num_latencies)
+        self._queue_times = deque(maxlen=num_latencies)
+        self._counts = dict(requests=0, rejected=0, batches=0, frames=0)
+        self._max_queue_depth = 0
+
+    async def start(self):
+        """Start the batching loop on the running event loop."""
+        assert self._task is None, 'the server is already running'
+        self._queue = asyncio.Queue(self.max_queue_size)
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        """Stop the batching loop, the queued frames and those of the batch
+        being run are not answered."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        pending = self._batch or []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for *_, future in pending:
+            future.cancel()
+        self._task = None
+        self._batch = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def infer(self, img):
+        """Detect the persons of a frame.
+
+        Args:
+            img (ndarray | bytes | str): Decoded frame, encoded image or
+                image file.
+
+        Returns:
+            bytes: The detections of :func:`encode_detections`.
+        """
+        assert self._task is not None, 'the server is not running'
+        loop = asyncio.get_running_loop()
+        if isinstance(img, (bytes, bytearray, memoryview)):
+            # decode off the event loop
+            img = await loop.run_in_executor(None, mmcv.imfrombytes,
+                                             bytes(img))
+            if img is None:
+                # do not fail the whole batch because of one bad frame
+                raise ValueError('failed to decode the image')
+        future = loop.create_future()
+        self._counts['requests'] += 1
+        try:
+            self._queue.put_nowait((time.perf_counter(), img, future))
+        except asyncio.QueueFull:
+            self._counts['rejected'] += 1
+            raise ServerOverloadedError(
+                f'{self.max_queue_size} frames are already queued')
+        self._max_queue_depth = max(self._max_queue_depth,
+                                    self._queue.qsize())
+        return await future
+
+    async def _next_batch(self):
+        self._batch = batch = [await self._queue.get()]
+        deadline = batch[0][0] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(),
+                                                    timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            start = time.perf_counter()
+            imgs = [img for _, img, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.engine, imgs)
+                # two-stage detectors answer the batch with a single tuple,
+                # of which the RoI embeddings are served
+                results = unpack_reid_results(results)
+                bufs = [self._encode(result) for result in results]
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = None
+                continue
+            end = time.perf_counter()
+            self._counts['batches'] += 1
+            self._counts['frames'] += len(batch)
+            for (arrival, _, future), buf in zip(batch, bufs):
+                self._queue_times.append(start - arrival)
+                self._latencies.append(end - arrival)
+                if not future.done():
+                    future.set_result(buf)
+            self._batch = None
+
+    def _encode(self, result):
+        dets = result[0]
+        return encode_detections(dets[dets[:, 4] >= self.det_thresh],
+                                 self.feat_dtype)
+
+    def metrics(self):
+        """Serving metrics.
+
+        Returns:
+            dict: Numbers of ``requests``, ``rejected`` requests, ``batches``
+                and ``frames`` served, the mean ``batch_size``, the current
+                and largest ``queue_depth``, and percentiles of the time in
+                seconds spent queued (``queue_time_p50``,
+                ``queue_time_p99``) and until the answer (``latency_p50``,
+                ``latency_p99``) over the recent requests.
+        """
+        metrics = dict(self._counts)
+        metrics['batch_size'] = self._counts['frames'] / max(
+            self._counts['batches'], 1)
+        metrics['queue_depth'] = self._queue.qsize() if self._queue else 0
+        metrics['max_queue_depth'] = self._max_queue_depth
+        for name, values in (('queue_time', self._queue_times),
+                             ('latency', self._latencies)):
+            for q in (50, 99):
+                metrics[f'{name}_p{q}'] = float(
+                    np.percentile(values, q)) if values else 0.
+        return metrics
+
+    async def handle_connection(self, reader, writer):
+        """Serve the frames of a stream connection.
+
+        Every request is a 4-byte little-endian length followed by an
+        encoded image. Every response is a 4-byte length followed by a
+        status byte, 0 for the detections of :func:`encode_detections`, 1
+        when the server is overloaded and 2 for other errors followed by the
+        message. Responses are sent in the order of the requests.
+
+        Use it with ``asyncio.start_server(server.handle_connection, ...)``.
+        """
+        pending = asyncio.Queue()
+
+        async def respond():
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                try:
+                    payload = b'\x00' + await task
+                except ServerOverloadedError:
+                    payload = b'\x01'
+                except Exception as e:
+                    payload = b'\x02' + str(e).encode()
+                writer.write(_LENGTH.pack(len(payload)) + payload)
+                await writer.drain()
+
+        responder = asyncio.get_running_loop().create_task(respond())
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_LENGTH.size)
+                    data = await reader.readexactly(
+                        _LENGTH.unpack(header)[0])
+                except asyncio.IncompleteReadError:
+                    # the client disconnected, possibly mid-request
+                    break
+                pending.put_nowait(
+                    asyncio.get_running_loop().create_task(self.infer(data)))
+        finally:
+            pending.put_nowait(None)
+            await responder
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def request_detections(reader, writer, img_bytes):
+    """Send an encoded image over a connection of
+    :meth:`MicroBatchServer.handle_connection` and wait for the answer.
+
+    Returns:
+        tuple[ndarray]: Boxes and scores, and embeddings, see
+            :func:`decode_detections`.
+    """
+    writer.write(_LENGTH.pack(len(img_bytes)) + img_bytes)
+    await writer.drain()
+    length = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))[0]
+    payload = await reader.readexactly(length)
+    if payload[:1] == b'\x01':
+        raise ServerOverloadedError('the server is overloaded')
+    if payload[:1] != b'\x00':
+        raise RuntimeError(payload[1:].decode())
+    return decode_detections(payload[1:])
@@ -11,14 +11,31 @@ import torch.distributed as dist
 from mmcv.image import tensor2imgs
 from mmcv.runner import get_dist_info
 
-from mmdet.core import encode_mask_results
+from mmdet.core import (ReidResultWriter, encode_mask_results,
+                        merge_result_stores, unpack_reid_results)
 
 
 def single_gpu_test(model,
                     data_loader,
                     show=False,
                     out_dir=None,
-                    show_score_thr=0.3):
+                    show_score_thr=0.3,
+                    result_writer=None):
+    """Test model with a single gpu.
+
+    Args:
+        model (nn.Module): Model to be tested.
+        data_loader (nn.Dataloader): Pytorch data loader.
+        show (bool): Whether to show the results. Default: False.
+        out_dir (str, optional): Directory to save the visualized results.
+        show_score_thr (float): Score threshold of the visualization.
+        result_writer (:obj:`ReidResultWriter`, optional): If given, the
+            ReID results are streamed to it instead of being kept in memory.
+
+    Returns:
+        list | :obj:`ReidResultStore`: The prediction results, or the closed
+            result store when ``result_writer`` is given.
+    """
     model.eval()
     results = []
     dataset = data_loader.dataset
@@ -28,7 +45,7 @@ def single_gpu_test(model,
         with torch.no_grad():
             result = model(return_loss=False, rescale=True, **data)
 
-        batch_size = len(result)
+        batch_size = len(unpack_reid_results(result))
         if show or out_dir:
             if batch_size == 1 and isinstance(data['img'][0], torch.Tensor):
                 img_tensor = data['img'][0]
@@ -71,14 +88,24 @@ def single_gpu_test(model,
                 result[j]['ins_results'] = (bbox_results,
                                             encode_mask_results(mask_results))
 
-        results.extend(result)
+        if result_writer is not None:
+            for res in unpack_reid_results(result):
+                result_writer.append(res)
+        else:
+            results.extend(result)
 
         for _ in range(batch_size):
             prog_bar.update()
+    if result_writer is not None:
+        return result_writer.close()
     return results
 
 
-def multi_gpu_test(model, data_loader, tmpdir=None, gpu_collect=False):
+def multi_gpu_test(model,
+                   data_loader,
+                   tmpdir=None,
+                   gpu_collect=False,
+                   result_store_dir=None):
     """Test model with multiple gpus.
 
     This method tests model with multiple gpus and collects the results
@@ -93,14 +120,22 @@ def multi_gpu_test(model, data_loader, tmpdir=None, gpu_collect=False):
         tmpdir (str): Path of directory to save the temporary results from
             different gpus under cpu mode.
         gpu_collect (bool): Option to use either gpu or cpu to collect results.
+        result_store_dir (str, optional): If given, every rank streams its
+            ReID results to a result store under this directory, and rank 0
+            merges them into a store at ``result_store_dir`` at the end.
 
     Returns:
-        list: The prediction results.
+        list | :obj:`ReidResultStore`: The prediction results, or the merged
+            result store when ``result_store_dir`` is given.
     """
     model.eval()
     results = []
     dataset = data_loader.dataset
     rank, world_size = get_dist_info()
+    result_writer = None
+    if result_store_dir is not None:
+        result_writer = ReidResultWriter(
+            osp.join(result_store_dir, f'part_{rank}'))
     if rank == 0:
         prog_bar = mmcv.ProgressBar(len(dataset))
     time.sleep(2)  # This line can prevent deadlock problem in some cases.
@@ -118,14 +153,27 @@ def multi_gpu_test(model, data_loader, tmpdir=None, gpu_collect=False):
                     result[j]['ins_results'] = (
                         bbox_results, encode_mask_results(mask_results))
 
-        results.extend(result)
+        if result_writer is not None:
+            for res in unpack_reid_results(result):
+                result_writer.append(res)
+        else:
+            results.extend(result)
 
         if rank == 0:
-            batch_size = len(result)
+            batch_size = len(unpack_reid_results(result))
             for _ in range(batch_size * world_size):
                 prog_bar.update()
 
     # collect results from all ranks
+    if result_writer is not None:
+        result_writer.close()
+        dist.barrier()
+        if rank != 0:
+            return None
+        part_dirs = [
+            osp.join(result_store_dir, f'part_{i}') for i in range(world_size)
+        ]
+        return merge_result_stores(part_dirs, result_store_dir, len(dataset))
     if gpu_collect:
         results = collect_results_gpu(results, len(dataset))
     else:
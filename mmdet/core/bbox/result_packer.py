@@ -0,0 +1,96 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import torch
+
+from .transforms import bbox2result_reid
+
+
+class ReidResultPacker:
+    """Convert the ReID detections of a batch to per-class numpy arrays.
+
+    The boxes, ReID features and labels of all images are packed into a
+    single tensor on the device, which is copied to the host with one
+    ``non_blocking`` copy into a pinned buffer reused across batches. The
+    results are the same as applying :func:`bbox2result_reid` to every
+    image, which needs three synchronizing copies per image.
+
+    Args:
+        num_classes (int): Number of classes.
+        feat_dim (int, optional): Width of the ReID features, only used
+            when it can not be inferred from the detections. Default: None.
+    """
+
+    def __init__(self, num_classes, feat_dim=None):
+        self.num_classes = num_classes
+        self.feat_dim = feat_dim
+        self._buffer = None
+
+    def _host_buffer(self, num_rows, num_cols):
+        numel = num_rows * num_cols
+        if self._buffer is None or self._buffer.numel() < numel:
+            # grow geometrically to avoid reallocating for every batch
+            capacity = max(numel, int(1.5 * self._buffer.numel())
+                           if self._buffer is not None else 0)
+            self._buffer = torch.empty(
+                capacity, dtype=torch.float32, pin_memory=True)
+        return self._buffer[:numel].view(num_rows, num_cols)
+
+    def __call__(self, bbox_list):
+        """Pack the detections of a batch.
+
+        Args:
+            bbox_list (list[tuple[Tensor]]): Boxes (n, 5), labels (n, ) and
+                ReID features (n, D) of each image, as returned by the
+                ``get_bboxes`` of ReID heads.
+
+        Returns:
+            list[list[np.ndarray]]: Results of each image and class, each of
+                shape (n, 5 + D).
+        """
+        if not all(
+                isinstance(bboxes, torch.Tensor)
+                for bboxes, _, _ in bbox_list):
+            return [
+                bbox2result_reid(bboxes, labels, reid_feats, self.num_classes,
+                                 self.feat_dim)
+                for bboxes, labels, reid_feats in bbox_list
+            ]
+        feat_dim = self.feat_dim
+        for _, _, reid_feats in bbox_list:
+            if reid_feats.dim() == 2:
+                feat_dim = reid_feats.size(1)
+                break
+        num_dets = [bboxes.size(0) for bboxes, _, _ in bbox_list]
+        if sum(num_dets) == 0:
+            assert feat_dim is not None, \
+                'feat_dim is required when it can not be inferred'
+            return [[
+                np.zeros((0, 5 + feat_dim), dtype=np.float32)
+                for _ in range(self.num_classes)
+            ] for _ in bbox_list]
+
+        packed = torch.cat([
+            torch.cat([
+                bboxes.float(),
+                reid_feats.float(),
+                labels[:, None].float()
+            ], dim=1) for bboxes, labels, reid_feats in bbox_list
+            if bboxes.size(0) > 0
+        ])
+        if packed.is_cuda:
+            host = self._host_buffer(*packed.shape)
+            host.copy_(packed, non_blocking=True)
+            torch.cuda.current_stream(packed.device).synchronize()
+        else:
+            host = packed
+        host = host.numpy()
+
+        results = []
+        for start, num in zip(np.cumsum([0] + num_dets[:-1]), num_dets):
+            dets = host[start:start + num]
+            labels = dets[:, -1]
+            # boolean indexing copies the rows out of the reused buffer
+            results.append([
+                dets[labels == i, :-1] for i in range(self.num_classes)
+            ])
+        return results
@@ -132,19 +132,26 @@ def bbox2result(bboxes, labels, num_classes):
             labels = labels.detach().cpu().numpy()
         return [bboxes[labels == i, :] for i in range(num_classes)]
 
-def bbox2result_reid(bboxes, labels, reid_feats, num_classes):
+def bbox2result_reid(bboxes, labels, reid_feats, num_classes, feat_dim=None):
     """Convert detection results to a list of numpy arrays.
 
     Args:
         bboxes (torch.Tensor | np.ndarray): shape (n, 5)
         labels (torch.Tensor | np.ndarray): shape (n, )
+        reid_feats (torch.Tensor | np.ndarray): shape (n, D)
         num_classes (int): class number, including background class
+        feat_dim (int, optional): D, only used when there is no detection
+            and it can not be inferred from ``reid_feats``. Default: None.
 
     Returns:
         list(ndarray): bbox results of each class
     """
     if bboxes.shape[0] == 0:
-        return [np.zeros((0, 5+256), dtype=np.float32) for i in range(num_classes)]
+        if reid_feats.ndim == 2:
+            feat_dim = reid_feats.shape[1]
+        assert feat_dim is not None, \
+            'feat_dim is required when it can not be inferred'
+        return [np.zeros((0, 5 + feat_dim), dtype=np.float32) for i in range(num_classes)]
     else:
         if isinstance(bboxes, torch.Tensor):
             bboxes = bboxes.cpu().numpy()
@@ -6,8 +6,12 @@ from .class_names import (cityscapes_classes, coco_classes, dataset_aliases,
 from .eval_hooks import DistEvalHook, EvalHook
 from .mean_ap import average_precision, eval_map, print_map_summary
 from .panoptic_utils import INSTANCE_OFFSET
+from .person_search import GalleryIndex, eval_search, print_search_summary
 from .recall import (eval_recalls, plot_iou_recall, plot_num_recall,
                      print_recall_summary)
+from .reid_result_store import (ReidResultStore, ReidResultWriter,
+                                load_results, merge_result_stores,
+                                unpack_reid_results)
 
 __all__ = [
     'voc_classes', 'imagenet_det_classes', 'imagenet_vid_classes',
@@ -15,5 +19,7 @@ __all__ = [
     'DistEvalHook', 'EvalHook', 'average_precision', 'eval_map',
     'print_map_summary', 'eval_recalls', 'print_recall_summary',
     'plot_num_recall', 'plot_iou_recall', 'oid_v6_classes',
-    'oid_challenge_classes', 'INSTANCE_OFFSET'
+    'oid_challenge_classes', 'INSTANCE_OFFSET', 'GalleryIndex', 'eval_search',
+    'print_search_summary', 'ReidResultStore', 'ReidResultWriter',
+    'load_results', 'merge_result_stores', 'unpack_reid_results'
 ]
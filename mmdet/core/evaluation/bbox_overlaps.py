@@ -1,6 +1,10 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import numpy as np
 
+# Number of box pairs computed at once, bounds the size of the temporary
+# arrays of large inputs.
+_BLOCK_SIZE = 2**16
+
 
 def bbox_overlaps(bboxes1,
                   bboxes2,
@@ -38,28 +42,28 @@ def bbox_overlaps(bboxes1,
     ious = np.zeros((rows, cols), dtype=np.float32)
     if rows * cols == 0:
         return ious
-    exchange = False
-    if bboxes1.shape[0] > bboxes2.shape[0]:
-        bboxes1, bboxes2 = bboxes2, bboxes1
-        ious = np.zeros((cols, rows), dtype=np.float32)
-        exchange = True
     area1 = (bboxes1[:, 2] - bboxes1[:, 0] + extra_length) * (
         bboxes1[:, 3] - bboxes1[:, 1] + extra_length)
     area2 = (bboxes2[:, 2] - bboxes2[:, 0] + extra_length) * (
         bboxes2[:, 3] - bboxes2[:, 1] + extra_length)
-    for i in range(bboxes1.shape[0]):
-        x_start = np.maximum(bboxes1[i, 0], bboxes2[:, 0])
-        y_start = np.maximum(bboxes1[i, 1], bboxes2[:, 1])
-        x_end = np.minimum(bboxes1[i, 2], bboxes2[:, 2])
-        y_end = np.minimum(bboxes1[i, 3], bboxes2[:, 3])
-        overlap = np.maximum(x_end - x_start + extra_length, 0) * np.maximum(
-            y_end - y_start + extra_length, 0)
+    # broadcast over blocks of rows, small enough for the temporary arrays
+    # to stay in cache
+    block = max(_BLOCK_SIZE // cols, 1)
+    for start in range(0, rows, block):
+        b1 = bboxes1[start:start + block, None]
+        w = np.minimum(b1[..., 2], bboxes2[:, 2])
+        w -= np.maximum(b1[..., 0], bboxes2[:, 0])
+        w += extra_length
+        h = np.minimum(b1[..., 3], bboxes2[:, 3])
+        h -= np.maximum(b1[..., 1], bboxes2[:, 1])
+        h += extra_length
+        overlap = np.maximum(w, 0, out=w)
+        overlap *= np.maximum(h, 0, out=h)
         if mode == 'iou':
-            union = area1[i] + area2 - overlap
+            union = area1[start:start + block, None] + area2
+            union -= overlap
         else:
-            union = area1[i] if not exchange else area2
-        union = np.maximum(union, eps)
-        ious[i, :] = overlap / union
-    if exchange:
-        ious = ious.T
+            union = area1[start:start + block, None]
+        np.divide(
+            overlap, np.maximum(union, eps), out=ious[start:start + block])
     return ious
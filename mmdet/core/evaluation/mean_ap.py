@@ -1,4 +1,6 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import os
+from itertools import starmap
 from multiprocessing import Pool
 
 import mmcv
@@ -9,6 +11,26 @@ from terminaltables import AsciiTable
 from .bbox_overlaps import bbox_overlaps
 from .class_names import get_classes
 
+_pool = None
+_pool_key = None
+
+
+def _get_pool(nproc):
+    """Get a pool of ``nproc`` processes, kept alive across calls.
+
+    Evaluating every epoch used to fork a new pool each time. The pool is
+    recreated when ``nproc`` changes or in a forked child process, which can
+    not use the workers of its parent.
+    """
+    global _pool, _pool_key
+    key = (nproc, os.getpid())
+    if _pool is None or _pool_key != key:
+        if _pool is not None and _pool_key[1] == key[1]:
+            _pool.close()
+        _pool = Pool(nproc)
+        _pool_key = key
+    return _pool
+
 
 def average_precision(recalls, precisions, mode='area'):
     """Calculate average precision (for single or multiple scales).
@@ -482,7 +504,9 @@ def get_cls_results(det_results, annotations, class_id):
     Returns:
         tuple[list[np.ndarray]]: detected bboxes, gt bboxes, ignored gt bboxes
     """
-    cls_dets = [img_res[class_id] for img_res in det_results]
+    # only the boxes and scores are used, drop the extra columns of e.g. the
+    # ReID embeddings so that they are not sent to the workers
+    cls_dets = [img_res[class_id][:, :5] for img_res in det_results]
     cls_gts = []
     cls_gts_ignore = []
     for ann in annotations:
@@ -561,7 +585,8 @@ def eval_map(det_results,
             unless dataset is 'det' or 'vid' (:func:`tpfp_imagenet` in this
             case). If it is given as a function, then this function is used
             to evaluate tp & fp. Default None.
-        nproc (int): Processes used for computing TP and FP.
+        nproc (int): Processes used for computing TP and FP, the pool is
+            kept for later calls. 1 computes them in the calling process.
             Default: 4.
         use_legacy_coordinate (bool): Whether to use coordinate system in
             mmdet v1.x. which means width, height should be
@@ -585,7 +610,18 @@ def eval_map(det_results,
     area_ranges = ([(rg[0]**2, rg[1]**2) for rg in scale_ranges]
                    if scale_ranges is not None else None)
 
-    pool = Pool(nproc)
+    if nproc > 1:
+        pool = _get_pool(nproc)
+        # send the images in chunks instead of one by one
+        chunksize = max(num_imgs // (nproc * 4), 1)
+
+        def map_fn(fn, iterable):
+            return pool.starmap(fn, iterable, chunksize=chunksize)
+    else:
+
+        def map_fn(fn, iterable):
+            return list(starmap(fn, iterable))
+
     eval_results = []
     for i in range(num_classes):
         # get gt and det bboxes of this class
@@ -612,7 +648,7 @@ def eval_map(det_results,
         if ioa_thr is not None:
             args.append([ioa_thr for _ in range(num_imgs)])
         # compute tp and fp for each image with multiple processes
-        tpfp = pool.starmap(
+        tpfp = map_fn(
             tpfp_fn,
             zip(cls_dets, cls_gts, cls_gts_ignore,
                 [iou_thr for _ in range(num_imgs)],
@@ -660,7 +696,6 @@ def eval_map(det_results,
             'precision': precisions,
             'ap': ap
         })
-    pool.close()
     if scale_ranges is not None:
         # shape (num_classes, num_scales)
         all_ap = np.vstack([cls_result['ap'] for cls_result in eval_results])
@@ -0,0 +1,250 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+from mmcv.utils import print_log
+from terminaltables import AsciiTable
+
+from .reid_result_store import ReidResultStore, unpack_reid_results
+
+
+def _normalize(feats):
+    norms = np.linalg.norm(feats, axis=1, keepdims=True)
+    return feats / np.maximum(norms, 1e-12)
+
+
+def _deinterleave_results(results):
+    """Per-image results of the interleaved batch outputs of two-stage
+    detectors, other results are returned as is."""
+    first = results[0] if len(results) else None
+    # the detection results of a batch are a list of per-image lists
+    if not (isinstance(first, list) and first and isinstance(first[0], list)):
+        return results
+    assert len(results) % 2 == 0, 'incomplete two-stage results'
+    return [
+        result for i in range(0, len(results), 2)
+        for result in unpack_reid_results((results[i], results[i + 1]))
+    ]
+
+
+class GalleryIndex:
+    """Packed gallery detections for person search.
+
+    All detections of the gallery are stored in contiguous float32 arrays,
+    and ``offsets[i]:offsets[i + 1]`` is the slice of image ``i``.
+
+    Args:
+        boxes (ndarray): Boxes of all detections, shape (M, 4).
+        scores (ndarray): Detection scores, shape (M, ).
+        feats (ndarray): ReID features, shape (M, D). They are L2-normalized
+            when the index is built.
+        offsets (ndarray): Start of every image in the packed arrays, with
+            the total number of detections appended, shape (num_imgs + 1, ).
+    """
+
+    def __init__(self, boxes, scores, feats, offsets):
+        assert len(boxes) == len(scores) == len(feats) == offsets[-1]
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float32)
+        self.scores = np.ascontiguousarray(scores, dtype=np.float32)
+        self.feats = np.ascontiguousarray(
+            _normalize(np.asarray(feats, dtype=np.float32)))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_results(cls, results, det_thresh=0.5, num_images=None):
+        """Build the index from the per-image outputs of a ReID detector.
+
+        The test results of two-stage detectors such as
+        ``SingleTwoStageDetector176PRW`` interleave the detection and the RoI
+        results of every batch, ``[n_0, b_0, n_1, b_1, ...]``. The per-image
+        RoI results are taken from them, see :func:`unpack_reid_results`.
+
+        Args:
+            results (list[list[ndarray] | ndarray] | ReidResultStore):
+                Per-image results as returned by ``bbox2result_reid``, i.e.
+                arrays of shape (n, 5 + D) holding boxes, scores and ReID
+                features, or a result store holding them. Only the first
+                class is used.
+            det_thresh (float): Detections with lower scores are dropped.
+                Default: 0.5.
+            num_images (int, optional): Number of gallery images, checked
+                against the number of results. Default: None.
+
+        Returns:
+            :obj:`GalleryIndex`: The packed gallery.
+        """
+        if not isinstance(results, ReidResultStore):
+            results = _deinterleave_results(results)
+        if num_images is not None and len(results) != num_images:
+            raise ValueError(f'{len(results)} results are given for '
+                             f'{num_images} gallery images')
+        if len(results) == 0:
+            return cls(
+                np.zeros((0, 4)), np.zeros(0), np.zeros((0, 0)), np.zeros(1))
+        if isinstance(results, ReidResultStore):
+            keep = (results.scores >= det_thresh) & (results.labels == 0)
+            kept = np.concatenate([[0], np.cumsum(keep)])
+            return cls(results.boxes[keep], results.scores[keep],
+                       results.feats[keep], kept[results.offsets])
+        dets = [
+            det[0] if isinstance(det, (list, tuple)) else det
+            for det in results
+        ]
+        dets = [det[det[:, 4] >= det_thresh] for det in dets]
+        sizes = np.array([len(det) for det in dets], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        dets = np.concatenate(dets, axis=0)
+        return cls(dets[:, :4], dets[:, 4], dets[:, 5:], offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def num_boxes(self):
+        return int(self.offsets[-1])
+
+    def image_slice(self, idx):
+        """Return boxes, scores and features of the ``idx``-th image."""
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return (self.boxes[start:end], self.scores[start:end],
+                self.feats[start:end])
+
+
+def _box_iou(boxes, gts):
+    """IoU between each box and the gt box of the same row."""
+    lt = np.maximum(boxes[:, :2], gts[:, :2])
+    rb = np.minimum(boxes[:, 2:], gts[:, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    overlap = wh[:, 0] * wh[:, 1]
+    area1 = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    area2 = (gts[:, 2] - gts[:, 0]) * (gts[:, 3] - gts[:, 1])
+    return overlap / np.maximum(area1 + area2 - overlap, 1e-12)
+
+
+def _ranking_ap(y_true, y_score):
+    """Average precision of a ranking, with ties handled as in
+    ``sklearn.metrics.average_precision_score``."""
+    order = np.argsort(-y_score, kind='mergesort')
+    y_true = y_true[order]
+    y_score = y_score[order]
+    threshold_idxs = np.r_[np.where(np.diff(y_score))[0], y_true.size - 1]
+    tps = np.cumsum(y_true)[threshold_idxs]
+    precision = tps / (threshold_idxs + 1)
+    recall = tps / tps[-1]
+    return float(np.sum(np.diff(np.r_[0, recall]) * precision))
+
+
+def _probe_boxes(gallery, img_inds):
+    """Packed indices of all boxes in ``img_inds`` and the position of their
+    image in ``img_inds``."""
+    starts = gallery.offsets[img_inds]
+    sizes = gallery.offsets[img_inds + 1] - starts
+    seg = np.repeat(np.arange(len(img_inds)), sizes)
+    box_inds = np.arange(sizes.sum()) - np.repeat(
+        np.cumsum(sizes) - sizes, sizes) + starts[seg]
+    return box_inds, seg
+
+
+def eval_search(gallery,
+                query_feats,
+                protocol,
+                topk=(1, 5, 10),
+                block_size=128):
+    """Evaluate person search with the CUHK-SYSU protocol.
+
+    Similarities between all probes and all gallery boxes are computed with
+    blocked matrix multiplications, then every probe is scored on the
+    gallery images given by the protocol. In each gallery image the most
+    similar box overlapping the ground truth by at least
+    ``min(0.5, w * h / ((w + 10) * (h + 10)))`` is the true positive, and
+    the AP of every probe is scaled by its detection recall.
+
+    Args:
+        gallery (:obj:`GalleryIndex`): Packed gallery detections.
+        query_feats (ndarray): Features of the probes, shape (P, D).
+        protocol (list[dict]): Per-probe gallery definition with keys
+            ``gallery_inds`` (indices of the gallery images in ``gallery``,
+            -1 for images that are not in it) and ``gt_bboxes`` (the probe's
+            box in each gallery image as ``(x1, y1, x2, y2)``, all zeros if
+            the person does not appear in the image).
+        topk (tuple[int]): Ranks for the top-k accuracy.
+            Default: (1, 5, 10).
+        block_size (int): Number of probes scored per matrix
+            multiplication. Default: 128.
+
+    Returns:
+        dict: ``mAP`` and ``top{k}`` accuracies.
+    """
+    assert len(query_feats) == len(protocol)
+    query_feats = _normalize(np.asarray(query_feats, dtype=np.float32))
+    aps = []
+    accs = []
+    for b_start in range(0, len(protocol), block_size):
+        b_end = min(b_start + block_size, len(protocol))
+        sims = query_feats[b_start:b_end].dot(gallery.feats.T)
+        for i in range(b_start, b_end):
+            ap, acc = _eval_probe(gallery, sims[i - b_start], protocol[i],
+                                  topk)
+            aps.append(ap)
+            accs.append(acc)
+    accs = np.mean(accs, axis=0) if accs else np.zeros(len(topk))
+    eval_results = dict(mAP=float(np.mean(aps)) if aps else 0.)
+    for k, acc in zip(topk, accs):
+        eval_results[f'top{k}'] = float(acc)
+    return eval_results
+
+
+def _eval_probe(gallery, sims, probe, topk):
+    gt_bboxes = probe['gt_bboxes']
+    has_gt = gt_bboxes.any(axis=1)
+    count_gt = int(has_gt.sum())
+
+    # gallery images without any detection do not contribute
+    img_inds = probe['gallery_inds']
+    valid = img_inds >= 0
+    img_inds, gt_bboxes, has_gt = \
+        img_inds[valid], gt_bboxes[valid], has_gt[valid]
+    img_inds, first = np.unique(img_inds, return_index=True)
+    gt_bboxes, has_gt = gt_bboxes[first], has_gt[first]
+    box_inds, seg = _probe_boxes(gallery, img_inds)
+
+    y_score = sims[box_inds]
+    y_true = np.zeros(len(box_inds), dtype=np.int64)
+    if len(box_inds) > 0:
+        gts = gt_bboxes[seg]
+        w = gts[:, 2] - gts[:, 0]
+        h = gts[:, 3] - gts[:, 1]
+        iou_thrs = np.minimum(0.5, w * h / ((w + 10) * (h + 10)))
+        matched = has_gt[seg] & (
+            _box_iou(gallery.boxes[box_inds], gts) >= iou_thrs)
+        # only the most similar matched box of an image is a true positive
+        cand = np.where(matched)[0]
+        cand = cand[np.lexsort((-y_score[cand], seg[cand]))]
+        _, first = np.unique(seg[cand], return_index=True)
+        y_true[cand[first]] = 1
+    count_tp = int(y_true.sum())
+    assert count_tp <= count_gt
+
+    if count_tp == 0:
+        ap = 0.
+    else:
+        ap = _ranking_ap(y_true, y_score) * count_tp / count_gt
+    ranked = y_true[np.argsort(-y_score, kind='mergesort')]
+    acc = [min(1, ranked[:k].sum()) for k in topk]
+    return ap, acc
+
+
+def print_search_summary(eval_results, logger=None):
+    """Print person search results of several gallery sizes as a table.
+
+    Args:
+        eval_results (dict[int, dict]): Results of :func:`eval_search` keyed
+            by gallery size.
+        logger (logging.Logger | str | None): The way to print the summary.
+            See `mmcv.utils.print_log()` for details. Default: None.
+    """
+    metric_names = list(next(iter(eval_results.values())))
+    table_data = [['gallery size'] + metric_names]
+    for gallery_size, results in eval_results.items():
+        table_data.append([str(gallery_size)] +
+                          [f'{results[name]:.4f}' for name in metric_names])
+    table = AsciiTable(table_data)
+    print_log('\n' + table.table, logger=logger)
@@ -0,0 +1,227 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import json
+import os.path as osp
+import shutil
+
+import mmcv
+import numpy as np
+
+_COLUMNS = dict(
+    boxes=np.float32, scores=np.float32, feats=np.float32, labels=np.int64)
+
+
+def unpack_reid_results(result):
+    """Split the output of a ReID detector for a batch into per-image results.
+
+    Two-stage ReID detectors such as ``SingleTwoStageDetector176PRW`` return
+    a single ``(results_n, results_b)`` tuple for the whole batch: the
+    per-class results of the detection branch and, for every image, an
+    array of the same boxes with the RoI embeddings. The RoI results are the
+    ones searched by their protocol, so they are kept, as single-class
+    results. The outputs of other detectors are already per image.
+
+    Args:
+        result (list | tuple[list]): Output of the detector for a batch.
+
+    Returns:
+        list: The result of every image of the batch.
+    """
+    if isinstance(result, tuple):
+        return [[det] for det in result[1]]
+    return result
+
+
+class ReidResultWriter:
+    """Stream the results of a ReID detector to a columnar result store.
+
+    Boxes, scores, ReID features and labels of every image are appended to
+    raw binary column files as inference proceeds, so the results never need
+    to be held in memory. :meth:`close` writes the per-image offsets and the
+    metadata, after which the directory can be opened with
+    :class:`ReidResultStore`.
+
+    Args:
+        out_dir (str): Directory of the store. It is created if missing and
+            existing column files in it are overwritten.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        mmcv.mkdir_or_exist(out_dir)
+        self._files = {
+            name: open(osp.join(out_dir, f'{name}.bin'), 'wb')
+            for name in _COLUMNS
+        }
+        self._offsets = [0]
+        self.feat_dim = None
+        self.num_classes = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def append(self, result):
+        """Append the result of one image.
+
+        Args:
+            result (list[ndarray]): Per-class arrays of shape (n, 5 + D) as
+                returned by ``bbox2result_reid``.
+        """
+        labels = np.concatenate([
+            np.full(len(det), i, dtype=np.int64)
+            for i, det in enumerate(result)
+        ])
+        dets = np.concatenate(result, axis=0)
+        self.append_arrays(dets[:, :4], dets[:, 4], dets[:, 5:], labels,
+                           len(result))
+
+    def append_arrays(self, boxes, scores, feats, labels, num_classes=1):
+        """Append the columns of one image."""
+        if self.feat_dim is None:
+            self.feat_dim = feats.shape[1]
+            self.num_classes = num_classes
+        assert feats.shape[1] == self.feat_dim
+        columns = dict(boxes=boxes, scores=scores, feats=feats, labels=labels)
+        for name, dtype in _COLUMNS.items():
+            self._files[name].write(
+                np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self._offsets.append(self._offsets[-1] + len(boxes))
+
+    def close(self):
+        """Finish the store and return it opened for reading."""
+        for f in self._files.values():
+            f.close()
+        np.save(
+            osp.join(self.out_dir, 'offsets.npy'),
+            np.array(self._offsets, dtype=np.int64))
+        meta = dict(
+            num_images=len(self),
+            num_boxes=self._offsets[-1],
+            feat_dim=self.feat_dim or 0,
+            num_classes=self.num_classes or 1)
+        with open(osp.join(self.out_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return ReidResultStore(self.out_dir)
+
+
+class ReidResultStore:
+    """Lazily memory-mapped results written by :class:`ReidResultWriter`.
+
+    The store behaves like the list of per-image results returned by
+    ``single_gpu_test``, while :meth:`image_slice` and the column properties
+    give zero-copy views into the memory-mapped files.
+
+    Args:
+        data_dir (str): Directory of the store.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        with open(osp.join(data_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(osp.join(data_dir, 'offsets.npy'))
+        self._columns = {}
+
+    @staticmethod
+    def is_store(path):
+        return osp.isdir(path) and osp.exists(osp.join(path, 'meta.json'))
+
+    def _column(self, name):
+        if name not in self._columns:
+            num_boxes = self.meta['num_boxes']
+            if name == 'boxes':
+                shape = (num_boxes, 4)
+            elif name == 'feats':
+                shape = (num_boxes, self.meta['feat_dim'])
+            else:
+                shape = (num_boxes, )
+            if num_boxes == 0:
+                # empty files can not be memory-mapped
+                self._columns[name] = np.zeros(shape, dtype=_COLUMNS[name])
+            else:
+                self._columns[name] = np.memmap(
+                    osp.join(self.data_dir, f'{name}.bin'),
+                    dtype=_COLUMNS[name],
+                    mode='r',
+                    shape=shape)
+        return self._columns[name]
+
+    @property
+    def boxes(self):
+        return self._column('boxes')
+
+    @property
+    def scores(self):
+        return self._column('scores')
+
+    @property
+    def feats(self):
+        return self._column('feats')
+
+    @property
+    def labels(self):
+        return self._column('labels')
+
+    def __len__(self):
+        return self.meta['num_images']
+
+    def image_slice(self, idx):
+        """Return zero-copy views of boxes, scores, features and labels of
+        the ``idx``-th image."""
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return (self.boxes[start:end], self.scores[start:end],
+                self.feats[start:end], self.labels[start:end])
+
+    def __getitem__(self, idx):
+        """Result of the ``idx``-th image in the ``bbox2result_reid`` format.
+        """
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'image index {idx} out of range')
+        boxes, scores, feats, labels = self.image_slice(idx)
+        dets = np.concatenate([boxes, scores[:, None], feats], axis=1)
+        return [
+            dets[labels == i] for i in range(self.meta['num_classes'])
+        ]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def merge_result_stores(part_dirs, out_dir, size):
+    """Merge the stores written by each rank in distributed testing.
+
+    The distributed sampler deals samples to the ranks in turn, so the
+    ``i``-th image comes from part ``i % len(part_dirs)``. Padded samples
+    beyond ``size`` are dropped and the part directories are removed.
+
+    Args:
+        part_dirs (list[str]): Store of every rank, in rank order.
+        out_dir (str): Directory of the merged store.
+        size (int): Number of images of the dataset.
+
+    Returns:
+        :obj:`ReidResultStore`: The merged store.
+    """
+    parts = [ReidResultStore(part_dir) for part_dir in part_dirs]
+    writer = ReidResultWriter(out_dir)
+    for idx in range(size):
+        part = parts[idx % len(parts)]
+        boxes, scores, feats, labels = part.image_slice(idx // len(parts))
+        writer.append_arrays(boxes, scores, feats, labels,
+                             part.meta['num_classes'])
+    store = writer.close()
+    for part_dir in part_dirs:
+        if osp.abspath(part_dir) != osp.abspath(out_dir):
+            shutil.rmtree(part_dir)
+    return store
+
+
+def load_results(path):
+    """Load test results saved either as a pickle file or a result store."""
+    if ReidResultStore.is_store(path):
+        return ReidResultStore(path)
+    if not osp.exists(path):
+        raise FileNotFoundError(f'{path} does not exist')
+    return mmcv.load(path)
@@ -3,6 +3,7 @@ from .checkloss_hook import CheckInvalidLossHook
 from .ema import ExpMomentumEMAHook, LinearMomentumEMAHook
 from .memory_profiler_hook import MemoryProfilerHook
 from .set_epoch_info_hook import SetEpochInfoHook
+from .step_profiler_hook import StepProfilerHook
 from .sync_norm_hook import SyncNormHook
 from .sync_random_size_hook import SyncRandomSizeHook
 from .yolox_lrupdater_hook import YOLOXLrUpdaterHook
@@ -11,5 +12,6 @@ from .yolox_mode_switch_hook import YOLOXModeSwitchHook
 __all__ = [
     'SyncRandomSizeHook', 'YOLOXModeSwitchHook', 'SyncNormHook',
     'ExpMomentumEMAHook', 'LinearMomentumEMAHook', 'YOLOXLrUpdaterHook',
-    'CheckInvalidLossHook', 'SetEpochInfoHook', 'MemoryProfilerHook'
+    'CheckInvalidLossHook', 'SetEpochInfoHook', 'MemoryProfilerHook',
+    'StepProfilerHook'
 ]
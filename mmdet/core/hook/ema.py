@@ -1,10 +1,23 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import math
+from collections import defaultdict
 
+import torch
 from mmcv.parallel import is_module_wrapper
 from mmcv.runner.hooks import HOOKS, Hook
 
 
+def _ema_update_(emas, values, momentum):
+    """``ema = (1 - momentum) * ema + momentum * value`` for lists of
+    tensors, with multi-tensor kernels when available."""
+    if hasattr(torch, '_foreach_mul_'):
+        torch._foreach_mul_(emas, 1 - momentum)
+        torch._foreach_add_(emas, values, alpha=momentum)
+    else:
+        for ema, value in zip(emas, values):
+            ema.mul_(1 - momentum).add_(value, alpha=momentum)
+
+
 class BaseEMAHook(Hook):
     """Exponential Moving Average Hook.
 
@@ -13,6 +26,12 @@ class BaseEMAHook(Hook):
     as below. EMAHook takes priority over EvalHook and CheckpointHook. Note,
     the original model parameters are actually saved in ema field after train.
 
+    The ema backups are registered as one buffer per parameter, named
+    ``ema_{name}``, but the floating point ones of a dtype and device are
+    views of a single contiguous tensor and are updated with fused
+    multi-tensor ops. Swapping exchanges the storages of the parameters and
+    of their backups instead of copying them.
+
     Args:
         momentum (float): The momentum used for updating ema parameter.
             Ema's parameter are updated with the formula:
@@ -54,12 +73,38 @@ class BaseEMAHook(Hook):
         if self.skip_buffers:
             self.model_parameters = dict(model.named_parameters())
         else:
-            self.model_parameters = model.state_dict()
+            # the tensors of the model themselves, so that swapping their
+            # storages swaps those of the model
+            self.model_parameters = model.state_dict(keep_vars=True)
+
+        # tied weights appear under several names but have a single backup
+        values = list({id(v): v for v in self.model_parameters.values()
+                       }.values())
+        groups = defaultdict(list)
+        for value in values:
+            if value.dtype.is_floating_point:
+                groups[(value.dtype, value.device)].append(value)
+        emas = {}
+        self._ema_groups = []
+        for group in groups.values():
+            flat = torch.cat([v.detach().reshape(-1) for v in group])
+            group_emas = list(
+                torch.split(flat, [v.numel() for v in group]))
+            for i, value in enumerate(group):
+                group_emas[i] = group_emas[i].view_as(value)
+                emas[id(value)] = group_emas[i]
+            self._ema_groups.append((group, group_emas))
+        for value in values:
+            if id(value) not in emas:
+                # exclude num_tracking from the update, but swap it
+                emas[id(value)] = value.detach().clone()
+        self._swap_pairs = [(value, emas[id(value)]) for value in values]
+
         for name, value in self.model_parameters.items():
             # "." is not allowed in module's buffer name
             buffer_name = f"ema_{name.replace('.', '_')}"
             self.param_ema_buffer[name] = buffer_name
-            model.register_buffer(buffer_name, value.data.clone())
+            model.register_buffer(buffer_name, emas[id(value)])
         self.model_buffers = dict(model.named_buffers())
         if self.checkpoint is not None:
             runner.resume(self.checkpoint)
@@ -73,13 +118,9 @@ class BaseEMAHook(Hook):
         if (runner.iter + 1) % self.interval != 0:
             return
         momentum = self.get_momentum(runner)
-        for name, parameter in self.model_parameters.items():
-            # exclude num_tracking
-            if parameter.dtype.is_floating_point:
-                buffer_name = self.param_ema_buffer[name]
-                buffer_parameter = self.model_buffers[buffer_name]
-                buffer_parameter.mul_(1 - momentum).add_(
-                    parameter.data, alpha=momentum)
+        with torch.no_grad():
+            for values, emas in self._ema_groups:
+                _ema_update_(emas, values, momentum)
 
     def after_train_epoch(self, runner):
         """We load parameter values from ema backup to model before the
@@ -93,11 +134,8 @@ class BaseEMAHook(Hook):
 
     def _swap_ema_parameters(self):
         """Swap the parameter of model with parameter in ema_buffer."""
-        for name, value in self.model_parameters.items():
-            temp = value.data.clone()
-            ema_buffer = self.model_buffers[self.param_ema_buffer[name]]
-            value.data.copy_(ema_buffer.data)
-            ema_buffer.data.copy_(temp)
+        for value, ema in self._swap_pairs:
+            value.data, ema.data = ema.data, value.data
 
 
 @HOOKS.register_module()
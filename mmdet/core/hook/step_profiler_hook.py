@@ -0,0 +1,423 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import functools
+import os.path as osp
+import re
+import sys
+import time
+import warnings
+from collections import Counter, defaultdict
+
+import mmcv
+import numpy as np
+import torch
+from mmcv.parallel import is_module_wrapper
+from mmcv.runner import master_only
+from mmcv.runner.hooks import HOOKS, Hook
+
+# methods of ``torch.Tensor`` copying a device tensor to the host
+_SYNC_METHODS = ('item', 'tolist', 'cpu', 'numpy', '__bool__', '__int__',
+                 '__float__')
+
+
+def _is_cpu_device(device):
+    if isinstance(device, torch.device):
+        return device.type == 'cpu'
+    return isinstance(device, str) and device.startswith('cpu')
+
+
+class _HostSyncCounter:
+    """Count the device to host synchronizations of a code block.
+
+    On CUDA, with ``torch.cuda.set_sync_debug_mode`` available, every
+    synchronizing op is counted, the implicit ones of e.g. ``nonzero`` or
+    boolean masking included. Otherwise the explicit copies of
+    :data:`_SYNC_METHODS` and ``Tensor.to('cpu')`` on tensors of
+    ``device_types`` are counted. The sites are kept as ``file:line``.
+
+    Args:
+        device_types (tuple[str]): Device types of the tensors whose copies
+            to the host are counted by the fallback.
+        use_debug_mode (bool): Whether to count with the CUDA sync debug
+            mode.
+    """
+
+    def __init__(self, device_types=('cuda', ), use_debug_mode=False):
+        self.device_types = device_types
+        self.use_debug_mode = use_debug_mode and hasattr(
+            torch.cuda, 'set_sync_debug_mode')
+        self.sites = Counter()
+        self._originals = {}
+        self._catcher = None
+        self._records = None
+
+    def _count(self):
+        frame = sys._getframe(2)
+        self.sites[f'{frame.f_code.co_filename}:{frame.f_lineno}'] += 1
+
+    def _wrap(self, fn):
+        counter = self
+
+        @functools.wraps(fn)
+        def counted(tensor, *args, **kwargs):
+            if tensor.device.type in counter.device_types:
+                counter._count()
+            return fn(tensor, *args, **kwargs)
+
+        return counted
+
+    def _wrap_to(self, fn):
+        counter = self
+
+        @functools.wraps(fn)
+        def counted(tensor, *args, **kwargs):
+            if tensor.device.type in counter.device_types and any(
+                    _is_cpu_device(arg)
+                    for arg in args + tuple(kwargs.values())):
+                counter._count()
+            return fn(tensor, *args, **kwargs)
+
+        return counted
+
+    def __enter__(self):
+        if self.use_debug_mode:
+            self._catcher = warnings.catch_warnings(record=True)
+            self._records = self._catcher.__enter__()
+            warnings.simplefilter('always')
+            torch.cuda.set_sync_debug_mode('warn')
+            return self
+        for name in _SYNC_METHODS:
+            fn = getattr(torch.Tensor, name)
+            self._originals[name] = fn
+            setattr(torch.Tensor, name, self._wrap(fn))
+        self._originals['to'] = torch.Tensor.to
+        torch.Tensor.to = self._wrap_to(torch.Tensor.to)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.use_debug_mode:
+            torch.cuda.set_sync_debug_mode(0)
+            self._catcher.__exit__(*exc_info)
+            for record in self._records:
+                if 'synchroniz' in str(record.message):
+                    self.sites[f'{record.filename}:{record.lineno}'] += 1
+                else:
+                    warnings.warn_explicit(record.message, record.category,
+                                           record.filename, record.lineno)
+            self._catcher = self._records = None
+            return
+        for name, fn in self._originals.items():
+            setattr(torch.Tensor, name, fn)
+        self._originals.clear()
+
+    def pause(self):
+        """Stop counting, for the synchronizations of the profiler itself."""
+        if self.use_debug_mode and self._catcher is not None:
+            torch.cuda.set_sync_debug_mode(0)
+
+    def resume(self):
+        if self.use_debug_mode and self._catcher is not None:
+            torch.cuda.set_sync_debug_mode('warn')
+
+
+@HOOKS.register_module()
+class StepProfilerHook(Hook):
+    """Break the training iterations into stages and time them.
+
+    The stages are:
+
+    - ``data_wait``: waiting for the data loader.
+    - ``forward``: ``train_step``, i.e. the whole forward with the losses.
+    - ``backbone``, ``neck`` and one per head of the detector, e.g.
+      ``roi_head``: ``forward`` of the backbone and the neck and
+      ``forward_train`` of the heads.
+    - one per loss module, e.g. ``roi_head.bbox_head.loss_oim``: the
+      submodules whose attribute name matches ``loss_modules``.
+    - ``backward``: from ``optimizer.zero_grad`` to ``optimizer.step``, the
+      gradient clipping included.
+    - ``optimizer``: ``optimizer.zero_grad`` and ``optimizer.step``.
+
+    The times of the nested stages are included in those of their parents.
+    The device to host synchronizations in the forward are counted along with
+    their sites, which makes e.g. an ``.item()`` added in the hot loop of a
+    ReID head visible. At the end of each epoch, a summary is logged and
+    dumped to ``{work_dir}/step_profile_epoch_{epoch}.json``.
+
+    Args:
+        synchronize (bool): Whether to synchronize CUDA around the stages, so
+            that their times include their kernels. Default: True.
+        count_syncs (bool): Whether to count the device to host
+            synchronizations of the forward. Default: True.
+        loss_modules (tuple[str]): Regular expressions searched in the
+            attribute names of the submodules timed as loss terms.
+            Default: ('loss', 'matching_layer').
+        profile_iters (int): Number of iterations of each epoch run under the
+            torch profiler, whose top ops are added to the summary. 0
+            disables it. Default: 0.
+        profile_start (int): Iteration of the epoch the torch profiler starts
+            at, which skips the warmup ones. Default: 5.
+        topk (int): Number of ops and synchronization sites in the summary.
+            Default: 20.
+    """
+
+    def __init__(self,
+                 synchronize=True,
+                 count_syncs=True,
+                 loss_modules=('loss', 'matching_layer'),
+                 profile_iters=0,
+                 profile_start=5,
+                 topk=20):
+        self.synchronize = synchronize
+        self.count_syncs = count_syncs
+        self.loss_modules = loss_modules
+        self.profile_iters = profile_iters
+        self.profile_start = profile_start
+        self.topk = topk
+        self._patched = []
+        self._cuda = False
+        self._profiler = None
+        self._sync_counter = None
+        self._iter_start = None
+
+    def _sync(self):
+        if self.synchronize and self._cuda:
+            if self._sync_counter is not None:
+                self._sync_counter.pause()
+                torch.cuda.synchronize()
+                self._sync_counter.resume()
+            else:
+                torch.cuda.synchronize()
+
+    def _patch(self, obj, attr, wrapper):
+        setattr(obj, attr, wrapper(getattr(obj, attr)))
+        self._patched.append((obj, attr))
+
+    def _timed(self, stage):
+
+        def wrapper(fn):
+
+            @functools.wraps(fn)
+            def timed(*args, **kwargs):
+                if self._iter_start is None:
+                    return fn(*args, **kwargs)
+                self._sync()
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self._sync()
+                    self._times[stage] += time.perf_counter() - start
+
+            return timed
+
+        return wrapper
+
+    def _timed_zero_grad(self, fn):
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if self._iter_start is None:
+                return fn(*args, **kwargs)
+            self._end_forward()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._sync()
+                self._backward_start = time.perf_counter()
+                self._times['optimizer'] += self._backward_start - start
+
+        return timed
+
+    def _timed_step(self, fn):
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if self._iter_start is None:
+                return fn(*args, **kwargs)
+            self._sync()
+            start = time.perf_counter()
+            if self._backward_start is not None:
+                self._times['backward'] += start - self._backward_start
+                self._backward_start = None
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._sync()
+                self._step_end = time.perf_counter()
+                self._times['optimizer'] += self._step_end - start
+
+        return timed
+
+    def before_run(self, runner):
+        model = runner.model
+        if is_module_wrapper(model):
+            model = model.module
+        self._cuda = next(model.parameters()).is_cuda
+
+        for name in ('backbone', 'neck'):
+            if isinstance(getattr(model, name, None), torch.nn.Module):
+                self._patch(getattr(model, name), 'forward', self._timed(name))
+        for name, child in model.named_children():
+            if name.endswith('head'):
+                attr = 'forward_train' if hasattr(
+                    child, 'forward_train') else 'forward'
+                self._patch(child, attr, self._timed(name))
+        if self.loss_modules:
+            matched = []
+            for name, module in model.named_modules():
+                if not name or any(
+                        name.startswith(f'{prefix}.') for prefix in matched):
+                    continue
+                short_name = name.rsplit('.', 1)[-1]
+                if any(re.search(p, short_name) for p in self.loss_modules):
+                    matched.append(name)
+                    self._patch(module, 'forward', self._timed(name))
+
+        if isinstance(runner.optimizer, torch.optim.Optimizer):
+            self._patch(runner.optimizer, 'zero_grad', self._timed_zero_grad)
+            self._patch(runner.optimizer, 'step', self._timed_step)
+        else:
+            runner.logger.warning(
+                'StepProfilerHook does not time the backward and the '
+                'optimizer of several optimizers')
+        self._iter_start = None
+
+    def after_run(self, runner):
+        # the patched methods are instance attributes shadowing those of the
+        # classes
+        for obj, attr in reversed(self._patched):
+            delattr(obj, attr)
+        self._patched = []
+
+    def before_train_epoch(self, runner):
+        self._records = defaultdict(list)
+        self._sync_sites = Counter()
+        self._profile_ops = None
+        self._iter_start = None
+        self._last_end = time.perf_counter()
+
+    def before_train_iter(self, runner):
+        self._finish_iter(runner)
+        self._sync()
+        self._iter_start = time.perf_counter()
+        self._times = defaultdict(float)
+        self._times['data_wait'] = self._iter_start - self._last_end
+        self._forward_end = self._backward_start = self._step_end = None
+        self._after_iter = None
+        if (self.profile_iters > 0 and self._profiler is None
+                and runner.inner_iter == self.profile_start):
+            self._start_profiler()
+        if self.count_syncs:
+            self._sync_counter = _HostSyncCounter(
+                use_debug_mode=self._cuda).__enter__()
+
+    def after_train_iter(self, runner):
+        self._end_forward()
+        self._after_iter = time.perf_counter()
+
+    def after_train_epoch(self, runner):
+        self._finish_iter(runner)
+        if self._profiler is not None:
+            self._stop_profiler()
+        self._dump_summary(runner)
+
+    def _end_forward(self):
+        """End the forward at the first of ``optimizer.zero_grad`` and
+        ``after_train_iter``."""
+        if self._forward_end is not None:
+            return
+        if self._sync_counter is not None:
+            self._sync_counter.__exit__(None, None, None)
+            self._sync_sites.update(self._sync_counter.sites)
+            self._times['host_syncs'] = sum(self._sync_counter.sites.values())
+            self._sync_counter = None
+        self._sync()
+        self._forward_end = time.perf_counter()
+        self._times['forward'] = self._forward_end - self._iter_start
+
+    def _finish_iter(self, runner):
+        if self._iter_start is None:
+            return
+        end = max(self._after_iter or time.perf_counter(), self._step_end or 0)
+        start = self._iter_start - self._times['data_wait']
+        self._times['total'] = end - start
+        for stage, value in self._times.items():
+            self._records[stage].append(value)
+        self._iter_start = None
+        self._last_end = end
+        if (self._profiler is not None and
+                runner.inner_iter >= self.profile_start + self.profile_iters):
+            self._stop_profiler()
+
+    def _start_profiler(self):
+        if hasattr(torch, 'profiler'):
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self._cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profiler = torch.profiler.profile(activities=activities)
+        else:
+            self._profiler = torch.autograd.profiler.profile(
+                use_cuda=self._cuda)
+        self._profiler.__enter__()
+
+    def _stop_profiler(self):
+        self._profiler.__exit__(None, None, None)
+        events = self._profiler.key_averages()
+        self._profiler = None
+
+        def device_time(event):
+            return getattr(event, 'self_cuda_time_total',
+                           getattr(event, 'self_device_time_total', 0))
+
+        events = sorted(
+            events,
+            key=lambda e: (device_time(e), e.self_cpu_time_total),
+            reverse=True)
+        # in ms, the profiler reports us
+        self._profile_ops = [
+            dict(
+                name=event.key,
+                count=event.count,
+                self_cpu_time=event.self_cpu_time_total / 1000,
+                self_device_time=device_time(event) / 1000)
+            for event in events[:self.topk]
+        ]
+
+    @master_only
+    def _dump_summary(self, runner):
+        if not self._records:
+            return
+        total = np.sum(self._records['total'])
+        stages = {}
+        for stage, values in self._records.items():
+            if stage == 'host_syncs':
+                continue
+            values = np.array(values) * 1000
+            stages[stage] = dict(
+                mean=float(values.mean()),
+                p50=float(np.percentile(values, 50)),
+                p90=float(np.percentile(values, 90)),
+                total=float(values.sum() / 1000),
+                share=float(values.sum() / 1000 / total) if total else 0.)
+        syncs = self._records.get('host_syncs', [])
+        summary = dict(
+            epoch=runner.epoch + 1,
+            num_iters=len(self._records['total']),
+            stages=stages,
+            host_syncs=dict(
+                per_iter=float(np.mean(syncs)) if syncs else 0.,
+                total=int(np.sum(syncs)),
+                sites=dict(self._sync_sites.most_common(self.topk))))
+        if self._profile_ops is not None:
+            summary['profiler_ops'] = self._profile_ops
+        mmcv.dump(
+            summary,
+            osp.join(runner.work_dir,
+                     f'step_profile_epoch_{runner.epoch + 1}.json'),
+            indent=4)
+
+        msg = ', '.join(f'{stage}: {stat["mean"]:.1f} ms'
+                        for stage, stat in stages.items())
+        runner.logger.info(
+            f'Step profile of epoch {runner.epoch + 1} (mean per iteration) '
+            f'{msg}, host syncs: {summary["host_syncs"]["per_iter"]:.1f}')
@@ -3,10 +3,11 @@ from .bbox_nms import fast_nms, multiclass_nms
 from .matrix_nms import mask_matrix_nms
 from .bbox_nms_reid import multiclass_nms_reid, multiclass_nms_reid_nae
 from .merge_augs import (merge_aug_bboxes, merge_aug_masks,
-                         merge_aug_proposals, merge_aug_scores)
+                         merge_aug_proposals, merge_aug_reid_results,
+                         merge_aug_scores)
 
 __all__ = [
     'multiclass_nms', 'merge_aug_proposals', 'merge_aug_bboxes',
     'merge_aug_scores', 'merge_aug_masks', 'mask_matrix_nms', 'fast_nms',
-	'multiclass_nms_reid', 'multiclass_nms_reid_nae'
+	'multiclass_nms_reid', 'multiclass_nms_reid_nae', 'merge_aug_reid_results'
 ]
@@ -4,10 +4,11 @@ import warnings
 
 import numpy as np
 import torch
+import torch.nn.functional as F
 from mmcv import ConfigDict
-from mmcv.ops import nms
+from mmcv.ops import batched_nms, nms
 
-from ..bbox import bbox_mapping_back
+from ..bbox import bbox_mapping_back, bbox_overlaps
 
 
 def merge_aug_proposals(aug_proposals, img_metas, cfg):
@@ -110,6 +111,77 @@ def merge_aug_bboxes(aug_bboxes, aug_scores, img_metas, rcnn_test_cfg):
         return bboxes, scores
 
 
+def merge_aug_reid_results(aug_results, img_metas, cfg):
+    """Merge augmented ReID detections and fuse their embeddings.
+
+    The boxes of all augmentations are mapped back to the original image
+    and merged by NMS. Every kept box is fused with its best match in each
+    other augmentation (same label, IoU >= ``cfg.aug_fuse_iou_thr``) and
+    always with itself, even when degenerate boxes give it a zero IoU. The
+    direction of the fused embedding is the average of the L2-normalized
+    embeddings weighted by the match scores, and its norm the weighted
+    average of their norms, so it is on the scale of the embeddings of
+    :meth:`simple_test`.
+
+    Args:
+        aug_results (list[tuple[Tensor]]): Boxes (n, 5), labels (n, ) and
+            embeddings (n, D) of every augmentation, in the space of the
+            augmented image.
+        img_metas (list[dict]): Meta information of every augmentation.
+        cfg (dict): Test config with ``nms`` and ``max_per_img``, and
+            optionally ``aug_fuse_iou_thr`` (default 0.5).
+
+    Returns:
+        tuple[Tensor]: Boxes (k, 5) in the original image space, labels
+            (k, ) and fused embeddings (k, D).
+    """
+    aug_bboxes = []
+    for (bboxes, _, _), img_meta in zip(aug_results, img_metas):
+        aug_bboxes.append(
+            bbox_mapping_back(bboxes[:, :4], img_meta['img_shape'],
+                              img_meta['scale_factor'], img_meta['flip'],
+                              img_meta['flip_direction']))
+    bboxes = torch.cat(aug_bboxes)
+    scores = torch.cat([result[0][:, 4] for result in aug_results])
+    labels = torch.cat([result[1] for result in aug_results])
+    feats = torch.cat([result[2] for result in aug_results])
+    if bboxes.numel() == 0:
+        return torch.cat([bboxes, scores[:, None]], -1), labels, feats
+
+    det_bboxes, keep = batched_nms(bboxes, scores, labels, cfg['nms'])
+    det_bboxes = det_bboxes[:cfg['max_per_img']]
+    keep = keep[:cfg['max_per_img']]
+    det_labels = labels[keep]
+
+    ious = bbox_overlaps(det_bboxes[:, :4], bboxes)
+    ious[det_labels[:, None] != labels[None]] = 0
+    # a box of zero area has a zero IoU with itself
+    ious[torch.arange(len(keep), device=keep.device), keep] = 1
+    feats = feats.float()
+    norms = feats.norm(dim=1, keepdim=True)
+    units = feats / norms.clamp(min=1e-12)
+    fused = feats.new_zeros(len(det_bboxes), feats.size(1))
+    fused_norms = feats.new_zeros(len(det_bboxes), 1)
+    weights = feats.new_zeros(len(det_bboxes), 1)
+    iou_thr = cfg.get('aug_fuse_iou_thr', 0.5)
+    start = 0
+    for bboxes, _, _ in aug_results:
+        end = start + len(bboxes)
+        if end > start:
+            # each augmentation contributes its best match
+            match_ious, match_inds = ious[:, start:end].max(dim=1)
+            match_inds += start
+            weight = scores[match_inds] * (match_ious >= iou_thr)
+            fused += weight[:, None] * units[match_inds]
+            fused_norms += weight[:, None] * norms[match_inds]
+            weights += weight[:, None]
+        start = end
+    fused = F.normalize(fused) * fused_norms / weights.clamp(min=1e-12)
+    # e.g. a kept box of score 0 has no weight
+    fused = torch.where(weights > 0, fused, feats[keep])
+    return det_bboxes, det_labels, fused
+
+
 def merge_aug_scores(aug_scores):
     """Merge augmented bbox scores."""
     if isinstance(aug_scores[0], torch.Tensor):
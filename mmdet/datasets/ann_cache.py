@@ -0,0 +1,193 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import json
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import numpy as np
+
+# Bump when the layout of the cache changes.
+CACHE_VERSION = 1
+
+_ARRAYS = ('bboxes', 'labels', 'ids', 'offsets', 'bboxes_ignore',
+           'ignore_offsets', 'cat_ids', 'cat_offsets')
+
+
+class AnnotationCache:
+    """Compiled per-image annotations stored as flat numpy arrays.
+
+    The parsed boxes, labels and person ids of all images are concatenated
+    into flat arrays, with ``offsets`` marking the rows of every image. The
+    arrays are saved as ``.npy`` files in a directory next to the annotation
+    file and are opened with ``mmap_mode='r'``, so dataloader workers share
+    the pages of the OS cache instead of holding a parsed COCO object each.
+
+    The cache is keyed by the modification time and size of the annotation
+    file and by the classes, and is rebuilt when any of them changes. Only
+    the path is pickled, the arrays are reopened lazily in every process.
+
+    Args:
+        cache_dir (str): Directory of the cache.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(osp.join(cache_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._arrays = None
+        self._rows = None
+
+    @staticmethod
+    def get_cache_dir(ann_file):
+        return ann_file + '.cache'
+
+    @staticmethod
+    def make_key(ann_file, classes):
+        stat = os.stat(ann_file)
+        if isinstance(classes, str):
+            classes = [classes]
+        return dict(
+            version=CACHE_VERSION,
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            classes=list(classes))
+
+    @classmethod
+    def load(cls, ann_file, classes):
+        """Open the cache of ``ann_file``.
+
+        Returns:
+            :obj:`AnnotationCache` | None: The cache, None if it does not
+                exist or is stale.
+        """
+        cache_dir = cls.get_cache_dir(ann_file)
+        try:
+            cache = cls(cache_dir)
+        except (OSError, ValueError):
+            return None
+        if cache.meta.get('key') != cls.make_key(ann_file, classes):
+            return None
+        return cache
+
+    @classmethod
+    def build(cls, ann_file, classes, cat_ids, data_infos, anns, parse_fn):
+        """Compile the annotations of ``ann_file`` and save them.
+
+        Args:
+            ann_file (str): Path of the annotation file.
+            classes (Sequence[str]): Classes of the dataset.
+            cat_ids (list[int]): Category ids of the classes.
+            data_infos (list[dict]): Info of every image.
+            anns (list[list[dict]]): Raw annotations of every image.
+            parse_fn (callable): Parses the raw annotations of an image to
+                ``bboxes``, ``labels``, ``ids`` and ``bboxes_ignore``.
+
+        Returns:
+            :obj:`AnnotationCache`: The saved cache.
+        """
+        arrays = {name: [] for name in _ARRAYS}
+        for img_info, img_anns in zip(data_infos, anns):
+            ann = parse_fn(img_info, img_anns)
+            arrays['bboxes'].append(ann['bboxes'].reshape(-1, 4))
+            arrays['labels'].append(ann['labels'])
+            arrays['ids'].append(ann['ids'])
+            arrays['bboxes_ignore'].append(ann['bboxes_ignore'].reshape(-1, 4))
+            arrays['cat_ids'].append(
+                np.array([a['category_id'] for a in img_anns],
+                         dtype=np.int64))
+        for name, offset_name in (('bboxes', 'offsets'),
+                                  ('bboxes_ignore', 'ignore_offsets'),
+                                  ('cat_ids', 'cat_offsets')):
+            arrays[offset_name] = np.cumsum(
+                [0] + [len(x) for x in arrays[name]]).astype(np.int64)
+        arrays['bboxes'] = np.concatenate(
+            [np.zeros((0, 4), dtype=np.float32)] + arrays['bboxes'])
+        arrays['bboxes_ignore'] = np.concatenate(
+            [np.zeros((0, 4), dtype=np.float32)] + arrays['bboxes_ignore'])
+        for name in ('labels', 'ids', 'cat_ids'):
+            arrays[name] = np.concatenate(
+                [np.zeros((0, ), dtype=np.int64)] + arrays[name])
+
+        meta = dict(
+            key=cls.make_key(ann_file, classes),
+            cat_ids=list(cat_ids),
+            data_infos=data_infos)
+        cache_dir = cls.get_cache_dir(ann_file)
+        # write to a temporary directory and rename it, so that concurrent
+        # builders (e.g. several ranks) never see a partial cache
+        tmp_dir = tempfile.mkdtemp(
+            prefix=osp.basename(cache_dir) + '.',
+            dir=osp.dirname(osp.abspath(cache_dir)))
+        try:
+            for name in _ARRAYS:
+                np.save(osp.join(tmp_dir, f'{name}.npy'), arrays[name])
+            with open(osp.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            if osp.isdir(cache_dir):
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            try:
+                os.rename(tmp_dir, cache_dir)
+            except OSError:
+                # another process saved the cache first
+                if not osp.isdir(cache_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return cls(cache_dir)
+
+    @property
+    def cat_ids(self):
+        return self.meta['cat_ids']
+
+    @property
+    def data_infos(self):
+        return self.meta['data_infos']
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {
+                name: np.load(
+                    osp.join(self.cache_dir, f'{name}.npy'), mmap_mode='r')
+                for name in _ARRAYS
+            }
+        return self._arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def __len__(self):
+        return len(self.meta['data_infos'])
+
+    def row(self, img_id):
+        """Row of the image with id ``img_id``."""
+        if self._rows is None:
+            self._rows = {
+                info['id']: i
+                for i, info in enumerate(self.meta['data_infos'])
+            }
+        return self._rows[img_id]
+
+    def _slice(self, name, offset_name, row):
+        offsets = self.arrays[offset_name]
+        return np.array(self.arrays[name][offsets[row]:offsets[row + 1]])
+
+    def get(self, row):
+        """Parsed ``bboxes``, ``labels``, ``ids`` and ``bboxes_ignore`` of
+        the image at ``row``."""
+        return dict(
+            bboxes=self._slice('bboxes', 'offsets', row),
+            labels=self._slice('labels', 'offsets', row),
+            ids=self._slice('ids', 'offsets', row),
+            bboxes_ignore=self._slice('bboxes_ignore', 'ignore_offsets', row))
+
+    def get_cat_ids(self, row):
+        """Category ids of all the annotations of the image at ``row``."""
+        return self._slice('cat_ids', 'cat_offsets', row).tolist()
+
+    def num_anns(self):
+        """Number of annotations of every image."""
+        return np.diff(self.arrays['cat_offsets'])
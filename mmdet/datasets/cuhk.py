@@ -2,6 +2,7 @@ import itertools
 import logging
 import os.path as osp
 import tempfile
+import warnings
 
 import mmcv
 import numpy as np
@@ -12,7 +13,9 @@ from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 from terminaltables import AsciiTable
 
-from mmdet.core import eval_recalls
+from mmdet.core import (GalleryIndex, eval_recalls, eval_search,
+                        load_results, print_search_summary)
+from .ann_cache import AnnotationCache
 from .builder import DATASETS
 from .custom import CustomDataset
 from .pipelines import Compose
@@ -29,6 +32,14 @@ from .pipelines import Compose
 
 @DATASETS.register_module()
 class CuhkDataset(CustomDataset):
+    """Person search dataset with COCO style annotations.
+
+    Args:
+        ann_cache (bool): Whether to compile the annotations into flat
+            numpy arrays saved next to ``ann_file`` and opened memory-mapped,
+            see :class:`AnnotationCache`. The COCO object is then only built
+            for evaluation. Default: False.
+    """
 
     CLASSES = ('person')
 
@@ -42,7 +53,8 @@ class CuhkDataset(CustomDataset):
                  seg_prefix=None,
                  proposal_file=None,
                  test_mode=False,
-                 filter_empty_gt=True):
+                 filter_empty_gt=True,
+                 ann_cache=False):
         self.ann_file = ann_file
         self.data_root = data_root
         self.img_prefix = img_prefix
@@ -50,6 +62,10 @@ class CuhkDataset(CustomDataset):
         self.proposal_file = proposal_file
         self.test_mode = test_mode
         self.filter_empty_gt = filter_empty_gt
+        self.ann_cache = ann_cache
+        self._coco = None
+        self._ann_cache = None
+        self.custom_classes = classes is not None
         self.CLASSES = self.get_classes(classes)
 
         # join paths if data_root is specified
@@ -92,31 +108,99 @@ class CuhkDataset(CustomDataset):
             self.query_test_pipeline = Compose(query_test_pipeline)
 
         #query mode
-        self.query_mode=False
+        self.query_mode = False
+        self.gallery_infos = self.data_infos
+        self._query_infos = None
+        self._query_grouped = False
+        self.query_groups = None
+        self._search_protocols = {}
     
-    def load_query(self):
-        """Load the list of (img, roi) for probes."""
-        self.equery_mode=True
+    def load_query_infos(self):
+        """Load the probes of the search protocol.
+
+        The protocol file is only parsed once per dataset. Probe images are
+        test images, so their sizes are taken from the annotation file
+        instead of opening every image.
+
+        Returns:
+            list[dict]: ``filename``, ``width``, ``height`` and ``roi`` (the
+                probe box of shape (1, 4) in ``(x1, y1, x2, y2)``) of every
+                probe.
+        """
+        if self._query_infos is not None:
+            return self._query_infos
         protocol = loadmat(self.proposal_file)
         protocol = protocol["TestG50"].squeeze()
-        probes = []
-        proposals = []
+        name2info = {
+            osp.basename(info['filename']): info
+            for info in self.gallery_infos
+        }
+        query_infos = []
         for item in protocol["Query"]:
-            im_name = osp.join(self.img_prefix, str(item["imname"][0, 0][0]))
+            im_name = str(item["imname"][0, 0][0])
             roi = item["idlocate"][0, 0][0].astype(np.int32)
             roi[2:] += roi[:2]
-            probe = {}
-            probe['filename'] = str(im_name)
-            size = Image.open(im_name).size
-            probe['width'] = size[0]
-            probe['height'] = size[1]
-            probes.append(probe)
-            roi = roi.reshape(1,4).astype(np.float32)
-            proposals.append(roi)
-        self.proposals = proposals
-        self.data_infos = probes
+            if im_name in name2info:
+                width = name2info[im_name]['width']
+                height = name2info[im_name]['height']
+            else:
+                width, height = Image.open(
+                    osp.join(self.img_prefix, im_name)).size
+            query_infos.append(
+                dict(
+                    filename=osp.join(self.img_prefix, im_name),
+                    width=width,
+                    height=height,
+                    roi=roi.reshape(1, 4).astype(np.float32)))
+        self._query_infos = query_infos
+        return query_infos
+
+    def load_query(self, group_by_image=False):
+        """Load the list of (img, roi) for probes.
+
+        Args:
+            group_by_image (bool): Whether to make one sample per probe image
+                holding the boxes of all its probes, so that the backbone
+                runs once per image instead of once per probe. The probes of
+                every sample are listed in ``query_groups``. Default: False.
+        """
+        if self.query_mode and self._query_grouped == group_by_image:
+            return
+        self.query_mode = True
+        self._query_grouped = group_by_image
+        query_infos = self.load_query_infos()
+        if group_by_image:
+            groups = {}
+            for i, info in enumerate(query_infos):
+                groups.setdefault(info['filename'], []).append(i)
+            self.query_groups = list(groups.values())
+        else:
+            self.query_groups = [[i] for i in range(len(query_infos))]
+        self.proposals = [
+            np.concatenate([query_infos[i]['roi'] for i in group])
+            for group in self.query_groups
+        ]
+        self.data_infos = []
+        for group in self.query_groups:
+            info = query_infos[group[0]]
+            self.data_infos.append(
+                dict(
+                    filename=info['filename'],
+                    width=info['width'],
+                    height=info['height']))
         self.pipeline = self.query_test_pipeline
 
+    @property
+    def coco(self):
+        """COCO api of the annotations, built on first use."""
+        if self._coco is None:
+            self._coco = COCO(self.ann_file)
+        return self._coco
+
+    @coco.setter
+    def coco(self, coco):
+        self._coco = coco
+
     def load_annotations(self, ann_file):
         """Load annotation from COCO style annotation file.
 
@@ -126,6 +210,17 @@ class CuhkDataset(CustomDataset):
         Returns:
             list[dict]: Annotation info from COCO api.
         """
+        if self.ann_cache and not self.custom_classes:
+            self._ann_cache = self._load_ann_cache(ann_file)
+            if self._ann_cache is not None:
+                self.cat_ids = self._ann_cache.cat_ids
+                self.cat2label = {
+                    cat_id: i
+                    for i, cat_id in enumerate(self.cat_ids)
+                }
+                data_infos = self._ann_cache.data_infos
+                self.img_ids = [info['id'] for info in data_infos]
+                return data_infos
 
         self.coco = COCO(ann_file)
         self.cat_ids = self.coco.get_cat_ids(cat_names=self.CLASSES)
@@ -133,11 +228,52 @@ class CuhkDataset(CustomDataset):
         self.img_ids = self.coco.get_img_ids()
         data_infos = []
         for i in self.img_ids:
-            info = self.coco.load_imgs([i])[0]
-            info['filename'] = info['file_name'].replace('/raid/yy1', '/home/yy1/2021')
-            data_infos.append(info)
+            data_infos.append(self._load_img_info(i))
         return data_infos
 
+    def _load_img_info(self, img_id):
+        """Load the info of an image from the COCO api."""
+        info = self.coco.load_imgs([img_id])[0]
+        # the file names of the annotations point to the original data root
+        info['filename'] = info['file_name'].replace('/raid/yy1',
+                                                     '/home/yy1/2021')
+        return info
+
+    def _load_ann_cache(self, ann_file):
+        """Open the annotation cache of ``ann_file``, compiling it first if
+        it is missing or stale.
+
+        Returns:
+            :obj:`AnnotationCache` | None: None if the annotations can not be
+                cached, in which case the COCO api is used.
+        """
+        cache = AnnotationCache.load(ann_file, self.CLASSES)
+        if cache is not None:
+            return cache
+        self.coco = COCO(ann_file)
+        if any(ann.get('segmentation') for ann in self.coco.anns.values()):
+            warnings.warn('Annotations with masks are not cached, '
+                          f'falling back to the COCO api for {ann_file}')
+            return None
+        self.cat_ids = self.coco.get_cat_ids(cat_names=self.CLASSES)
+        self.cat2label = {cat_id: i for i, cat_id in enumerate(self.cat_ids)}
+        data_infos, anns = [], []
+        for i in self.coco.get_img_ids():
+            data_infos.append(self._load_img_info(i))
+            anns.append(
+                self.coco.load_anns(self.coco.get_ann_ids(img_ids=[i])))
+        try:
+            cache = AnnotationCache.build(ann_file, self.CLASSES,
+                                          self.cat_ids, data_infos, anns,
+                                          self._parse_ann_info)
+        except OSError as e:
+            warnings.warn(f'Failed to save the annotation cache of '
+                          f'{ann_file} ({e}), falling back to the COCO api')
+            return None
+        # do not keep the COCO object alive in the dataloader workers
+        self.coco = None
+        return cache
+
     def get_ann_info(self, idx):
         """Get COCO annotation by index.
 
@@ -149,6 +285,12 @@ class CuhkDataset(CustomDataset):
         """
 
         img_id = self.data_infos[idx]['id']
+        if self._ann_cache is not None:
+            ann = self._ann_cache.get(self._ann_cache.row(img_id))
+            ann['masks'] = [None] * len(ann['bboxes'])
+            ann['seg_map'] = self.data_infos[idx]['filename'].replace(
+                'jpg', 'png')
+            return ann
         ann_ids = self.coco.get_ann_ids(img_ids=[img_id])
         ann_info = self.coco.load_anns(ann_ids)
         return self._parse_ann_info(self.data_infos[idx], ann_info)
@@ -164,6 +306,8 @@ class CuhkDataset(CustomDataset):
         """
 
         img_id = self.data_infos[idx]['id']
+        if self._ann_cache is not None:
+            return self._ann_cache.get_cat_ids(self._ann_cache.row(img_id))
         ann_ids = self.coco.get_ann_ids(img_ids=[img_id])
         ann_info = self.coco.load_anns(ann_ids)
         return [ann['category_id'] for ann in ann_info]
@@ -171,7 +315,15 @@ class CuhkDataset(CustomDataset):
     def _filter_imgs(self, min_size=32):
         """Filter images too small or without ground truths."""
         valid_inds = []
-        ids_with_ann = set(_['image_id'] for _ in self.coco.anns.values())
+        if self._ann_cache is not None:
+            num_anns = self._ann_cache.num_anns()
+            ids_with_ann = set(
+                info['id']
+                for info, num in zip(self._ann_cache.data_infos, num_anns)
+                if num > 0)
+        else:
+            ids_with_ann = set(
+                _['image_id'] for _ in self.coco.anns.values())
         for i, img_info in enumerate(self.data_infos):
             if self.filter_empty_gt and self.img_ids[i] not in ids_with_ann:
                 continue
@@ -422,6 +574,108 @@ class CuhkDataset(CustomDataset):
         ar = recalls.mean(axis=1)
         return ar
 
+    def load_search_protocol(self, gallery_size=100):
+        """Load the CUHK-SYSU search protocol of a gallery size.
+
+        The protocol ``TestG{gallery_size}.mat`` is looked up next to
+        ``proposal_file``.
+
+        Args:
+            gallery_size (int): Number of gallery images per probe, one of
+                50, 100, 500, 1000, 2000 and 4000.
+
+        Returns:
+            list[dict]: Per-probe ``gallery_inds`` (index of every gallery
+                image in ``self.gallery_infos``, -1 if missing) and
+                ``gt_bboxes`` (box of the probe in every gallery image in
+                ``(x1, y1, x2, y2)``, all zeros when absent).
+        """
+        if gallery_size in self._search_protocols:
+            return self._search_protocols[gallery_size]
+        name = f'TestG{gallery_size}'
+        protocol = loadmat(
+            osp.join(osp.dirname(self.proposal_file), name + '.mat'))
+        protocol = protocol[name].squeeze()
+        name2idx = {
+            osp.basename(info['filename']): i
+            for i, info in enumerate(self.gallery_infos)
+        }
+        probes = []
+        for items in protocol['Gallery']:
+            items = items.squeeze()
+            gallery_inds = np.array(
+                [name2idx.get(str(item[0][0]), -1) for item in items],
+                dtype=np.int64)
+            gt_bboxes = np.zeros((len(items), 4), dtype=np.float32)
+            for j, item in enumerate(items):
+                gt = item[1][0].astype(np.float32)
+                if gt.size > 0:
+                    gt_bboxes[j] = gt
+            gt_bboxes[:, 2:] += gt_bboxes[:, :2]
+            probes.append(
+                dict(gallery_inds=gallery_inds, gt_bboxes=gt_bboxes))
+        self._search_protocols[gallery_size] = probes
+        return probes
+
+    def evaluate_search(self,
+                        results,
+                        query_results,
+                        gallery_size=100,
+                        det_thresh=0.5,
+                        logger=None):
+        """Evaluate person search mAP and top-k accuracy.
+
+        Args:
+            results (list[list[ndarray]] | ReidResultStore): Gallery results
+                of the dataset, with ReID features appended after the score
+                column.
+            query_results (list[list[ndarray]] | str): Results of the probes
+                in protocol order, or the pickle file or result store
+                holding them. The first box of every probe is taken as its
+                feature.
+            gallery_size (int | Sequence[int]): Gallery sizes to evaluate.
+                Default: 100.
+            det_thresh (float): Score threshold of gallery detections.
+                Default: 0.5.
+            logger (logging.Logger | str | None): Logger used for printing
+                related information during evaluation. Default: None.
+
+        Returns:
+            dict[str, float]: ``search_mAP`` and ``search_top{k}`` of each
+                gallery size, suffixed by ``@G{gallery_size}``.
+        """
+        if query_results is None:
+            raise ValueError('query_results must be given for the search '
+                             'metric')
+        if isinstance(query_results, str):
+            query_results = load_results(query_results)
+        gallery_sizes = gallery_size if isinstance(
+            gallery_size, (list, tuple)) else [gallery_size]
+
+        gallery = GalleryIndex.from_results(
+            results, det_thresh, num_images=len(self.gallery_infos))
+        query_feats = []
+        for result in query_results:
+            det = result[0] if isinstance(result, (list, tuple)) else result
+            if len(det) == 0:
+                query_feats.append(np.zeros(gallery.feats.shape[1]))
+            else:
+                query_feats.append(det[0, 5:])
+        query_feats = np.stack(query_feats).astype(np.float32)
+
+        search_results = {}
+        for size in gallery_sizes:
+            protocol = self.load_search_protocol(size)
+            search_results[size] = eval_search(gallery, query_feats,
+                                               protocol)
+        print_search_summary(search_results, logger=logger)
+
+        eval_results = {}
+        for size, size_results in search_results.items():
+            for name, val in size_results.items():
+                eval_results[f'search_{name}@G{size}'] = val
+        return eval_results
+
     def format_results(self, results, jsonfile_prefix=None, **kwargs):
         """Format the results to json (standard format for COCO evaluation).
 
@@ -458,13 +712,16 @@ class CuhkDataset(CustomDataset):
                  classwise=False,
                  proposal_nums=(100, 300, 1000),
                  iou_thrs=None,
-                 metric_items=None):
-        """Evaluation in COCO protocol.
+                 metric_items=None,
+                 query_results=None,
+                 gallery_size=100,
+                 det_thresh=0.5):
+        """Evaluation in COCO protocol or person search protocol.
 
         Args:
             results (list[list | tuple]): Testing results of the dataset.
             metric (str | list[str]): Metrics to be evaluated. Options are
-                'bbox', 'segm', 'proposal', 'proposal_fast'.
+                'bbox', 'segm', 'proposal', 'proposal_fast', 'search'.
             logger (logging.Logger | str | None): Logger used for printing
                 related information during evaluation. Default: None.
             jsonfile_prefix (str | None): The prefix of json files. It includes
@@ -485,16 +742,36 @@ class CuhkDataset(CustomDataset):
                 used when ``metric=='proposal'``, ``['mAP', 'mAP_50', 'mAP_75',
                 'mAP_s', 'mAP_m', 'mAP_l']`` will be used when
                 ``metric=='bbox' or metric=='segm'``.
+            query_results (list[list[ndarray]] | str, optional): Results of
+                the probes, used by the 'search' metric. See
+                :meth:`evaluate_search`. Default: None.
+            gallery_size (int | Sequence[int]): Gallery sizes of the
+                'search' metric. Default: 100.
+            det_thresh (float): Score threshold of gallery detections for
+                the 'search' metric. Default: 0.5.
 
         Returns:
             dict[str, float]: COCO style evaluation metric.
         """
 
         metrics = metric if isinstance(metric, list) else [metric]
-        allowed_metrics = ['bbox', 'segm', 'proposal', 'proposal_fast']
+        allowed_metrics = [
+            'bbox', 'segm', 'proposal', 'proposal_fast', 'search'
+        ]
         for metric in metrics:
             if metric not in allowed_metrics:
                 raise KeyError(f'metric {metric} is not supported')
+
+        eval_results = {}
+        if 'search' in metrics:
+            eval_results.update(
+                self.evaluate_search(results, query_results, gallery_size,
+                                     det_thresh, logger))
+            metrics = [metric for metric in metrics if metric != 'search']
+            if not metrics:
+                return eval_results
+        # result stores are converted to the per-image list for COCO
+        results = list(results)
         if iou_thrs is None:
             iou_thrs = np.linspace(
                 .5, 0.95, int(np.round((0.95 - .5) / .05)) + 1, endpoint=True)
@@ -504,7 +781,6 @@ class CuhkDataset(CustomDataset):
 
         result_files, tmp_dir = self.format_results(results, jsonfile_prefix)
 
-        eval_results = {}
         cocoGt = self.coco
         for metric in metrics:
             msg = f'Evaluating {metric}...'
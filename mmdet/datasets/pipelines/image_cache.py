@@ -0,0 +1,176 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import hashlib
+import multiprocessing as mp
+import os
+import os.path as osp
+import uuid
+
+import mmcv
+import numpy as np
+from mmcv.utils import print_log
+
+
+class SharedImageCache:
+    """LRU cache of decoded images shared by all the processes of a node.
+
+    Every decoded image is saved as a ``.npy`` file in ``cache_dir``, by
+    default on the ``/dev/shm`` tmpfs, and read back memory-mapped. All the
+    dataloader workers and ranks of a node using the same ``cache_dir`` share
+    the images, so each one is decoded once instead of once per epoch.
+
+    Files are written to a temporary name and renamed, so readers never see a
+    partial image. A hit refreshes the modification time of the file, and when
+    the cache grows beyond ``max_bytes`` the least recently used files are
+    removed. Each process rescans the directory after it has added
+    ``max_bytes / 16`` bytes, so the size may overshoot by that much per
+    process between two scans.
+
+    The files are kept after training to be reused by later runs, use
+    :meth:`clear` to remove them.
+
+    Args:
+        cache_dir (str): Directory of the cache.
+            Default: '/dev/shm/mmdet_image_cache'.
+        max_bytes (int): Size limit of the cache in bytes. Default: 16 GiB.
+        log_interval (int): Log the statistics every ``log_interval`` lookups
+            of the processes sharing this object, 0 means never. Default: 0.
+    """
+
+    def __init__(self,
+                 cache_dir='/dev/shm/mmdet_image_cache',
+                 max_bytes=16 * 2**30,
+                 log_interval=0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.log_interval = log_interval
+        mmcv.mkdir_or_exist(cache_dir)
+        # hits and misses of the workers forked from this process
+        self._counts = mp.Array('q', 2)
+        self._added_bytes = 0
+
+    @staticmethod
+    def key(*args):
+        """Key of the image decoded from a file with the given options."""
+        return hashlib.sha1(repr(args).encode()).hexdigest()
+
+    def _path(self, key):
+        return osp.join(self.cache_dir, f'{key}.npy')
+
+    def get(self, key):
+        """Get an image.
+
+        Returns:
+            np.ndarray | None: A copy of the cached image, None if it is not
+                cached.
+        """
+        path = self._path(key)
+        try:
+            img = np.array(np.load(path, mmap_mode='r'))
+        except (OSError, ValueError):
+            # missing, or removed by another process while being read
+            img = None
+        else:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        self._count(img is not None)
+        return img
+
+    def put(self, key, img):
+        """Add an image, evicting the least recently used ones if the cache
+        is full."""
+        if img.nbytes > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, img)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # e.g. the tmpfs is full, decoding still works without the cache
+            print_log(
+                f'Failed to cache an image in {self.cache_dir}: {e}',
+                logger='mmdet')
+            if osp.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._added_bytes += img.nbytes
+        if self._added_bytes > self.max_bytes // 16:
+            self.evict()
+
+    def _scan(self):
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def evict(self):
+        """Remove the least recently used images until the cache is within
+        its size limit."""
+        self._added_bytes = 0
+        files = self._scan()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by another process
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        """Remove all the cached images."""
+        for _, _, path in self._scan():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _count(self, hit):
+        with self._counts.get_lock():
+            self._counts[0 if hit else 1] += 1
+            num_lookups = self._counts[0] + self._counts[1]
+        if self.log_interval > 0 and num_lookups % self.log_interval == 0:
+            stats = self.stats()
+            print_log(
+                f'image cache: hit rate {stats["hit_rate"]:.3f} '
+                f'({stats["hits"]}/{num_lookups}), '
+                f'{stats["num_images"]} images, '
+                f'{stats["bytes_used"] / 2**30:.2f} GiB used',
+                logger='mmdet')
+
+    def stats(self):
+        """Statistics of the cache.
+
+        Returns:
+            dict: ``hits`` and ``misses`` of the processes sharing this
+                object, ``hit_rate``, and ``num_images`` and ``bytes_used``
+                of the cache directory.
+        """
+        hits, misses = self._counts[0], self._counts[1]
+        files = self._scan()
+        return dict(
+            hits=hits,
+            misses=misses,
+            hit_rate=hits / max(hits + misses, 1),
+            num_images=len(files),
+            bytes_used=sum(size for _, size, _ in files))
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f"cache_dir='{self.cache_dir}', "
+                f'max_bytes={self.max_bytes}, '
+                f'log_interval={self.log_interval})')
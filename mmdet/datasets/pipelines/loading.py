@@ -1,4 +1,5 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import os
 import os.path as osp
 
 import mmcv
@@ -7,6 +8,7 @@ import pycocotools.mask as maskUtils
 
 from mmdet.core import BitmapMasks, PolygonMasks
 from ..builder import PIPELINES
+from .image_cache import SharedImageCache
 
 try:
     from panopticapi.utils import rgb2id
@@ -32,18 +34,26 @@ class LoadImageFromFile:
         file_client_args (dict): Arguments to instantiate a FileClient.
             See :class:`mmcv.fileio.FileClient` for details.
             Defaults to ``dict(backend='disk')``.
+        cache_cfg (dict, optional): Arguments of a :class:`SharedImageCache`
+            keeping the decoded images, e.g.
+            ``dict(cache_dir='/dev/shm/cuhk', max_bytes=32 * 2**30)``.
+            Defaults to None (no cache).
     """
 
     def __init__(self,
                  to_float32=False,
                  color_type='color',
                  channel_order='bgr',
-                 file_client_args=dict(backend='disk')):
+                 file_client_args=dict(backend='disk'),
+                 cache_cfg=None):
         self.to_float32 = to_float32
         self.color_type = color_type
         self.channel_order = channel_order
         self.file_client_args = file_client_args.copy()
         self.file_client = None
+        self.cache_cfg = cache_cfg
+        self.cache = SharedImageCache(
+            **cache_cfg) if cache_cfg is not None else None
 
     def __call__(self, results):
         """Call functions to load image and get image meta information.
@@ -64,9 +74,27 @@ class LoadImageFromFile:
         else:
             filename = results['img_info']['filename']
 
-        img_bytes = self.file_client.get(filename)
-        img = mmcv.imfrombytes(
-            img_bytes, flag=self.color_type, channel_order=self.channel_order)
+        img = None
+        if self.cache is not None:
+            # a file replaced on disk gets a new key, the cached images
+            # outlive the runs
+            try:
+                stat = os.stat(filename)
+                version = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                # not a local file, e.g. read by another file client
+                version = None
+            key = self.cache.key(filename, version, self.color_type,
+                                 self.channel_order)
+            img = self.cache.get(key)
+        if img is None:
+            img_bytes = self.file_client.get(filename)
+            img = mmcv.imfrombytes(
+                img_bytes,
+                flag=self.color_type,
+                channel_order=self.channel_order)
+            if self.cache is not None:
+                self.cache.put(key, img)
         if self.to_float32:
             img = img.astype(np.float32)
 
@@ -83,7 +111,10 @@ class LoadImageFromFile:
                     f'to_float32={self.to_float32}, '
                     f"color_type='{self.color_type}', "
                     f"channel_order='{self.channel_order}', "
-                    f'file_client_args={self.file_client_args})')
+                    f'file_client_args={self.file_client_args}')
+        if self.cache_cfg is not None:
+            repr_str += f', cache_cfg={self.cache_cfg}'
+        repr_str += ')'
         return repr_str
 
 
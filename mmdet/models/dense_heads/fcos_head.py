@@ -8,6 +8,7 @@ from mmcv.runner import force_fp32
 
 from mmdet.core import multi_apply, reduce_mean
 from ..builder import HEADS, build_loss
+from ..utils import fcos_point_targets
 from .anchor_free_head import AnchorFreeHead
 
 INF = 1e8
@@ -49,6 +50,10 @@ class FCOSHead(AnchorFreeHead):
         norm_cfg (dict): dictionary to construct and config norm layer.
             Default: norm_cfg=dict(type='GN', num_groups=32, requires_grad=True).
         init_cfg (dict or list[dict], optional): Initialization config dict.
+        assign_memory_budget (float, optional): Peak memory in MB of the
+            temporaries of the target assignment of one image. Points are
+            assigned in chunks within the budget, the targets do not depend
+            on it. Default: None (all points at once).
 
     Example:
         >>> self = FCOSHead(11, 7)
@@ -87,12 +92,14 @@ class FCOSHead(AnchorFreeHead):
                          name='conv_cls',
                          std=0.01,
                          bias_prob=0.01)),
+                 assign_memory_budget=None,
                  **kwargs):
         self.regress_ranges = regress_ranges
         self.center_sampling = center_sampling
         self.center_sample_radius = center_sample_radius
         self.norm_on_bbox = norm_on_bbox
         self.centerness_on_reg = centerness_on_reg
+        self.assign_memory_budget = assign_memory_budget
         super().__init__(
             num_classes,
             in_channels,
@@ -337,78 +344,19 @@ class FCOSHead(AnchorFreeHead):
             return gt_labels.new_full((num_points,), self.num_classes), \
                    gt_bboxes.new_zeros((num_points, 4))
 
-        areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (
-            gt_bboxes[:, 3] - gt_bboxes[:, 1])
-        # TODO: figure out why these two are different
-        # areas = areas[None].expand(num_points, num_gts)
-        areas = areas[None].repeat(num_points, 1)
-        regress_ranges = regress_ranges[:, None, :].expand(
-            num_points, num_gts, 2)
-        gt_bboxes = gt_bboxes[None].expand(num_points, num_gts, 4)
-        xs, ys = points[:, 0], points[:, 1]
-        xs = xs[:, None].expand(num_points, num_gts)
-        ys = ys[:, None].expand(num_points, num_gts)
-
-        left = xs - gt_bboxes[..., 0]
-        right = gt_bboxes[..., 2] - xs
-        top = ys - gt_bboxes[..., 1]
-        bottom = gt_bboxes[..., 3] - ys
-        bbox_targets = torch.stack((left, top, right, bottom), -1)
-
-        if self.center_sampling:
-            # condition1: inside a `center bbox`
-            radius = self.center_sample_radius
-            center_xs = (gt_bboxes[..., 0] + gt_bboxes[..., 2]) / 2
-            center_ys = (gt_bboxes[..., 1] + gt_bboxes[..., 3]) / 2
-            center_gts = torch.zeros_like(gt_bboxes)
-            stride = center_xs.new_zeros(center_xs.shape)
-
-            # project the points on current lvl back to the `original` sizes
-            lvl_begin = 0
-            for lvl_idx, num_points_lvl in enumerate(num_points_per_lvl):
-                lvl_end = lvl_begin + num_points_lvl
-                stride[lvl_begin:lvl_end] = self.strides[lvl_idx] * radius
-                lvl_begin = lvl_end
-
-            x_mins = center_xs - stride
-            y_mins = center_ys - stride
-            x_maxs = center_xs + stride
-            y_maxs = center_ys + stride
-            center_gts[..., 0] = torch.where(x_mins > gt_bboxes[..., 0],
-                                             x_mins, gt_bboxes[..., 0])
-            center_gts[..., 1] = torch.where(y_mins > gt_bboxes[..., 1],
-                                             y_mins, gt_bboxes[..., 1])
-            center_gts[..., 2] = torch.where(x_maxs > gt_bboxes[..., 2],
-                                             gt_bboxes[..., 2], x_maxs)
-            center_gts[..., 3] = torch.where(y_maxs > gt_bboxes[..., 3],
-                                             gt_bboxes[..., 3], y_maxs)
-
-            cb_dist_left = xs - center_gts[..., 0]
-            cb_dist_right = center_gts[..., 2] - xs
-            cb_dist_top = ys - center_gts[..., 1]
-            cb_dist_bottom = center_gts[..., 3] - ys
-            center_bbox = torch.stack(
-                (cb_dist_left, cb_dist_top, cb_dist_right, cb_dist_bottom), -1)
-            inside_gt_bbox_mask = center_bbox.min(-1)[0] > 0
-        else:
-            # condition1: inside a gt bbox
-            inside_gt_bbox_mask = bbox_targets.min(-1)[0] > 0
-
-        # condition2: limit the regression range for each location
-        max_regress_distance = bbox_targets.max(-1)[0]
-        inside_regress_range = (
-            (max_regress_distance >= regress_ranges[..., 0])
-            & (max_regress_distance <= regress_ranges[..., 1]))
-
-        # if there are still more than one objects for a location,
-        # we choose the one with minimal area
-        areas[inside_gt_bbox_mask == 0] = INF
-        areas[inside_regress_range == 0] = INF
-        min_area, min_area_inds = areas.min(dim=1)
+        min_area, min_area_inds, bbox_targets = fcos_point_targets(
+            points,
+            gt_bboxes,
+            regress_ranges,
+            num_points_per_lvl,
+            self.strides,
+            center_sample_radius=self.center_sample_radius
+            if self.center_sampling else None,
+            memory_budget=self.assign_memory_budget,
+            inf=INF)
 
         labels = gt_labels[min_area_inds]
         labels[min_area == INF] = self.num_classes  # set as BG
-        bbox_targets = bbox_targets[range(num_points), min_area_inds]
 
         return labels, bbox_targets
 
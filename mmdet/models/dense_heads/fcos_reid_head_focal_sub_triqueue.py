@@ -7,6 +7,7 @@ from mmcv.cnn import ConvModule, bias_init_with_prob, normal_init
 
 from mmdet.core import distance2bbox, force_fp32, multi_apply, multiclass_nms, multiclass_nms_reid
 from ..builder import HEADS, build_loss
+from ..utils import fcos_point_targets
 from .anchor_free_head_reid import AnchorFreeHeadReid
 from .labeled_matching_layer_queue import LabeledMatchingLayerQueue
 from .unlabeled_matching_layer import UnlabeledMatchingLayer
@@ -50,6 +51,25 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
         loss_centerness (dict): Config of centerness loss.
         norm_cfg (dict): dictionary to construct and config norm layer.
             Default: norm_cfg=dict(type='GN', num_groups=32, requires_grad=True).
+        sync_memory (bool): If true, the OIM lookup table and queue are
+            updated with the features of all ranks in distributed training.
+            Default: False.
+        memory_dtype (str, optional): Storage dtype of the OIM lookup table
+            and queue, 'float16' or 'bfloat16' halve their size.
+            Default: None (float32).
+        active_levels (tuple[int], optional): Levels the head runs on in
+            training, which must include every level whose regress range can
+            be assigned positives (see :meth:`assignable_levels`). The neck
+            is expected to output only these levels in training. Skipping
+            the other levels drops their background terms from the
+            classification loss and leaves the other losses unchanged. The
+            scales of the other levels are not built, their entries in
+            checkpoints of heads with all levels are ignored.
+            Default: None (all levels).
+        assign_memory_budget (float, optional): Peak memory in MB of the
+            temporaries of the target assignment of one image. Points are
+            assigned in chunks within the budget, the targets do not depend
+            on it. Default: None (all points at once).
 
     Example:
         >>> self = FCOSHead(11, 7)
@@ -97,13 +117,23 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
                      use_sigmoid=True,
                      loss_weight=1.0),
                  norm_cfg=dict(type='GN', num_groups=32, requires_grad=True),
+                 sync_memory=False,
+                 memory_dtype=None,
+                 active_levels=None,
+                 assign_memory_budget=None,
                  **kwargs):
         self.regress_ranges = regress_ranges
         self.center_sampling = center_sampling
         self.center_sample_radius = center_sample_radius
         self.norm_on_bbox = norm_on_bbox
         self.centerness_on_reg = centerness_on_reg
+        self.assign_memory_budget = assign_memory_budget
         self.background_id = -2
+        self.sync_memory = sync_memory
+        self.memory_dtype = memory_dtype
+        # set before ``_init_layers``, which only builds the active scales
+        self.active_levels = None if active_levels is None else tuple(
+            sorted(active_levels))
         super().__init__(
             num_classes,
             in_channels,
@@ -113,6 +143,10 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
             **kwargs)
         self.loss_centerness = build_loss(loss_centerness)
         self.loss_tri = TripletLossFilter()
+        if self.active_levels is None:
+            self.active_levels = tuple(range(len(self.strides)))
+        assert set(self.assignable_levels()) <= set(self.active_levels), \
+            'levels that can be assigned positives must be active'
 
     def _init_layers(self):
         """Initialize layers of the head."""
@@ -125,9 +159,24 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
         #queue_size = 2000
         queue_size = 5000
         #self.classifier_reid = nn.Linear(self.feat_channels, num_person)
-        self.scales = nn.ModuleList([Scale(1.0) for _ in self.strides])
-        self.labeled_matching_layer = LabeledMatchingLayerQueue(num_persons=num_person, feat_len=self.in_channels) # for mot17half
-        self.unlabeled_matching_layer = UnlabeledMatchingLayer(queue_size=queue_size, feat_len=self.in_channels)
+        # the scales of the levels skipped in training are not built, so
+        # that every parameter gets a gradient in distributed training
+        active_levels = self.active_levels or range(len(self.strides))
+        self.scales = nn.ModuleList([
+            Scale(1.0) if i in active_levels else None
+            for i in range(len(self.strides))
+        ])
+        # for mot17half
+        self.labeled_matching_layer = LabeledMatchingLayerQueue(
+            num_persons=num_person,
+            feat_len=self.in_channels,
+            sync_memory=self.sync_memory,
+            memory_dtype=self.memory_dtype)
+        self.unlabeled_matching_layer = UnlabeledMatchingLayer(
+            queue_size=queue_size,
+            feat_len=self.in_channels,
+            sync_memory=self.sync_memory,
+            memory_dtype=self.memory_dtype)
 
     def _init_reid_convs(self):
         """Initialize classification conv layers of the head."""
@@ -151,6 +200,18 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
                     norm_cfg=dict(type='BN', requires_grad=True),
                     bias=self.conv_bias))
 
+    def assignable_levels(self):
+        """Levels whose regress range can be assigned positives.
+
+        The largest regression distance of a point inside a gt box is
+        positive, so a level with an empty or negative regress range, e.g.
+        ``(-2, -1)``, never gets positives.
+        """
+        return [
+            i for i, (lower, upper) in enumerate(self.regress_ranges)
+            if upper > 0 and lower <= upper
+        ]
+
     def init_weights(self):
         """Initialize weights of the head."""
         super().init_weights()
@@ -184,12 +245,23 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
         #return multi_apply(self.forward_single, tuple([feats[0]]), nn.ModuleList([self.scales[0]]),
         #                    [self.strides[0]])
         feats = list(feats)
-        h, w = feats[0].shape[2], feats[0].shape[3]
-        mean_value = nn.functional.adaptive_avg_pool2d(feats[0], 1)
-        mean_value = F.upsample(input=mean_value, size=(h, w), mode='bilinear')
-        feats[0] = feats[0] - mean_value
-        return multi_apply(self.forward_single, feats, self.scales,
-                           self.strides)
+        if self.training:
+            assert len(feats) == len(self.active_levels), \
+                'the neck must output the active levels of the head'
+            levels = self.active_levels
+        else:
+            levels = range(len(feats))
+            assert all(self.scales[i] is not None for i in levels), \
+                'the levels skipped in training can not be tested'
+        scales = [self.scales[i] for i in levels]
+        strides = [self.strides[i] for i in levels]
+        if levels[0] == 0:
+            h, w = feats[0].shape[2], feats[0].shape[3]
+            mean_value = nn.functional.adaptive_avg_pool2d(feats[0], 1)
+            mean_value = F.upsample(
+                input=mean_value, size=(h, w), mode='bilinear')
+            feats[0] = feats[0] - mean_value
+        return multi_apply(self.forward_single, feats, scales, strides)
 
     def forward_single(self, x, scale, stride):
         """Forward features of a single scale levle.
@@ -265,8 +337,12 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
         """
         assert len(cls_scores) == len(bbox_preds) == len(centernesses) == len(reid_feats)
         featmap_sizes = [featmap.size()[-2:] for featmap in cls_scores]
-        all_level_points = self.get_points(featmap_sizes, bbox_preds[0].dtype,
-                                           bbox_preds[0].device)
+        assert len(featmap_sizes) == len(self.active_levels)
+        all_level_points = [
+            self._get_points_single(featmap_size, self.strides[lvl],
+                                    bbox_preds[0].dtype, bbox_preds[0].device)
+            for featmap_size, lvl in zip(featmap_sizes, self.active_levels)
+        ]
         labels, ids, bbox_targets = self.get_targets(all_level_points, gt_bboxes,
                                                 gt_labels, gt_ids)
 
@@ -558,7 +634,12 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
                              dim=-1) + stride // 2
         return points
 
-    def get_targets(self, points, gt_bboxes_list, gt_labels_list, gt_ids_list):
+    def get_targets(self,
+                    points,
+                    gt_bboxes_list,
+                    gt_labels_list,
+                    gt_ids_list,
+                    levels=None):
         """Compute regression, classification and centerss targets for points
         in multiple images.
 
@@ -569,6 +650,8 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
                 each has shape (num_gt, 4).
             gt_labels_list (list[Tensor]): Ground truth labels of each box,
                 each has shape (num_gt,).
+            levels (tuple[int], optional): Pyramid level of each element of
+                ``points``. Default: None (``self.active_levels``).
 
         Returns:
             tuple:
@@ -581,11 +664,13 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
         #print(points, self.regress_ranges)
         #print(len(points), len(self.regress_ranges))
 
-        assert len(points) == len(self.regress_ranges)
+        if levels is None:
+            levels = self.active_levels
+        assert len(points) == len(levels)
         num_levels = len(points)
         # expand regress ranges to align with points
         expanded_regress_ranges = [
-            points[i].new_tensor(self.regress_ranges[i])[None].expand_as(
+            points[i].new_tensor(self.regress_ranges[levels[i]])[None].expand_as(
                 points[i]) for i in range(num_levels)
         ]
         # concat all levels points and regress ranges
@@ -603,7 +688,8 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
             gt_ids_list,
             points=concat_points,
             regress_ranges=concat_regress_ranges,
-            num_points_per_lvl=num_points)
+            num_points_per_lvl=num_points,
+            levels=levels)
 
         # split to per img, per level
         labels_list = [labels.split(num_points, 0) for labels in labels_list]
@@ -625,12 +711,12 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
             bbox_targets = torch.cat(
                 [bbox_targets[i] for bbox_targets in bbox_targets_list])
             if self.norm_on_bbox:
-                bbox_targets = bbox_targets / self.strides[i]
+                bbox_targets = bbox_targets / self.strides[levels[i]]
             concat_lvl_bbox_targets.append(bbox_targets)
         return concat_lvl_labels, concat_lvl_ids, concat_lvl_bbox_targets
 
     def _get_target_single(self, gt_bboxes, gt_labels, gt_ids, points, regress_ranges,
-                           num_points_per_lvl):
+                           num_points_per_lvl, levels):
         """Compute regression and classification targets for a single image."""
         num_points = points.size(0)
         num_gts = gt_labels.size(0)
@@ -639,80 +725,21 @@ class FCOSReidHeadFocalSubTriQueue(AnchorFreeHeadReid):
                    gt_ids.new_full((num_points,), self.background_id), \
                    gt_bboxes.new_zeros((num_points, 4))
 
-        areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (
-            gt_bboxes[:, 3] - gt_bboxes[:, 1])
-        # TODO: figure out why these two are different
-        # areas = areas[None].expand(num_points, num_gts)
-        areas = areas[None].repeat(num_points, 1)
-        regress_ranges = regress_ranges[:, None, :].expand(
-            num_points, num_gts, 2)
-        gt_bboxes = gt_bboxes[None].expand(num_points, num_gts, 4)
-        xs, ys = points[:, 0], points[:, 1]
-        xs = xs[:, None].expand(num_points, num_gts)
-        ys = ys[:, None].expand(num_points, num_gts)
-
-        left = xs - gt_bboxes[..., 0]
-        right = gt_bboxes[..., 2] - xs
-        top = ys - gt_bboxes[..., 1]
-        bottom = gt_bboxes[..., 3] - ys
-        bbox_targets = torch.stack((left, top, right, bottom), -1)
-
-        if self.center_sampling:
-            # condition1: inside a `center bbox`
-            radius = self.center_sample_radius
-            center_xs = (gt_bboxes[..., 0] + gt_bboxes[..., 2]) / 2
-            center_ys = (gt_bboxes[..., 1] + gt_bboxes[..., 3]) / 2
-            center_gts = torch.zeros_like(gt_bboxes)
-            stride = center_xs.new_zeros(center_xs.shape)
-
-            # project the points on current lvl back to the `original` sizes
-            lvl_begin = 0
-            for lvl_idx, num_points_lvl in enumerate(num_points_per_lvl):
-                lvl_end = lvl_begin + num_points_lvl
-                stride[lvl_begin:lvl_end] = self.strides[lvl_idx] * radius
-                lvl_begin = lvl_end
-
-            x_mins = center_xs - stride
-            y_mins = center_ys - stride
-            x_maxs = center_xs + stride
-            y_maxs = center_ys + stride
-            center_gts[..., 0] = torch.where(x_mins > gt_bboxes[..., 0],
-                                             x_mins, gt_bboxes[..., 0])
-            center_gts[..., 1] = torch.where(y_mins > gt_bboxes[..., 1],
-                                             y_mins, gt_bboxes[..., 1])
-            center_gts[..., 2] = torch.where(x_maxs > gt_bboxes[..., 2],
-                                             gt_bboxes[..., 2], x_maxs)
-            center_gts[..., 3] = torch.where(y_maxs > gt_bboxes[..., 3],
-                                             gt_bboxes[..., 3], y_maxs)
-
-            cb_dist_left = xs - center_gts[..., 0]
-            cb_dist_right = center_gts[..., 2] - xs
-            cb_dist_top = ys - center_gts[..., 1]
-            cb_dist_bottom = center_gts[..., 3] - ys
-            center_bbox = torch.stack(
-                (cb_dist_left, cb_dist_top, cb_dist_right, cb_dist_bottom), -1)
-            inside_gt_bbox_mask = center_bbox.min(-1)[0] > 0
-        else:
-            # condition1: inside a gt bbox
-            inside_gt_bbox_mask = bbox_targets.min(-1)[0] > 0
-
-        # condition2: limit the regression range for each location
-        max_regress_distance = bbox_targets.max(-1)[0]
-        inside_regress_range = (
-            (max_regress_distance >= regress_ranges[..., 0])
-            & (max_regress_distance <= regress_ranges[..., 1]))
-
-        # if there are still more than one objects for a location,
-        # we choose the one with minimal area
-        areas[inside_gt_bbox_mask == 0] = INF
-        areas[inside_regress_range == 0] = INF
-        min_area, min_area_inds = areas.min(dim=1)
+        min_area, min_area_inds, bbox_targets = fcos_point_targets(
+            points,
+            gt_bboxes,
+            regress_ranges,
+            num_points_per_lvl,
+            [self.strides[lvl] for lvl in levels],
+            center_sample_radius=self.center_sample_radius
+            if self.center_sampling else None,
+            memory_budget=self.assign_memory_budget,
+            inf=INF)
 
         labels = gt_labels[min_area_inds]
         ids = gt_ids[min_area_inds]
         labels[min_area == INF] = self.background_label  # set as BG
         ids[min_area == INF] = self.background_id # set as unannotated
-        bbox_targets = bbox_targets[range(num_points), min_area_inds]
 
         return labels, ids, bbox_targets
 
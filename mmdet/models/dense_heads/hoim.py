@@ -4,7 +4,9 @@ import torch
 import torch.nn.functional as F
 from torch import nn, autograd
 
-from .oim_utils import tensor_gather
+from .oim_utils import (get_memory_dtype, memory_mm,
+                        normalized_momentum_update_, priority_enqueue_,
+                        tensor_gather)
 
 
 class OIM2CQ(autograd.Function):
@@ -13,9 +15,9 @@ class OIM2CQ(autograd.Function):
     def forward(ctx, inputs, targets,
                 lut, cq, cqb, cq_omega, cqb_omega,
                 omega_decay, momentum):
-        outputs_labeled = inputs.mm(lut.t())
-        outputs_unlabeled = inputs.mm(cq.t())
-        outputs_background = inputs.mm(cqb.t())
+        outputs_labeled = memory_mm(inputs, lut.t())
+        outputs_unlabeled = memory_mm(inputs, cq.t())
+        outputs_background = memory_mm(inputs, cqb.t())
 
         omega_x_unlabeled = outputs_labeled.max(dim=1)[0] /  \
             (outputs_unlabeled.max(dim=1)[0] + 1e-12)
@@ -41,32 +43,21 @@ class OIM2CQ(autograd.Function):
 
         grad_inputs = None
         if ctx.needs_input_grad[0]:
-            grad_inputs = grad_outputs.mm(
-                torch.cat([cqb, lut, cq], dim=0))
+            grad_inputs = memory_mm(
+                grad_outputs, torch.cat([cqb, lut, cq], dim=0))
             if grad_inputs.dtype == torch.float16:
                 grad_inputs = grad_inputs.to(torch.float32)
 
-        for x, y, omega, omega_b in zip(inputs, targets, omega_x_unlabeled, omega_x_background):
-            if y == -2:
-                if omega_b < cqb_omega.min():
-                    continue
-                else:
-                    header_cqb = cqb_omega.argmin().item()
-                    cqb[header_cqb] = x
-                    cqb_omega[header_cqb] = omega_b
-
-            elif y < len(lut) and y >= 0:
-                lut[y] = momentum * \
-                    lut[y] + (1. - momentum) * x
-                lut[y] /= max(lut[y].norm(), 1e-12)
-
-            else:
-                if omega < cq_omega.min():
-                    continue
-                else:
-                    header_cq = cq_omega.argmin().item()
-                    cq[header_cq] = x
-                    cq_omega[header_cq] = omega
+        # the queues keep the samples with the highest omegas
+        bg = targets == -2
+        labeled = (targets >= 0) & (targets < len(lut))
+        unlabeled = ~(bg | labeled)
+        priority_enqueue_(cqb, cqb_omega, inputs[bg], omega_x_background[bg])
+        priority_enqueue_(cq, cq_omega, inputs[unlabeled],
+                          omega_x_unlabeled[unlabeled])
+
+        normalized_momentum_update_(lut, inputs[labeled], targets[labeled],
+                                    momentum)
 
         cq_omega *= omega_decay
         cqb_omega *= omega_decay
@@ -86,7 +77,8 @@ class HOIMLoss(nn.Module):
                  oim_momentum, oim_scalar,
                  omega_decay=0.99,
                  dynamic_lambda=True,
-                 alpha_d=None, alpha_r=None, gamma_d=None, gamma_r=None):
+                 alpha_d=None, alpha_r=None, gamma_d=None, gamma_r=None,
+                 memory_dtype=None):
         super(HOIMLoss, self).__init__()
         self.num_features = num_features
         self.num_pids = num_pids
@@ -104,16 +96,19 @@ class HOIMLoss(nn.Module):
         self.gamma_d = gamma_d if gamma_d is not None else 2.0
         self.gamma_r = gamma_r if gamma_r is not None else 2.0
 
+        # 'float16' or 'bfloat16' halve the size of the feature memories,
+        # scores and updates are still computed in float32
+        memory_dtype = get_memory_dtype(memory_dtype)
         self.register_buffer('lut', torch.zeros(
-            self.num_pids, self.num_features))
+            self.num_pids, self.num_features, dtype=memory_dtype))
 
         self.register_buffer('cq', torch.zeros(
-            self.num_unlabeled, self.num_features))
+            self.num_unlabeled, self.num_features, dtype=memory_dtype))
         self.register_buffer('cq_omega', torch.zeros(
             self.num_unlabeled))
 
         self.register_buffer('cqb', torch.zeros(
-            self.num_background, self.num_features))
+            self.num_background, self.num_features, dtype=memory_dtype))
         self.register_buffer('cqb_omega', torch.zeros(
             self.num_background))
 
@@ -2,6 +2,8 @@ import torch
 import torch.nn as nn
 from torch.autograd import Function
 
+from .oim_utils import momentum_update_
+
 
 class LabeledMatching(Function):
     @staticmethod
@@ -27,12 +29,8 @@ class LabeledMatching(Function):
             grad_feats = grad_output.mm(lookup_table)
 
         # Update lookup table, but not by standard backpropagation with gradients
-        for indx, label in enumerate(pid_labels):
-            if label >= 0:
-                lookup_table[label] = (
-                    momentum * lookup_table[label] + (1 - momentum) * features[indx]
-                )
-                #lookup_table[label] /= lookup_table[label].norm()
+        valid = pid_labels >= 0
+        momentum_update_(lookup_table, features[valid], pid_labels[valid], momentum)
 
         return grad_feats, None, None, None
 
@@ -2,22 +2,30 @@ import torch
 import torch.nn as nn
 from torch.autograd import Function
 
+from .oim_utils import (gather_across_ranks, get_memory_dtype, memory_mm,
+                        momentum_update_)
+
 
 class LabeledMatching(Function):
     @staticmethod
-    def forward(ctx, features, pid_labels, lookup_table, momentum=0.5):
+    def forward(ctx,
+                features,
+                pid_labels,
+                lookup_table,
+                momentum=0.5,
+                sync_memory=False):
         # The lookup_table can't be saved with ctx.save_for_backward(), as we would
         # modify the variable which has the same memory address in backward()
         ctx.save_for_backward(features, pid_labels)
         ctx.lookup_table = lookup_table
         ctx.momentum = momentum
+        ctx.sync_memory = sync_memory
 
-        scores = features.mm(lookup_table.t())
+        scores = memory_mm(features, lookup_table.t())
         #print(features, lookup_table, scores)
-        pos_feats = lookup_table.clone().detach()
         pos_idx = pid_labels > 0
         pos_pids = pid_labels[pos_idx]
-        pos_feats = pos_feats[pos_pids]
+        pos_feats = lookup_table[pos_pids].to(features.dtype)
         #pos_feats.require_grad = False
         
         return scores, pos_feats, pos_pids
@@ -30,17 +38,15 @@ class LabeledMatching(Function):
 
         grad_feats = None
         if ctx.needs_input_grad[0]:
-            grad_feats = grad_output.mm(lookup_table)
+            grad_feats = memory_mm(grad_output, lookup_table)
 
         # Update lookup table, but not by standard backpropagation with gradients
-        for indx, label in enumerate(pid_labels):
-            if label >= 0:
-                lookup_table[label] = (
-                    momentum * lookup_table[label] + (1 - momentum) * features[indx]
-                )
-                #lookup_table[label] /= lookup_table[label].norm()
+        if ctx.sync_memory:
+            features, pid_labels = gather_across_ranks(features, pid_labels)
+        valid = pid_labels >= 0
+        momentum_update_(lookup_table, features[valid], pid_labels[valid], momentum)
 
-        return grad_feats, None, None, None
+        return grad_feats, None, None, None, None
 
 
 class LabeledMatchingLayerQueue(nn.Module):
@@ -48,14 +54,28 @@ class LabeledMatchingLayerQueue(nn.Module):
     Labeled matching of OIM loss function.
     """
 
-    def __init__(self, num_persons=5532, feat_len=256):
+    def __init__(self,
+                 num_persons=5532,
+                 feat_len=256,
+                 sync_memory=False,
+                 memory_dtype=None):
         """
         Args:
             num_persons (int): Number of labeled persons.
             feat_len (int): Length of the feature extracted by the network.
+            sync_memory (bool): Update the lookup table with the features of
+                all ranks in distributed training, which keeps it identical
+                on every rank.
+            memory_dtype (str, optional): Storage dtype of the lookup table,
+                'float16' or 'bfloat16' halve its size. Scores and updates
+                are still computed in float32. Defaults to float32.
         """
         super(LabeledMatchingLayerQueue, self).__init__()
-        self.register_buffer("lookup_table", torch.zeros(num_persons, feat_len))
+        self.register_buffer(
+            "lookup_table",
+            torch.zeros(
+                num_persons, feat_len, dtype=get_memory_dtype(memory_dtype)))
+        self.sync_memory = sync_memory
 
     def forward(self, features, pid_labels):
         """
@@ -67,5 +87,6 @@ class LabeledMatchingLayerQueue(nn.Module):
             scores (Tensor[N, num_persons]): Labeled matching scores, namely the similarities
                                              between proposals and labeled persons.
         """
-        scores, pos_feats, pos_pids = LabeledMatching.apply(features, pid_labels, self.lookup_table)
+        scores, pos_feats, pos_pids = LabeledMatching.apply(
+            features, pid_labels, self.lookup_table, 0.5, self.sync_memory)
         return scores, pos_feats, pos_pids
\ No newline at end of file
@@ -1,3 +1,4 @@
+import heapq
 import os
 import sys
 import pickle
@@ -200,4 +201,268 @@ def reduce_dict(input_dict, average=True):
         if average:
             values /= world_size
         reduced_dict = {k: v for k, v in zip(names, values)}
-    return reduced_dict
\ No newline at end of file
+    return reduced_dict
+
+
+_LOW_PRECISION_DTYPES = (torch.float16, torch.bfloat16)
+# number of elements of the memory upcast at once by ``memory_mm``
+_MEMORY_MM_CHUNK = 1 << 20
+
+
+def get_memory_dtype(memory_dtype=None):
+    """Dtype of the OIM memory buffers.
+
+    Args:
+        memory_dtype (str | torch.dtype, optional): ``'float32'``,
+            ``'float16'`` or ``'bfloat16'``. Defaults to float32.
+
+    Returns:
+        torch.dtype: The storage dtype.
+    """
+    if memory_dtype is None:
+        return torch.float32
+    if isinstance(memory_dtype, str):
+        memory_dtype = getattr(torch, memory_dtype, None)
+    if memory_dtype not in (torch.float32, ) + _LOW_PRECISION_DTYPES:
+        raise ValueError(f'unsupported OIM memory dtype {memory_dtype}')
+    return memory_dtype
+
+
+def accumulation_dtype(memory):
+    """Dtype used to update a memory: float32 for half-precision storage."""
+    if memory.dtype in _LOW_PRECISION_DTYPES:
+        return torch.float32
+    return memory.dtype
+
+
+def memory_mm(input, memory):
+    """Compute ``input.mm(memory)`` for a memory stored in any precision.
+
+    A half-precision memory is never copied to float32 as a whole. On CUDA
+    the input is cast to the memory dtype and the half operands are
+    multiplied by cuBLAS, which accumulates in float32. On other devices
+    the memory is upcast in blocks of columns of at most
+    ``_MEMORY_MM_CHUNK`` elements, so the inputs are not rounded.
+
+    Args:
+        input (Tensor[N, K]): Features or gradients, usually float32.
+        memory (Tensor[K, M]): Memory bank or its transpose.
+
+    Returns:
+        Tensor[N, M]: The product in the dtype of ``input``.
+    """
+    if memory.dtype == input.dtype:
+        return input.mm(memory)
+    if memory.is_cuda:
+        return input.to(memory.dtype).mm(memory).to(input.dtype)
+    dtype = torch.promote_types(input.dtype, accumulation_dtype(memory))
+    upcast = input.to(dtype)
+    output = upcast.new_empty((input.size(0), memory.size(1)))
+    step = max(1, _MEMORY_MM_CHUNK // max(1, memory.size(0)))
+    for start in range(0, memory.size(1), step):
+        end = start + step
+        output[:, start:end] = upcast.mm(memory[:, start:end].to(dtype))
+    return output.to(input.dtype)
+
+
+def momentum_update_(lookup_table, features, labels, momentum):
+    """Batched in-place momentum update of an OIM lookup table.
+
+    This is equivalent to running
+    ``lookup_table[y] = momentum * lookup_table[y] + (1 - momentum) * x``
+    for every ``(x, y)`` in ``zip(features, labels)`` in order. Repeated ids
+    are folded in closed form: with ``n`` occurrences of an id the old row is
+    weighted by ``momentum ** n`` and its k-th feature by
+    ``(1 - momentum) * momentum ** (n - 1 - k)``. Half-precision tables are
+    updated in float32 and rounded once.
+
+    Args:
+        lookup_table (Tensor[P, C]): Lookup table, updated in place.
+        features (Tensor[N, C]): Features to write.
+        labels (Tensor[N]): Row of ``lookup_table`` for each feature.
+        momentum (float | Tensor): Momentum of the running average.
+    """
+    num = labels.numel()
+    if num == 0:
+        return
+    labels = labels.long()
+    device = labels.device
+    # Sort by (label, position) so that occurrences of the same id are
+    # contiguous and keep their original order.
+    keys = labels * num + torch.arange(num, device=device)
+    order = keys.argsort()
+    sorted_labels = labels[order]
+    uniq_labels, inverse, counts = torch.unique_consecutive(
+        sorted_labels, return_inverse=True, return_counts=True)
+    starts = counts.cumsum(0) - counts
+    rank = torch.arange(num, device=device) - starts[inverse]
+
+    dtype = accumulation_dtype(lookup_table)
+    momentum = torch.as_tensor(momentum, dtype=dtype, device=device)
+    weights = (1. - momentum) * momentum.pow(
+        (counts[inverse] - 1 - rank).to(dtype))
+    acc = lookup_table[uniq_labels].to(dtype) * momentum.pow(
+        counts.to(dtype))[:, None]
+    acc.index_add_(0, inverse,
+                   features[order].to(dtype) * weights[:, None])
+    lookup_table[uniq_labels] = acc.to(lookup_table.dtype)
+
+
+def circular_enqueue_(queue, tail, features, num_dims=None):
+    """Batched in-place write of features into a circular queue.
+
+    This is equivalent to writing the features one by one at ``tail`` and
+    advancing ``tail`` with wrap-around. When more features than queue slots
+    are given only the last ``queue.size(0)`` of them survive, exactly as
+    with the sequential writes.
+
+    Args:
+        queue (Tensor[Q, C]): Circular queue, updated in place.
+        tail (Tensor): 0-dim tensor holding the next write position,
+            advanced in place.
+        features (Tensor[N, C]): Features to enqueue in order.
+        num_dims (int, optional): Only write the first ``num_dims``
+            channels of each feature. Defaults to all channels.
+    """
+    num = features.size(0)
+    if num == 0:
+        return
+    queue_size = queue.size(0)
+    skip = max(num - queue_size, 0)
+    features = features[skip:]
+    index = (tail + skip + torch.arange(
+        features.size(0), device=queue.device)) % queue_size
+    if num_dims is None:
+        queue[index] = features.to(queue.dtype)
+    else:
+        queue[index, :num_dims] = features[:, :num_dims].to(queue.dtype)
+    tail.copy_((tail + num) % queue_size)
+
+
+def priority_enqueue_(queue, queue_omega, features, omegas, num_dims=None):
+    """Batched in-place write of features into a queue ranked by omega.
+
+    This is equivalent to running, for every ``(x, omega)`` in
+    ``zip(features, omegas)`` in order, ``i = queue_omega.argmin()`` and
+    ``queue[i], queue_omega[i] = x, omega`` unless
+    ``omega < queue_omega.min()``. At most ``len(omegas)`` slots can be
+    replaced and they are always among the ``len(omegas)`` lowest omegas, so
+    these are sorted once on the device and the replacements are replayed on
+    a heap of their ``(omega, slot)`` pairs, whose order is that of
+    ``argmin``. The winning features are then written with a single indexed
+    copy, which gives the same end state, ties included, with two host
+    transfers instead of a sync per sample.
+
+    Args:
+        queue (Tensor[Q, C]): Queue, updated in place.
+        queue_omega (Tensor[Q]): Omega of each slot, updated in place.
+        features (Tensor[N, C]): Candidate features in order.
+        omegas (Tensor[N]): Omega of each candidate.
+        num_dims (int, optional): Only write the first ``num_dims``
+            channels of each feature. Defaults to all channels.
+    """
+    num = omegas.numel()
+    if num == 0:
+        return
+    omegas = omegas.to(queue_omega.dtype)
+    num_slots = min(num, queue_omega.numel())
+    lowest, slots = torch.sort(queue_omega, stable=True)
+    # a sorted list is a valid heap
+    heap = list(
+        zip(lowest[:num_slots].tolist(), slots[:num_slots].tolist()))
+    writes = {}
+    for i, omega in enumerate(omegas.tolist()):
+        if omega < heap[0][0]:
+            continue
+        slot = heap[0][1]
+        heapq.heapreplace(heap, (omega, slot))
+        writes[slot] = i
+    if not writes:
+        return
+    device = queue_omega.device
+    slots = torch.tensor(list(writes.keys()), device=device)
+    inds = torch.tensor(list(writes.values()), device=device)
+    if num_dims is None:
+        queue[slots] = features[inds].to(queue.dtype)
+    else:
+        queue[slots, :num_dims] = features[inds, :num_dims].to(queue.dtype)
+    queue_omega[slots] = omegas[inds]
+
+
+def normalized_momentum_update_(lookup_table, features, labels, momentum):
+    """Batched in-place momentum update of a lookup table with unit rows.
+
+    This is equivalent to running
+    ``lookup_table[y] = momentum * lookup_table[y] + (1 - momentum) * x``
+    followed by ``lookup_table[y] /= lookup_table[y].norm()`` for every
+    ``(x, y)`` in ``zip(features, labels)`` in order. The renormalization
+    prevents a closed form, so the k-th occurrences of all ids are applied
+    together in the k-th of ``max(counts)`` rounds. Rows of half-precision
+    tables are updated and renormalized in float32 before being rounded.
+
+    Args:
+        lookup_table (Tensor[P, C]): Lookup table, updated in place.
+        features (Tensor[N, C]): Features to write.
+        labels (Tensor[N]): Row of ``lookup_table`` for each feature.
+        momentum (float | Tensor): Momentum of the running average.
+    """
+    num = labels.numel()
+    if num == 0:
+        return
+    labels = labels.long()
+    device = labels.device
+    keys = labels * num + torch.arange(num, device=device)
+    order = keys.argsort()
+    sorted_labels = labels[order]
+    dtype = accumulation_dtype(lookup_table)
+    features = features[order].to(dtype)
+    _, counts = torch.unique_consecutive(sorted_labels, return_counts=True)
+    starts = counts.cumsum(0) - counts
+    for k in range(int(counts.max())):
+        inds = starts[counts > k] + k
+        rows = sorted_labels[inds]
+        updated = (momentum * lookup_table[rows].to(dtype) +
+                   (1. - momentum) * features[inds])
+        updated = updated / updated.norm(dim=1, keepdim=True).clamp(min=1e-12)
+        lookup_table[rows] = updated.to(lookup_table.dtype)
+
+
+def gather_across_ranks(features, pid_labels):
+    """Gather the features and person ids of all ranks.
+
+    Ranks may hold different numbers of samples, so they are padded to the
+    largest one for ``all_gather`` and trimmed afterwards. The result is
+    concatenated in rank order and thus identical on every rank. Tensors
+    stay on their device, which makes this usable with both NCCL and Gloo.
+
+    Args:
+        features (Tensor[N, C]): Local features.
+        pid_labels (Tensor[N]): Local person ids.
+
+    Returns:
+        tuple[Tensor]: Features and person ids of all ranks. The inputs are
+            returned as they are when not running distributed.
+    """
+    world_size = get_world_size()
+    if world_size == 1:
+        return features, pid_labels
+
+    features = features.detach().contiguous()
+    pid_labels = pid_labels.contiguous()
+    local_size = torch.tensor([features.size(0)], device=features.device)
+    size_list = [torch.zeros_like(local_size) for _ in range(world_size)]
+    dist.all_gather(size_list, local_size)
+    size_list = torch.cat(size_list).tolist()
+    max_size = max(size_list)
+
+    gathered = []
+    for tensor in (features, pid_labels):
+        padded = tensor.new_zeros((max_size, ) + tensor.shape[1:])
+        padded[:tensor.size(0)] = tensor
+        tensor_list = [torch.empty_like(padded) for _ in range(world_size)]
+        dist.all_gather(tensor_list, padded)
+        gathered.append(
+            torch.cat([
+                part[:size] for part, size in zip(tensor_list, size_list)
+            ]))
+    return tuple(gathered)
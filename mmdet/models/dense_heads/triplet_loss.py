@@ -1,7 +1,6 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import numpy as np
 
 class TripletLossFilter(nn.Module):
     """Triplet loss with hard positive/negative mining.
@@ -13,11 +12,14 @@ class TripletLossFilter(nn.Module):
 
     Args:
         margin (float): margin for triplet.
+        chunk_size (int, optional): if set, mine the hardest pairs over
+            blocks of ``chunk_size`` anchors to bound memory for large
+            batches. Default: None.
     """
-    def __init__(self, margin=0.3):
+    def __init__(self, margin=0.3, chunk_size=None):
         super(TripletLossFilter, self).__init__()
         self.margin = margin
-        self.ranking_loss = nn.MarginRankingLoss(margin=margin)
+        self.chunk_size = chunk_size
 
     def forward(self, inputs, targets):
         """
@@ -26,49 +28,74 @@ class TripletLossFilter(nn.Module):
             inputs: feature matrix with shape (batch_size, feat_dim)
             targets: ground truth labels with shape (num_classes)
         """
-        #print(inputs.shape, targets.shape)
-        inputs_new = []
-        targets_new = []
-        targets_value = []
-        for i in range(len(targets)):
-            if targets[i] == -1:
-                continue
-            else:
-                inputs_new.append(inputs[i])
-                targets_new.append(targets[i])
-                targets_value.append(targets[i].cpu().numpy().item())
-        if len(set(targets_value)) < 2:
-            tmp_loss = torch.zeros(1)
-            tmp_loss = tmp_loss[0]
-            tmp_loss = tmp_loss.to(targets.device)
-            return tmp_loss
-        #print(targets_value)
-        inputs_new = torch.stack(inputs_new)
-        targets_new = torch.stack(targets_new)
-        #print(inputs_new.shape, targets_new.shape)
-        n = inputs_new.size(0)
+        # Noise samples are masked out instead of filtered, so that the loss
+        # is computed in a single pass without any host synchronization.
+        valid = targets != -1
+        if self.chunk_size is None:
+            dist = self._pairwise_dist(inputs, inputs)
+            dist_ap, dist_an = self._hard_mining(dist, targets, targets,
+                                                 valid, valid)
+        else:
+            dist_ap, dist_an = self._chunked_hard_mining(
+                inputs, targets, valid)
+
+        # Anchors without any negative (less than two identities in the
+        # batch) and noise anchors do not contribute to the loss.
+        keep = valid & torch.isfinite(dist_an)
+        loss = (dist_ap - dist_an + self.margin).clamp(min=0)
+        loss = torch.where(keep, loss, torch.zeros_like(loss))
+        return loss.sum() / keep.sum().clamp(min=1)
+
+    @staticmethod
+    def _pairwise_dist(x, y):
         # Compute pairwise distance, replace by the official when merged
-        dist = torch.pow(inputs_new, 2).sum(dim=1, keepdim=True).expand(n, n)
-        dist = dist + dist.t()
-        dist.addmm_(1, -2, inputs_new, inputs_new.t())
-        dist = dist.clamp(min=1e-12).sqrt()  # for numerical stability
-        #print("Triplet ", dist)
-        # For each anchor, find the hardest positive and negative
-        mask = targets_new.expand(n, n).eq(targets_new.expand(n, n).t())
-        #print(mask)
-        dist_ap, dist_an = [], []
-        for i in range(n):
-            dist_ap.append(dist[i][mask[i]].max())
-            dist_an.append(dist[i][mask[i] == 0].min())
-        #dist_ap = torch.cat(dist_ap)
-        #dist_an = torch.cat(dist_an)
-        dist_ap = torch.stack(dist_ap)
-        dist_an = torch.stack(dist_an)
-        # Compute ranking hinge loss
-        y = torch.ones_like(dist_an)
-        #y = dist_an.data.new()
-        #y.resize_as_(dist_an.data)
-        #y.fill_(1)
-        #y = Variable(y)
-        loss = self.ranking_loss(dist_an, dist_ap, y)
-        return loss
\ No newline at end of file
+        dist = torch.pow(x, 2).sum(dim=1, keepdim=True) + \
+            torch.pow(y, 2).sum(dim=1, keepdim=True).t()
+        dist = torch.addmm(dist, x, y.t(), beta=1, alpha=-2)
+        return dist.clamp(min=1e-12).sqrt()  # for numerical stability
+
+    @staticmethod
+    def _hard_mining(dist, anchor_targets, targets, anchor_valid, valid):
+        """For each anchor, find the hardest positive and negative."""
+        same = anchor_targets[:, None] == targets[None, :]
+        pair_valid = anchor_valid[:, None] & valid[None, :]
+        dist_ap = dist.masked_fill(~(same & pair_valid),
+                                   float('-inf')).max(dim=1)[0]
+        dist_an = dist.masked_fill(~(~same & pair_valid),
+                                   float('inf')).min(dim=1)[0]
+        return dist_ap, dist_an
+
+    def _chunked_hard_mining(self, inputs, targets, valid):
+        """Hard mining with at most ``chunk_size`` rows of the distance matrix
+        alive at once.
+
+        The hardest pairs are searched without gradient, then only the
+        selected distances are recomputed for backpropagation, so memory is
+        bounded by ``chunk_size * n`` instead of ``n * n``.
+        """
+        n = inputs.size(0)
+        pos_idx = inputs.new_zeros(n, dtype=torch.long)
+        neg_idx = inputs.new_zeros(n, dtype=torch.long)
+        has_neg = valid.new_zeros(n)
+        with torch.no_grad():
+            for start in range(0, n, self.chunk_size):
+                end = min(start + self.chunk_size, n)
+                dist = self._pairwise_dist(inputs[start:end], inputs)
+                same = targets[start:end, None] == targets[None, :]
+                pair_valid = valid[start:end, None] & valid[None, :]
+                pos_idx[start:end] = dist.masked_fill(
+                    ~(same & pair_valid), float('-inf')).argmax(dim=1)
+                dist_an, neg_idx[start:end] = dist.masked_fill(
+                    ~(~same & pair_valid), float('inf')).min(dim=1)
+                has_neg[start:end] = torch.isfinite(dist_an)
+
+        dist_ap = self._paired_dist(inputs, inputs[pos_idx])
+        dist_an = self._paired_dist(inputs, inputs[neg_idx])
+        dist_an = dist_an.masked_fill(~has_neg, float('inf'))
+        return dist_ap, dist_an
+
+    @staticmethod
+    def _paired_dist(x, y):
+        dist = torch.pow(x, 2).sum(dim=1) + torch.pow(y, 2).sum(dim=1) - \
+            2 * (x * y).sum(dim=1)
+        return dist.clamp(min=1e-12).sqrt()
@@ -2,17 +2,21 @@ import torch
 import torch.nn as nn
 from torch.autograd import Function
 
+from .oim_utils import (circular_enqueue_, gather_across_ranks,
+                        get_memory_dtype, memory_mm)
+
 
 class UnlabeledMatching(Function):
     @staticmethod
-    def forward(ctx, features, pid_labels, queue, tail):
+    def forward(ctx, features, pid_labels, queue, tail, sync_memory=False):
         # The queue/tail can't be saved with ctx.save_for_backward(), as we would
         # modify the variable which has the same memory address in backward()
         ctx.save_for_backward(features, pid_labels)
         ctx.queue = queue
         ctx.tail = tail
+        ctx.sync_memory = sync_memory
 
-        scores = features.mm(queue.t())
+        scores = memory_mm(features, queue.t())
         return scores
 
     @staticmethod
@@ -23,19 +27,14 @@ class UnlabeledMatching(Function):
 
         grad_feats = None
         if ctx.needs_input_grad[0]:
-            grad_feats = grad_output.mm(queue.data)
+            grad_feats = memory_mm(grad_output, queue.data)
 
         # Update circular queue, but not by standard backpropagation with gradients
-        for indx, label in enumerate(pid_labels):
-            if label == -1:
-                #queue[tail, :32] = features[indx, :32]
-                queue[tail, :64] = features[indx, :64]
-                #queue[tail, :] = features[indx, :]
-                tail += 1
-                if tail >= queue.size(0):
-                    tail -= queue.size(0)
+        if ctx.sync_memory:
+            features, pid_labels = gather_across_ranks(features, pid_labels)
+        circular_enqueue_(queue, tail, features[pid_labels == -1], num_dims=64)
 
-        return grad_feats, None, None, None
+        return grad_feats, None, None, None, None
 
 
 class UnlabeledMatchingLayer(nn.Module):
@@ -43,15 +42,29 @@ class UnlabeledMatchingLayer(nn.Module):
     Unlabeled matching of OIM loss function.
     """
 
-    def __init__(self, queue_size=5000, feat_len=256):
+    def __init__(self,
+                 queue_size=5000,
+                 feat_len=256,
+                 sync_memory=False,
+                 memory_dtype=None):
         """
         Args:
             queue_size (int): Size of the queue saving the features of unlabeled persons.
             feat_len (int): Length of the feature extracted by the network.
+            sync_memory (bool): Enqueue the features of all ranks in
+                distributed training, which keeps the queue identical on
+                every rank.
+            memory_dtype (str, optional): Storage dtype of the queue,
+                'float16' or 'bfloat16' halve its size. Scores are still
+                computed in float32. Defaults to float32.
         """
         super(UnlabeledMatchingLayer, self).__init__()
-        self.register_buffer("queue", torch.zeros(queue_size, feat_len))
+        self.register_buffer(
+            "queue",
+            torch.zeros(
+                queue_size, feat_len, dtype=get_memory_dtype(memory_dtype)))
         self.register_buffer("tail", torch.tensor(0))
+        self.sync_memory = sync_memory
 
     def forward(self, features, pid_labels):
         """
@@ -63,7 +76,8 @@ class UnlabeledMatchingLayer(nn.Module):
             scores (Tensor[N, queue_size]): Unlabeled matching scores, namely the similarities
                                             between proposals and unlabeled persons.
         """
-        scores = UnlabeledMatching.apply(features, pid_labels, self.queue, self.tail)
+        scores = UnlabeledMatching.apply(features, pid_labels, self.queue,
+                                         self.tail, self.sync_memory)
         return scores
 
 
@@ -76,7 +90,7 @@ class UnlabeledMatchingFull(Function):
         ctx.queue = queue
         ctx.tail = tail
 
-        scores = features.mm(queue.t())
+        scores = memory_mm(features, queue.t())
         return scores
 
     @staticmethod
@@ -87,16 +101,10 @@ class UnlabeledMatchingFull(Function):
 
         grad_feats = None
         if ctx.needs_input_grad[0]:
-            grad_feats = grad_output.mm(queue.data)
+            grad_feats = memory_mm(grad_output, queue.data)
 
         # Update circular queue, but not by standard backpropagation with gradients
-        for indx, label in enumerate(pid_labels):
-            if label == -1:
-                queue[tail] = features[indx]
-                #queue[tail, :] = features[indx, :]
-                tail += 1
-                if tail >= queue.size(0):
-                    tail -= queue.size(0)
+        circular_enqueue_(queue, tail, features[pid_labels == -1])
 
         return grad_feats, None, None, None
 
@@ -105,14 +113,20 @@ class UnlabeledMatchingFullLayer(nn.Module):
     Unlabeled matching of OIM loss function.
     """
 
-    def __init__(self, queue_size=5000, feat_len=256):
+    def __init__(self, queue_size=5000, feat_len=256, memory_dtype=None):
         """
         Args:
             queue_size (int): Size of the queue saving the features of unlabeled persons.
             feat_len (int): Length of the feature extracted by the network.
+            memory_dtype (str, optional): Storage dtype of the queue,
+                'float16' or 'bfloat16' halve its size. Scores are still
+                computed in float32. Defaults to float32.
         """
         super(UnlabeledMatchingFullLayer, self).__init__()
-        self.register_buffer("queue", torch.zeros(queue_size, feat_len))
+        self.register_buffer(
+            "queue",
+            torch.zeros(
+                queue_size, feat_len, dtype=get_memory_dtype(memory_dtype)))
         self.register_buffer("tail", torch.tensor(0))
 
     def forward(self, features, pid_labels):
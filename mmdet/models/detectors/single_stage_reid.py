@@ -1,8 +1,9 @@
 import torch
 import torch.nn as nn
 
-from mmdet.core import bbox2result_reid
+from mmdet.core import ReidResultPacker, merge_aug_reid_results
 from ..builder import DETECTORS, build_backbone, build_head, build_neck
+from ..utils import group_aug_imgs
 from .base import BaseDetector
 
 
@@ -28,6 +29,9 @@ class SingleStageReidDetector(BaseDetector):
         bbox_head.update(train_cfg=train_cfg)
         bbox_head.update(test_cfg=test_cfg)
         self.bbox_head = build_head(bbox_head)
+        # the ReID features of the heads are as wide as their inputs
+        self.result_packer = ReidResultPacker(
+            self.bbox_head.num_classes, feat_dim=self.bbox_head.in_channels)
         self.train_cfg = train_cfg
         self.test_cfg = test_cfg
         self.init_weights(pretrained=pretrained)
@@ -120,12 +124,47 @@ class SingleStageReidDetector(BaseDetector):
         if torch.onnx.is_in_onnx_export():
             return bbox_list
 
-        bbox_results = [
-            bbox2result_reid(det_bboxes, det_labels, reid_feats, self.bbox_head.num_classes)
-            for det_bboxes, det_labels, reid_feats in bbox_list
-        ]
+        bbox_results = self.result_packer(bbox_list)
         return bbox_results
 
     def aug_test(self, imgs, img_metas, rescale=False):
-        """Test function with test time augmentation."""
-        raise NotImplementedError
+        """Test function with test time augmentation.
+
+        The augmentations of the same shape are run in one batched forward.
+        Their detections are merged by NMS in the original image space and the
+        ReID embedding of every kept box is fused over its IoU-matched boxes
+        in the other augmentations, see :func:`merge_aug_reid_results`.
+
+        Args:
+            imgs (list[Tensor]): Images of every augmentation, each of shape
+                (N, C, H, W).
+            img_metas (list[list[dict]]): Meta information of every
+                augmentation and image.
+            rescale (bool, optional): Whether to rescale the results.
+                Defaults to False.
+
+        Returns:
+            list[list[np.ndarray]]: BBox results of each image and classes,
+                with the fused embeddings.
+        """
+        num_imgs = len(img_metas[0])
+        aug_bbox_lists = [None] * len(imgs)
+        for aug_inds, aug_imgs in group_aug_imgs(imgs):
+            outs = self.bbox_head(self.extract_feat(aug_imgs))
+            bbox_list = self.bbox_head.get_bboxes(
+                *outs, [meta for i in aug_inds for meta in img_metas[i]],
+                rescale=False)
+            for j, i in enumerate(aug_inds):
+                aug_bbox_lists[i] = bbox_list[j * num_imgs:(j + 1) * num_imgs]
+
+        merged_list = []
+        for i in range(num_imgs):
+            det_bboxes, det_labels, det_feats = merge_aug_reid_results(
+                [bbox_list[i] for bbox_list in aug_bbox_lists],
+                [metas[i] for metas in img_metas],
+                self.test_cfg)
+            if not rescale:
+                det_bboxes[:, :4] *= det_bboxes.new_tensor(
+                    img_metas[0][i]['scale_factor'])
+            merged_list.append((det_bboxes, det_labels, det_feats))
+        return self.result_packer(merged_list)
@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 
-from mmdet.core import bbox2result_reid
+from mmdet.core import ReidResultPacker
 from ..builder import DETECTORS, build_backbone, build_head, build_neck
 from .base import BaseDetector
 
@@ -28,6 +28,9 @@ class SingleStageReidFpnDetector(BaseDetector):
         bbox_head.update(train_cfg=train_cfg)
         bbox_head.update(test_cfg=test_cfg)
         self.bbox_head = build_head(bbox_head)
+        # the ReID features of the heads are as wide as their inputs
+        self.result_packer = ReidResultPacker(
+            self.bbox_head.num_classes, feat_dim=self.bbox_head.in_channels)
         self.train_cfg = train_cfg
         self.test_cfg = test_cfg
         self.init_weights(pretrained=pretrained)
@@ -122,10 +125,7 @@ class SingleStageReidFpnDetector(BaseDetector):
         if torch.onnx.is_in_onnx_export():
             return bbox_list
 
-        bbox_results = [
-            bbox2result_reid(det_bboxes, det_labels, reid_feats, self.bbox_head.num_classes)
-            for det_bboxes, det_labels, reid_feats in bbox_list
-        ]
+        bbox_results = self.result_packer(bbox_list)
         return bbox_results
 
     def aug_test(self, imgs, img_metas, rescale=False):
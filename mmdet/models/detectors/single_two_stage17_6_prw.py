@@ -1,19 +1,18 @@
 import torch
 import torch.nn as nn
 import numpy as np
-from collections import defaultdict
 
 import torch.nn.functional as F
 # from mmdet.core import bbox2result, bbox2roi, build_assigner, build_sampler
 from ..builder import DETECTORS, build_backbone, build_head, build_neck
 from .base import BaseDetector
-from mmdet.core import bbox2result_reid
+from mmdet.core import ReidResultPacker, bbox_mapping, merge_aug_reid_results
 
 from ..roi_heads.bbox_heads.oim_nae_new import OIMLoss
 from ..dense_heads.labeled_matching_layer_queue import LabeledMatchingLayerQueue
 from ..dense_heads.unlabeled_matching_layer import UnlabeledMatchingLayer
 from ..dense_heads.triplet_loss import TripletLossFilter
-from ..utils import MINE
+from ..utils import MINE, group_aug_imgs, matched_identity_centroids
 
 @DETECTORS.register_module()
 class SingleTwoStageDetector176PRW(BaseDetector):
@@ -55,6 +54,9 @@ class SingleTwoStageDetector176PRW(BaseDetector):
         bbox_head.update(train_cfg=train_cfg)
         bbox_head.update(test_cfg=test_cfg)
         self.bbox_head = build_head(bbox_head)
+        # the ReID features of the heads are as wide as their inputs
+        self.result_packer = ReidResultPacker(
+            self.bbox_head.num_classes, feat_dim=self.bbox_head.in_channels)
 
         self.train_cfg = train_cfg
         self.test_cfg = test_cfg
@@ -229,43 +231,10 @@ class SingleTwoStageDetector176PRW(BaseDetector):
         pids_roi = feats_pids_roi["gt_pids"]
         feats_fcos = feats_pids["pos_reid"]
         pids_fcos = feats_pids["pos_reid_ids"]
-        dic1 = defaultdict(list)
-        dic2 = defaultdict(list)
-
-        for i in range(len(pids_roi)):
-            if pids_roi[i] < 0:
-                continue
-            else:
-                targets1_value = pids_roi[i].cpu().numpy().item()
-                dic1[targets1_value].append(feats_roi[i])
-        
-        for i in range(len(pids_fcos)):
-            if pids_fcos[i] < 0:
-                continue
-            else:
-                targets2_value = pids_fcos[i].cpu().numpy().item()
-                dic2[targets2_value].append(feats_fcos[i])
-        
-        all_feats1 = []
-        all_feats2 = []
-        for key, val in dic1.items():
-            if key in dic2:
-                val2 = dic2[key]
-                feat1 = sum(val)/len(val)
-                # print(feat1.shape)
-                mean1 = F.normalize(feat1.unsqueeze(0))
-                # mean1 = feat1.unsqueeze(0)
-                feat2 = sum(val2)/len(val2)
-                mean2 = F.normalize(feat2.unsqueeze(0))
-                # mean2 = feat2.unsqueeze(0)
-                all_feats1.append(mean1)
-                all_feats2.append(mean2)
-
-        if len(all_feats1) > 0 and len(all_feats2) >0:
-            all_feats1 = torch.cat(all_feats1)
-            all_feats2 = torch.cat(all_feats2)
-            # print(all_feats1.shape, all_feats2.shape)
+        all_feats1, all_feats2 = matched_identity_centroids(
+            feats_roi, pids_roi, feats_fcos, pids_fcos)
 
+        if len(all_feats1) > 0:
             all_feats1_d = all_feats1.detach()
             all_feats2_d = all_feats2.detach()
             mi_loss = dict()
@@ -290,77 +259,176 @@ class SingleTwoStageDetector176PRW(BaseDetector):
 
         return losses
 
+    def simple_test_query(self, img, img_metas, proposals, rescale=False):
+        """Extract ReID features of given query boxes with the RoI head.
+
+        Only the backbone and the RoI feature path are run, the FCOS branch
+        and the neck are skipped.
+
+        Args:
+            img (Tensor): Input images of shape (N, C, H, W).
+            img_metas (list[dict]): List of image information.
+            proposals (list[Tensor]): Query boxes of each image in the
+                resized image space, each of shape (n, 4).
+            rescale (bool): Whether to rescale the boxes to the original
+                image space. Defaults to False.
+
+        Returns:
+            list[list[np.ndarray]]: For each image, an array of shape
+                (n, 5 + D) holding the query boxes, a score of 1 and the
+                ReID feature of every box.
+        """
+        xb = [self.backbone(img)[2]]
+        _, det_features = self.roi_head.simple_test(
+            xb, proposals, img_metas, rescale=rescale, use_rpn=False)
+        det_features = det_features.cpu().numpy()
+
+        results = []
+        start = 0
+        for boxes, img_meta in zip(proposals, img_metas):
+            boxes = boxes[:, :4]
+            if rescale:
+                boxes = boxes / boxes.new_tensor(img_meta['scale_factor'])
+            num_boxes = boxes.size(0)
+            scores = np.ones((num_boxes, 1), dtype=np.float32)
+            feats = det_features[start:start + num_boxes]
+            dets = np.concatenate([boxes.cpu().numpy(), scores, feats], axis=1)
+            results.append([dets.astype(np.float32)])
+            start += num_boxes
+        return results
+
     def simple_test(self, img, img_metas, proposals=None, rescale=False):
-        """Test without augmentation."""
+        """Test without augmentation.
+
+        The FCOS detections of all images in the batch are pooled by the RoI
+        head in a single pass to get their RoI ReID features.
+
+        When ``proposals`` are given, the ReID features of these boxes are
+        returned instead, see :meth:`simple_test_query`.
+
+        Returns:
+            tuple[list]: Results of the FCOS branch, one list of per-class
+                arrays of shape (n, 5 + D) per image, and the same
+                detections with the RoI features, one array per image.
+        """
         assert self.with_bbox, 'Bbox head must be implemented.'
+        if proposals is not None:
+            return self.simple_test_query(img, img_metas, proposals, rescale)
 
         xb, xn = self.extract_feat(img)
 
-        outs_n = self.bbox_head(xn, proposals)
+        outs_n = self.bbox_head(xn)
         bbox_list = self.bbox_head.get_bboxes(
             *outs_n, img_metas, rescale=rescale)
         # skip post-processing when exporting to ONNX
         if torch.onnx.is_in_onnx_export():
             return bbox_list
 
-        bbox_results_n = [
-            bbox2result_reid(det_bboxes, det_labels, reid_feats, self.bbox_head.num_classes)
-            for det_bboxes, det_labels, reid_feats in bbox_list
-        ]
-
-        proposals = []
-        #print('scale_factor')
-        #print(img_metas[0]['scale_factor'])
-        tmp_sf = torch.FloatTensor(np.append(img_metas[0]['scale_factor'], 1)).to('cuda')
-        #print(tmp_sf)
-        for det_bboxes, det_labels, reid_feats in bbox_list:
-            #print("det_bboxes")
-            #print(det_bboxes.shape)
-            #print(det_bboxes)
-            proposals.append(torch.mul(det_bboxes, tmp_sf))
-            
-
-        if proposals is None:
-            proposal_list = self.rpn_head.simple_test_rpn(xb, img_metas)
-        else:
-            proposal_list = proposals
-        #print("img_metas")
-        #print(img_metas)
-        #print("proposal_list")
-        #print(proposal_list[0].shape)
-        #print(proposal_list)
-
-        bbox_results_b, det_features = self.roi_head.simple_test(
+        bbox_results_n = self.result_packer(bbox_list)
+
+        # the RoI head pools boxes in the resized image space
+        proposal_list = []
+        for (det_bboxes, _, _), img_meta in zip(bbox_list, img_metas):
+            det_bboxes = det_bboxes[:, :4]
+            if rescale:
+                det_bboxes = det_bboxes * det_bboxes.new_tensor(
+                    img_meta['scale_factor'])
+            proposal_list.append(det_bboxes)
+        num_dets = [len(det_bboxes) for det_bboxes in proposal_list]
+        if sum(num_dets) == 0:
+            return bbox_results_n, [
+                result_n[0].copy() for result_n in bbox_results_n
+            ]
+
+        _, det_features = self.roi_head.simple_test(
             xb, proposal_list, img_metas, rescale=rescale, use_rpn=False)
+        det_features = np.split(det_features.cpu().numpy(),
+                                np.cumsum(num_dets)[:-1])
 
-        #print("results_b")
-        #print("det_features")
-        #print(len(det_features))
-        #print(det_features.shape)
         bbox_results_b = []
-        #print("bbox_results_n")
-        #print(bbox_results_n[0][0].shape)
-        #print(bbox_results_n[0][0][:, 5:])
-        bbox_results_b.append(bbox_results_n[0][0].copy())
-        bbox_results_b[0][:, 5:] = det_features.cpu().numpy()
-        #print(bbox_results_b[0][:, 5:])
-        #print(bbox_results_n[0][0][:, 5:])
-        
-        #print(len(bbox_results_b))
-        #print(bbox_results_b[0].shape)
-        #print(bbox_results_b[0][:,:5])
-
+        for result_n, feats in zip(bbox_results_n, det_features):
+            dets = result_n[0].copy()
+            dets[:, 5:] = feats
+            bbox_results_b.append(dets)
         return bbox_results_n, bbox_results_b
 
     def aug_test(self, imgs, img_metas, rescale=False):
         """Test with augmentations.
 
-        If rescale is False, then returned bboxes and masks will fit the scale
-        of imgs[0].
+        The augmentations of the same shape are run in one batched forward.
+        The FCOS detections are merged by NMS in the original image space and
+        their embeddings are fused over the IoU-matched boxes of the other
+        augmentations, see :func:`merge_aug_reid_results`. The merged boxes
+        are then pooled by the RoI head in every augmentation and their RoI
+        embeddings are averaged.
+
+        If rescale is False, then returned bboxes will fit the scale of
+        imgs[0].
+
+        Returns:
+            tuple[list]: Same as :meth:`simple_test`.
         """
-        # recompute feats to save memory
-        x = self.extract_feats(imgs)
-        proposal_list = self.rpn_head.aug_test_rpn(x, img_metas)
-        return self.roi_head.aug_test(
-            x, proposal_list, img_metas, rescale=rescale)
+        num_augs, num_imgs = len(img_metas), len(img_metas[0])
+        aug_feats = []
+        aug_bbox_lists = [None] * num_augs
+        for aug_inds, aug_imgs in group_aug_imgs(imgs):
+            xb, xn = self.extract_feat(aug_imgs)
+            outs_n = self.bbox_head(xn)
+            bbox_list = self.bbox_head.get_bboxes(
+                *outs_n, [meta for i in aug_inds for meta in img_metas[i]],
+                rescale=False)
+            for j, i in enumerate(aug_inds):
+                aug_bbox_lists[i] = bbox_list[j * num_imgs:(j + 1) * num_imgs]
+            aug_feats.append((aug_inds, xb))
+
+        merged_list = [
+            merge_aug_reid_results(
+                [bbox_list[i] for bbox_list in aug_bbox_lists],
+                [metas[i] for metas in img_metas], self.test_cfg)
+            for i in range(num_imgs)
+        ]
+        # the merged boxes in the space of every augmentation
+        aug_proposal_lists = [[
+            bbox_mapping(merged_list[i][0][:, :4], meta['img_shape'],
+                         meta['scale_factor'], meta['flip'],
+                         meta['flip_direction'])
+            for i, meta in enumerate(metas)
+        ] for metas in img_metas]
+        if not rescale:
+            for (det_bboxes, _, _), img_meta in zip(merged_list,
+                                                    img_metas[0]):
+                det_bboxes[:, :4] *= det_bboxes.new_tensor(
+                    img_meta['scale_factor'])
+        bbox_results_n = self.result_packer(merged_list)
+
+        num_dets = [len(det_bboxes) for det_bboxes, _, _ in merged_list]
+        if sum(num_dets) == 0:
+            return bbox_results_n, [
+                result_n[0].copy() for result_n in bbox_results_n
+            ]
+
+        aug_det_features = [None] * num_augs
+        for aug_inds, xb in aug_feats:
+            _, det_features = self.roi_head.simple_test(
+                xb, [
+                    proposals for i in aug_inds
+                    for proposals in aug_proposal_lists[i]
+                ], [meta for i in aug_inds for meta in img_metas[i]],
+                rescale=False,
+                use_rpn=False)
+            det_features = F.normalize(det_features).view(
+                len(aug_inds), sum(num_dets), -1)
+            for j, i in enumerate(aug_inds):
+                aug_det_features[i] = det_features[j]
+        det_features = torch.stack(aug_det_features).mean(dim=0)
+        det_features = np.split(
+            F.normalize(det_features).cpu().numpy(),
+            np.cumsum(num_dets)[:-1])
+
+        bbox_results_b = []
+        for result_n, feats in zip(bbox_results_n, det_features):
+            dets = result_n[0].copy()
+            dets[:, 5:] = feats
+            bbox_results_b.append(dets)
+        return bbox_results_n, bbox_results_b
 
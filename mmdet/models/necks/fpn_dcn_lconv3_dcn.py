@@ -46,6 +46,11 @@ class FPNDcnLconv3Dcn(nn.Module):
             Default: None.
         upsample_cfg (dict): Config dict for interpolate layer.
             Default: `dict(mode='nearest')`
+        active_levels (tuple[int], optional): Output levels computed in
+            training, e.g. the levels that can be assigned positives by the
+            head. Only these levels are returned and the fpn convs of the
+            other levels are not built. They must include level 0, the only
+            output in testing. Default: None (all levels).
 
     Example:
         >>> import torch
@@ -76,7 +81,8 @@ class FPNDcnLconv3Dcn(nn.Module):
                  conv_cfg=None,
                  norm_cfg=None,
                  act_cfg=None,
-                 upsample_cfg=dict(mode='nearest')):
+                 upsample_cfg=dict(mode='nearest'),
+                 active_levels=None):
         super(FPNDcnLconv3Dcn, self).__init__()
         assert isinstance(in_channels, list)
         self.in_channels = in_channels
@@ -87,6 +93,11 @@ class FPNDcnLconv3Dcn(nn.Module):
         self.no_norm_on_lateral = no_norm_on_lateral
         self.fp16_enabled = False
         self.upsample_cfg = upsample_cfg.copy()
+        if active_levels is not None:
+            active_levels = tuple(sorted(active_levels))
+            assert active_levels[0] == 0 and active_levels[-1] < num_outs, \
+                'the active levels must include level 0, used in testing'
+        self.active_levels = active_levels
 
         if end_level == -1:
             self.backbone_end_level = self.num_ins
@@ -111,6 +122,15 @@ class FPNDcnLconv3Dcn(nn.Module):
             else:
                 self.add_extra_convs = 'on_output'
 
+        # the fpn convs of the levels that are not needed by the active ones
+        # are not built, so that every parameter gets a gradient in
+        # distributed training
+        if active_levels is None:
+            built_levels = set(range(num_outs))
+        else:
+            built_levels = self._required_levels(self.backbone_end_level -
+                                                 self.start_level)
+
         self.lateral_convs = nn.ModuleList()
         self.fpn_convs = nn.ModuleList()
 
@@ -137,7 +157,7 @@ class FPNDcnLconv3Dcn(nn.Module):
                 out_channels,
                 3,
                 padding=1
-                )
+                ) if i - self.start_level in built_levels else None
 
             self.lateral_convs.append(l_conv)
             self.fpn_convs.append(fpn_conv)
@@ -146,6 +166,10 @@ class FPNDcnLconv3Dcn(nn.Module):
         extra_levels = num_outs - self.backbone_end_level + self.start_level
         if self.add_extra_convs and extra_levels >= 1:
             for i in range(extra_levels):
+                if self.backbone_end_level - self.start_level + i \
+                        not in built_levels:
+                    self.fpn_convs.append(None)
+                    continue
                 if i == 0 and self.add_extra_convs == 'on_input':
                     in_channels = self.in_channels[self.backbone_end_level - 1]
                 else:
@@ -169,6 +193,21 @@ class FPNDcnLconv3Dcn(nn.Module):
             if isinstance(m, nn.Conv2d):
                 xavier_init(m, distribution='uniform')
 
+    def _required_levels(self, used_backbone_levels):
+        """Output levels needed to compute the active levels.
+
+        Extra levels are built on top of the previous output level, except
+        the first one when its source is the input or the lateral features.
+        """
+        required = set(self.active_levels)
+        for i in range(self.num_outs - 1, used_backbone_levels - 1, -1):
+            if i not in required:
+                continue
+            if i > used_backbone_levels or not self.add_extra_convs \
+                    or self.add_extra_convs == 'on_output':
+                required.add(i - 1)
+        return required
+
     @auto_fp16()
     def forward(self, inputs):
         """Forward function."""
@@ -199,17 +238,23 @@ class FPNDcnLconv3Dcn(nn.Module):
         # part 1: from original levels
         
         if self.training:
-    
+            if self.active_levels is None:
+                required = set(range(self.num_outs))
+            else:
+                required = self._required_levels(used_backbone_levels)
             outs = [
-                self.fpn_convs[i](laterals[i]) for i in range(used_backbone_levels)
+                self.fpn_convs[i](laterals[i]) if i in required else None
+                for i in range(used_backbone_levels)
             ]
             # part 2: add extra levels
             if self.num_outs > len(outs):
                 # use max pool to get more levels on top of outputs
                 # (e.g., Faster R-CNN, Mask R-CNN)
                 if not self.add_extra_convs:
-                    for i in range(self.num_outs - used_backbone_levels):
-                        outs.append(F.max_pool2d(outs[-1], 1, stride=2))
+                    for i in range(used_backbone_levels, self.num_outs):
+                        outs.append(
+                            F.max_pool2d(outs[-1], 1, stride=2)
+                            if i in required else None)
                 # add conv layers on top of original feature maps (RetinaNet)
                 else:
                     if self.add_extra_convs == 'on_input':
@@ -220,12 +265,18 @@ class FPNDcnLconv3Dcn(nn.Module):
                         extra_source = outs[-1]
                     else:
                         raise NotImplementedError
-                    outs.append(self.fpn_convs[used_backbone_levels](extra_source))
+                    outs.append(
+                        self.fpn_convs[used_backbone_levels](extra_source)
+                        if used_backbone_levels in required else None)
                     for i in range(used_backbone_levels + 1, self.num_outs):
-                        if self.relu_before_extra_convs:
+                        if i not in required:
+                            outs.append(None)
+                        elif self.relu_before_extra_convs:
                             outs.append(self.fpn_convs[i](F.relu(outs[-1])))
                         else:
-                            outs.append(self.fpn_convs[i](outs[-1])) 
+                            outs.append(self.fpn_convs[i](outs[-1]))
+            if self.active_levels is not None:
+                outs = [outs[i] for i in self.active_levels]
         else:   
             outs = [
                 self.fpn_convs[0](laterals[0])
@@ -2,56 +2,72 @@ import torch
 import torch.nn.functional as F
 from torch import autograd, nn
 
-# from utils.distributed import tensor_gather
+from ...dense_heads.oim_utils import (circular_enqueue_, gather_across_ranks,
+                                      get_memory_dtype, memory_mm,
+                                      normalized_momentum_update_)
 
 
 class OIM(autograd.Function):
     @staticmethod
-    def forward(ctx, inputs, targets, lut, cq, header, momentum):
+    def forward(ctx, inputs, targets, lut, cq, header, momentum, sync_memory=False):
         ctx.save_for_backward(inputs, targets, lut, cq, header, momentum)
-        outputs_labeled = inputs.mm(lut.t())
-        outputs_unlabeled = inputs.mm(cq.t())
+        ctx.sync_memory = sync_memory
+        outputs_labeled = memory_mm(inputs, lut.t())
+        outputs_unlabeled = memory_mm(inputs, cq.t())
         return torch.cat([outputs_labeled, outputs_unlabeled], dim=1)
 
     @staticmethod
     def backward(ctx, grad_outputs):
         inputs, targets, lut, cq, header, momentum = ctx.saved_tensors
 
-        # inputs, targets = tensor_gather((inputs, targets))
-
         grad_inputs = None
         if ctx.needs_input_grad[0]:
-            grad_inputs = grad_outputs.mm(torch.cat([lut, cq], dim=0))
+            grad_inputs = memory_mm(grad_outputs, torch.cat([lut, cq], dim=0))
             if grad_inputs.dtype == torch.float16:
                 grad_inputs = grad_inputs.to(torch.float32)
 
-        for x, y in zip(inputs, targets):
-            if y >= 0:
-                lut[y] = momentum * lut[y] + (1.0 - momentum) * x
-                lut[y] /= lut[y].norm()
-            else:
-                cq[header] = x
-                header = (header + 1) % cq.size(0)
-        return grad_inputs, None, None, None, None, None
+        if ctx.sync_memory:
+            inputs, targets = gather_across_ranks(inputs, targets)
+        labeled = targets >= 0
+        normalized_momentum_update_(lut, inputs[labeled], targets[labeled], momentum)
+        circular_enqueue_(cq, header, inputs[~labeled])
+        return grad_inputs, None, None, None, None, None, None
 
 
-def oim(inputs, targets, lut, cq, header, momentum=0.5):
-    return OIM.apply(inputs, targets, lut, cq, torch.tensor(header), torch.tensor(momentum))
+def oim(inputs, targets, lut, cq, header, momentum=0.5, sync_memory=False):
+    return OIM.apply(inputs, targets, lut, cq, header,
+                     torch.tensor(momentum), sync_memory)
 
 
 class OIMLoss(nn.Module):
-    def __init__(self, num_features=256, num_pids=5532, num_cq_size=5000, oim_momentum=0.5, oim_scalar=30):
+    """OIM loss with a lookup table of labeled persons and a circular queue
+    of unlabeled ones.
+
+    Args:
+        sync_memory (bool): Update the lookup table and the queue with the
+            features of all ranks in distributed training, which keeps them
+            identical on every rank. Default: False.
+        memory_dtype (str, optional): Storage dtype of the lookup table and
+            the queue, 'float16' or 'bfloat16' halve their size. Scores and
+            renormalized updates are still computed in float32.
+            Default: None (float32).
+    """
+
+    def __init__(self, num_features=256, num_pids=5532, num_cq_size=5000, oim_momentum=0.5, oim_scalar=30, sync_memory=False, memory_dtype=None):
         super(OIMLoss, self).__init__()
         self.num_features = num_features
         self.num_pids = num_pids
         self.num_unlabeled = num_cq_size
         self.momentum = oim_momentum
         self.oim_scalar = oim_scalar
+        self.sync_memory = sync_memory
 
-        self.register_buffer("lut", torch.zeros(self.num_pids, self.num_features))
-        self.register_buffer("cq", torch.zeros(self.num_unlabeled, self.num_features))
+        memory_dtype = get_memory_dtype(memory_dtype)
+        self.register_buffer("lut", torch.zeros(self.num_pids, self.num_features, dtype=memory_dtype))
+        self.register_buffer("cq", torch.zeros(self.num_unlabeled, self.num_features, dtype=memory_dtype))
 
-        self.header_cq = 0
+        # advanced in place when the queue is updated in backward
+        self.register_buffer("header_cq", torch.tensor(0), persistent=False)
 
     def forward(self, inputs, roi_label):
         # merge into one batch, background label = 0
@@ -62,11 +78,9 @@ class OIMLoss(nn.Module):
         label = roi_label[inds]
         inputs = inputs[inds.unsqueeze(1).expand_as(inputs)].view(-1, self.num_features)
 
-        projected = oim(inputs, label, self.lut, self.cq, self.header_cq, momentum=self.momentum)
+        projected = oim(inputs, label, self.lut, self.cq, self.header_cq,
+                        momentum=self.momentum, sync_memory=self.sync_memory)
         projected *= self.oim_scalar
 
-        self.header_cq = (
-            self.header_cq + (label == -1).long().sum().item()
-        ) % self.num_unlabeled
         loss_oim = F.cross_entropy(projected, label, ignore_index=-1)
         return loss_oim
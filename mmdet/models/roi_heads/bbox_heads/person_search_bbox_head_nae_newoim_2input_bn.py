@@ -15,13 +15,15 @@ from .oim_nae_new import OIMLoss
 
 @HEADS.register_module()
 class PersonSearchNormAwareNewoim2InputBNBBoxHead(BBoxHeadBN):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, sync_memory=False, memory_dtype=None,
+                 **kwargs):
         super(PersonSearchNormAwareNewoim2InputBNBBoxHead, self).__init__(*args, **kwargs)
         # self.fc_feat = nn.Linear(self.in_channels, 256)
         self.embedding_head = NormAwareEmbeddingProj(
                 in_channels=[1024, 2048],
                 dim=256)
-        self.loss_oim = OIMLoss()
+        self.loss_oim = OIMLoss(
+            sync_memory=sync_memory, memory_dtype=memory_dtype)
 
         # self.fc_reg = nn.Sequential(nn.Linear(self.in_channels, 4),
         #                             nn.BatchNorm1d(4))
@@ -15,13 +15,16 @@ from .oim_nae_new import OIMLoss
 
 @HEADS.register_module()
 class PersonSearchNormAwareNewoim2InputBNBBoxHeadPRW(BBoxHeadBN):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, sync_memory=False, memory_dtype=None,
+                 **kwargs):
         super(PersonSearchNormAwareNewoim2InputBNBBoxHeadPRW, self).__init__(*args, **kwargs)
         # self.fc_feat = nn.Linear(self.in_channels, 256)
         self.embedding_head = NormAwareEmbeddingProj(
                 in_channels=[1024, 2048],
                 dim=256)
-        self.loss_oim = OIMLoss(num_pids=483, num_cq_size=500)
+        self.loss_oim = OIMLoss(
+            num_pids=483, num_cq_size=500, sync_memory=sync_memory,
+            memory_dtype=memory_dtype)
 
         # self.fc_reg = nn.Sequential(nn.Linear(self.in_channels, 4),
         #                             nn.BatchNorm1d(4))
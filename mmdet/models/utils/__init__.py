@@ -4,12 +4,16 @@ from .builder import build_linear_layer, build_transformer
 from .ckpt_convert import pvt_convert
 from .conv_upsample import ConvUpsample
 from .csp_layer import CSPLayer
+from .deploy import (DEPLOY_CONVERTERS, check_deploy_equivalence,
+                     convert_to_deploy)
 from .gaussian_target import gaussian_radius, gen_gaussian_target
 from .inverted_residual import InvertedResidual
 from .make_divisible import make_divisible
-from .misc import interpolate_as, sigmoid_geometric_mean
+from .misc import (group_aug_imgs, interpolate_as, matched_identity_centroids,
+                   sigmoid_geometric_mean)
 from .normed_predictor import NormedConv2d, NormedLinear
 from .panoptic_gt_processing import preprocess_panoptic_gt
+from .point_target import fcos_point_targets, get_point_chunk_size
 from .point_sample import (get_uncertain_point_coords_with_randomness,
                            get_uncertainty)
 from .positional_encoding import (LearnedPositionalEncoding,
@@ -32,5 +36,7 @@ __all__ = [
     'nlc_to_nchw', 'pvt_convert', 'sigmoid_geometric_mean',
     'preprocess_panoptic_gt', 'DyReLU',
     'get_uncertain_point_coords_with_randomness', 'get_uncertainty',
-	'MINE'
+	'MINE', 'matched_identity_centroids', 'fcos_point_targets',
+    'get_point_chunk_size', 'group_aug_imgs', 'DEPLOY_CONVERTERS',
+    'convert_to_deploy', 'check_deploy_equivalence'
 ]
@@ -0,0 +1,153 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import torch
+import torch.nn as nn
+from mmcv.cnn import fuse_conv_bn as _fuse_conv_bn
+from mmcv.utils import Registry
+
+DEPLOY_CONVERTERS = Registry('deploy converter')
+
+# The large kernels are merged before the convs are fused with their BNs,
+# because merging needs the BN of every branch.
+DEFAULT_CONVERTERS = ('reparam_large_kernel', 'fuse_conv_bn', 'fold_linear_bn')
+
+
+@DEPLOY_CONVERTERS.register_module()
+def reparam_large_kernel(model):
+    """Merge the branches of every :obj:`ReparamLargeKernelConv` into a single
+    large kernel conv."""
+    modules = [
+        m for m in model.modules()
+        if hasattr(m, 'merge_kernel') and hasattr(m, 'lkb_origin')
+    ]
+    with torch.no_grad():
+        for m in modules:
+            m.merge_kernel()
+    return model
+
+
+@DEPLOY_CONVERTERS.register_module()
+def fuse_conv_bn(model):
+    """Fuse every BN into the conv it follows, see
+    :func:`mmcv.cnn.fuse_conv_bn`."""
+    return _fuse_conv_bn(model)
+
+
+def _fold_linear_bn(linear, bn):
+    std = (bn.running_var + bn.eps).sqrt()
+    scale = 1 / std
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        scale = scale * bn.weight
+        shift = bn.bias - bn.running_mean * scale
+    folded = nn.Linear(linear.in_features,
+                       linear.out_features).to(linear.weight)
+    folded.weight.copy_(linear.weight * scale[:, None])
+    bias = linear.bias if linear.bias is not None else 0
+    folded.bias.copy_(bias * scale + shift)
+    return folded
+
+
+@DEPLOY_CONVERTERS.register_module()
+def fold_linear_bn(model):
+    """Fold every BatchNorm1d directly following a Linear in a
+    ``nn.Sequential``, e.g. the embedding projectors of the ReID heads, into
+    the Linear.
+
+    Only the layers of a ``nn.Sequential`` are folded, as it is the only
+    container whose order of registration is the order of execution.
+    """
+    with torch.no_grad():
+        for m in model.modules():
+            if not isinstance(m, nn.Sequential):
+                continue
+            names = list(m._modules)
+            for name, next_name in zip(names[:-1], names[1:]):
+                linear, bn = m._modules[name], m._modules[next_name]
+                if (isinstance(linear, nn.Linear)
+                        and isinstance(bn, nn.BatchNorm1d)
+                        and bn.track_running_stats):
+                    m._modules[name] = _fold_linear_bn(linear, bn)
+                    m._modules[next_name] = nn.Identity()
+    return model
+
+
+def convert_to_deploy(model, converters=None):
+    """Convert a model to its inference graph.
+
+    The converters rewrite the training graph into an equivalent faster one,
+    e.g. by merging the branches of structural reparameterization or folding
+    the BNs, whose statistics are frozen at inference, into the preceding
+    layers. The model is put in eval mode and can not be trained afterwards.
+
+    Args:
+        model (nn.Module): The model to convert in place.
+        converters (Sequence[str], optional): Names of the converters in
+            ``DEPLOY_CONVERTERS`` to apply in order. Defaults to
+            ``DEFAULT_CONVERTERS``.
+
+    Returns:
+        nn.Module: The converted model.
+    """
+    if converters is None:
+        converters = DEFAULT_CONVERTERS
+    model.eval()
+    for name in converters:
+        converter = DEPLOY_CONVERTERS.get(name)
+        if converter is None:
+            raise KeyError(
+                f'{name} is not a registered deploy converter, '
+                f'choose from {list(DEPLOY_CONVERTERS.module_dict)}')
+        model = converter(model)
+    return model
+
+
+def _max_diff(outputs, deploy_outputs):
+    if isinstance(outputs, np.ndarray):
+        outputs = torch.from_numpy(outputs)
+        deploy_outputs = torch.from_numpy(deploy_outputs)
+    if isinstance(outputs, torch.Tensor):
+        assert outputs.shape == deploy_outputs.shape
+        if outputs.numel() == 0:
+            return 0.
+        return (outputs.float() - deploy_outputs.float()).abs().max().item()
+    if isinstance(outputs, dict):
+        assert outputs.keys() == deploy_outputs.keys()
+        outputs, deploy_outputs = list(outputs.values()), list(
+            deploy_outputs.values())
+    if isinstance(outputs, (list, tuple)):
+        assert len(outputs) == len(deploy_outputs)
+        return max([_max_diff(a, b) for a, b in zip(outputs, deploy_outputs)],
+                   default=0.)
+    return 0.
+
+
+def check_deploy_equivalence(model,
+                             deploy_model,
+                             *inputs,
+                             forward=None,
+                             atol=1e-4):
+    """Check that a converted model computes the same outputs as the original
+    one.
+
+    Args:
+        model (nn.Module): The original model, in eval mode.
+        deploy_model (nn.Module): The model converted by
+            :func:`convert_to_deploy`.
+        *inputs: Inputs of the models.
+        forward (callable, optional): Called as ``forward(model, *inputs)``
+            to get the outputs, a nested structure of tensors or arrays.
+            Defaults to calling the model.
+        atol (float): Largest absolute difference allowed. Default: 1e-4.
+
+    Returns:
+        float: The largest absolute difference of the outputs.
+    """
+    if forward is None:
+        forward = nn.Module.__call__
+    with torch.no_grad():
+        diff = _max_diff(
+            forward(model, *inputs), forward(deploy_model, *inputs))
+    assert diff <= atol, (f'the converted model differs from the original '
+                          f'one by {diff}, more than {atol}')
+    return diff
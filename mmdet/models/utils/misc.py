@@ -1,4 +1,5 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import torch
 from torch.autograd import Function
 from torch.nn import functional as F
 
@@ -70,3 +71,77 @@ def interpolate_as(source, target, mode='bilinear', align_corners=False):
         return source[:, 0, :, :]
     else:
         return _interpolate_as(source, target, mode, align_corners)
+
+
+def matched_identity_centroids(feats1, pids1, feats2, pids2):
+    """Mean feature of every identity labeled in both groups of features.
+
+    Features of each identity are averaged with ``index_add_`` over the ids
+    of both groups, so no per-sample host synchronization is needed.
+    Negative ids are ignored.
+
+    Args:
+        feats1 (Tensor): First group of features, shape (N1, D).
+        pids1 (Tensor): Identity of each feature of ``feats1``, shape (N1, ).
+        feats2 (Tensor): Second group of features, shape (N2, D).
+        pids2 (Tensor): Identity of each feature of ``feats2``, shape (N2, ).
+
+    Returns:
+        tuple[Tensor]: L2-normalized centroids of the identities present in
+            both groups, in the two groups, each of shape (M, D). They are
+            ordered by the first occurrence of the identity in ``pids1``.
+    """
+    num1 = pids1.size(0)
+    ids, inverse = torch.unique(
+        torch.cat([pids1, pids2]), return_inverse=True)
+    inverse1, inverse2 = inverse[:num1], inverse[num1:]
+
+    def _segment_sum(feats, pids, inverse):
+        valid = (pids >= 0).to(feats.dtype)
+        sums = feats.new_zeros(ids.size(0), feats.size(1)).index_add_(
+            0, inverse, feats * valid[:, None])
+        counts = feats.new_zeros(ids.size(0)).index_add_(0, inverse, valid)
+        return sums, counts
+
+    sums1, counts1 = _segment_sum(feats1, pids1, inverse1)
+    sums2, counts2 = _segment_sum(feats2, pids2, inverse2)
+
+    # first occurrence of every id in ``pids1``, ``num1`` if it is missing,
+    # from a sort of the (id, position) pairs instead of ``scatter_reduce_``
+    # which needs PyTorch >= 1.12
+    perm = (inverse1 * num1 +
+            torch.arange(num1, device=ids.device)).argsort()
+    sorted_inverse = inverse1[perm]
+    is_first = torch.ones_like(sorted_inverse, dtype=torch.bool)
+    is_first[1:] = sorted_inverse[1:] != sorted_inverse[:-1]
+    first = torch.full_like(ids, num1)
+    first[sorted_inverse[is_first]] = perm[is_first]
+    order = first.argsort()
+    order = order[((counts1 > 0) & (counts2 > 0))[order]]
+    centroids1 = sums1[order] / counts1[order, None]
+    centroids2 = sums2[order] / counts2[order, None]
+    return F.normalize(centroids1), F.normalize(centroids2)
+
+
+def group_aug_imgs(imgs):
+    """Group the images of all test-time augmentations by shape.
+
+    The augmentations sharing a shape, e.g. the flips of a scale, are
+    stacked into one batch. Augmentations of different shapes are not
+    padded to a common shape, since heads subtracting the mean of a feature
+    map would then also average the padding.
+
+    Args:
+        imgs (list[Tensor]): Images of every augmentation, each of shape
+            (N, C, H, W).
+
+    Returns:
+        list[tuple[list[int], Tensor]]: Indices of the augmentations of
+            every group and their images, of shape (len(inds) * N, C, H, W)
+            and ordered by augmentation first.
+    """
+    groups = {}
+    for i, img in enumerate(imgs):
+        groups.setdefault(tuple(img.shape[-2:]), []).append(i)
+    return [(inds, torch.cat([imgs[i] for i in inds]))
+            for inds in groups.values()]
@@ -0,0 +1,133 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import torch
+
+# Upper bound of the bytes of the temporaries kept alive per (point, gt) pair
+# by `fcos_point_targets`.
+_PAIR_BYTES = 64
+
+
+def get_point_chunk_size(num_gts, memory_budget=None):
+    """Number of points assigned at once within a memory budget.
+
+    Args:
+        num_gts (int): Number of gt boxes of the image.
+        memory_budget (float, optional): Peak memory in MB of the
+            temporaries of the assignment. Default: None (no limit).
+
+    Returns:
+        int | None: Number of points per chunk, None means all points.
+    """
+    if memory_budget is None:
+        return None
+    return max(1,
+               int(memory_budget * 2**20) // (max(num_gts, 1) * _PAIR_BYTES))
+
+
+def fcos_point_targets(points,
+                       gt_bboxes,
+                       regress_ranges,
+                       num_points_per_lvl,
+                       strides,
+                       center_sample_radius=None,
+                       memory_budget=None,
+                       inf=1e8):
+    """Assign every point to the smallest gt box it can regress, FCOS style.
+
+    A point can be assigned to a gt box when it lies inside the box (or
+    inside its center region with center sampling) and its largest
+    regression distance is within the regress range of the point. Among
+    these boxes the one with the smallest area is chosen.
+
+    Points are processed in chunks, so only ``chunk * num_gts`` pairs are
+    alive at once instead of ``num_points * num_gts`` expanded copies of the
+    boxes, areas and distances. The result does not depend on the chunk
+    size.
+
+    Args:
+        points (Tensor): Points of all levels, shape (num_points, 2).
+        gt_bboxes (Tensor): Gt boxes of the image, shape (num_gts, 4).
+        regress_ranges (Tensor): Regress range of each point, shape
+            (num_points, 2).
+        num_points_per_lvl (list[int]): Number of points of each level.
+        strides (list[int]): Stride of each level.
+        center_sample_radius (float, optional): Radius of center sampling,
+            in strides. Default: None (no center sampling).
+        memory_budget (float, optional): Peak memory in MB of the
+            temporaries of the assignment. Default: None (all points at
+            once).
+        inf (float): Area of points without any gt box. Default: 1e8.
+
+    Returns:
+        tuple[Tensor]: Area of the assigned box of each point (``inf`` for
+            background points), shape (num_points, ); index of the
+            assigned box, shape (num_points, ); regression targets (left,
+            top, right, bottom) to the assigned box, shape (num_points, 4).
+    """
+    num_points = points.size(0)
+    num_gts = gt_bboxes.size(0)
+    areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (
+        gt_bboxes[:, 3] - gt_bboxes[:, 1])
+    if center_sample_radius is not None:
+        # project the points on current lvl back to the `original` sizes
+        radii = torch.cat([
+            points.new_full((num_lvl, ), stride * center_sample_radius)
+            for num_lvl, stride in zip(num_points_per_lvl, strides)
+        ])
+        center_xs = (gt_bboxes[:, 0] + gt_bboxes[:, 2]) / 2
+        center_ys = (gt_bboxes[:, 1] + gt_bboxes[:, 3]) / 2
+
+    chunk_size = get_point_chunk_size(num_gts, memory_budget) or max(
+        num_points, 1)
+    min_area = points.new_empty(num_points)
+    min_area_inds = points.new_empty(num_points, dtype=torch.long)
+    for start in range(0, num_points, chunk_size):
+        end = min(start + chunk_size, num_points)
+        xs = points[start:end, 0, None]
+        ys = points[start:end, 1, None]
+        left = xs - gt_bboxes[:, 0]
+        right = gt_bboxes[:, 2] - xs
+        top = ys - gt_bboxes[:, 1]
+        bottom = gt_bboxes[:, 3] - ys
+
+        if center_sample_radius is not None:
+            # condition1: inside a `center bbox`
+            radius = radii[start:end, None]
+            x_mins = center_xs - radius
+            y_mins = center_ys - radius
+            x_maxs = center_xs + radius
+            y_maxs = center_ys + radius
+            inside_gt_bbox_mask = (xs - torch.where(
+                x_mins > gt_bboxes[:, 0], x_mins, gt_bboxes[:, 0])) > 0
+            inside_gt_bbox_mask &= (ys - torch.where(
+                y_mins > gt_bboxes[:, 1], y_mins, gt_bboxes[:, 1])) > 0
+            inside_gt_bbox_mask &= (torch.where(
+                x_maxs > gt_bboxes[:, 2], gt_bboxes[:, 2], x_maxs) - xs) > 0
+            inside_gt_bbox_mask &= (torch.where(
+                y_maxs > gt_bboxes[:, 3], gt_bboxes[:, 3], y_maxs) - ys) > 0
+        else:
+            # condition1: inside a gt bbox
+            inside_gt_bbox_mask = (left > 0) & (top > 0) & (right > 0) & (
+                bottom > 0)
+
+        # condition2: limit the regression range for each location
+        max_regress_distance = torch.maximum(
+            torch.maximum(left, top), torch.maximum(right, bottom))
+        ranges = regress_ranges[start:end]
+        inside_regress_range = (
+            (max_regress_distance >= ranges[:, 0, None])
+            & (max_regress_distance <= ranges[:, 1, None]))
+
+        # if there are still more than one objects for a location,
+        # we choose the one with minimal area
+        chunk_areas = areas[None].expand(end - start, num_gts).masked_fill(
+            ~(inside_gt_bbox_mask & inside_regress_range), inf)
+        min_area[start:end], min_area_inds[start:end] = chunk_areas.min(
+            dim=1)
+
+    assigned_bboxes = gt_bboxes[min_area_inds]
+    bbox_targets = torch.stack(
+        (points[:, 0] - assigned_bboxes[:, 0],
+         points[:, 1] - assigned_bboxes[:, 1],
+         assigned_bboxes[:, 2] - points[:, 0],
+         assigned_bboxes[:, 3] - points[:, 1]), -1)
+    return min_area, min_area_inds, bbox_targets
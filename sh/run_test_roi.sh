@@ -2,8 +2,10 @@
 TESTPATH='faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1'
 TESTNAME='cuhk_roi_alignps.pth'
 
-# Make sure the model path is work_dirs/TESTPATH/TESTNAME, tesults_1000.pkl will be saved in work_dirs/TESTPATH
-./tools/dist_test_d.sh ./configs/person_search/${TESTPATH}.py work_dirs/${TESTPATH}/epoch_${i}.pth 1 --out work_dirs/${TESTPATH}/results_1000.pkl
+# Make sure the model path is work_dirs/TESTPATH/TESTNAME, the gallery results are saved in work_dirs/TESTPATH/results_1000
+# with the RoI embeddings of every image, which are the ones searched
+./tools/dist_test.sh ./configs/person_search/${TESTPATH}.py work_dirs/${TESTPATH}/${TESTNAME} 1 --out-store work_dirs/${TESTPATH}/results_1000
 echo '------------------------'
-python ./tools/test_results_psd.py ${TESTPATH}
+# probe features are cached in work_dirs/TESTPATH/query_cache and reused until the checkpoint changes
+python ./tools/extract_query.py ./configs/person_search/${TESTPATH}.py work_dirs/${TESTPATH}/${TESTNAME} --cache-dir work_dirs/${TESTPATH}/query_cache --gallery-results work_dirs/${TESTPATH}/results_1000 --gallery-size 50 100 500 1000 2000 4000
 echo $TESTPATH
@@ -0,0 +1,108 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os
+import os.path as osp
+import pickle
+import tempfile
+
+import mmcv
+import numpy as np
+
+from mmdet.datasets import CuhkDataset
+
+
+def _create_cuhk_json(json_name):
+    images = [
+        dict(id=i, width=640, height=480, file_name=f'img_{i}.jpg')
+        for i in range(4)
+    ]
+    annotations = [
+        dict(id=1, image_id=0, category_id=1, area=400,
+             bbox=[50, 60, 20, 20], iscrowd=0, person_id=3),
+        dict(id=2, image_id=0, category_id=1, area=900,
+             bbox=[100, 120, 30, 30], iscrowd=0, person_id=-1),
+        dict(id=3, image_id=0, category_id=1, area=900,
+             bbox=[10, 10, 30, 30], iscrowd=1, person_id=-1),
+        # outside of the image
+        dict(id=4, image_id=1, category_id=1, area=100,
+             bbox=[700, 10, 10, 10], iscrowd=0, person_id=5),
+        dict(id=5, image_id=3, category_id=1, area=1600,
+             bbox=[0, 0, 40, 40], iscrowd=0, person_id=7),
+    ]
+    categories = [dict(id=1, name='person', supercategory='person')]
+    mmcv.dump(
+        dict(images=images, annotations=annotations, categories=categories),
+        json_name)
+
+
+def test_cuhk_ann_cache():
+    tmp_dir = tempfile.TemporaryDirectory()
+    ann_file = osp.join(tmp_dir.name, 'fake_data.json')
+    _create_cuhk_json(ann_file)
+
+    expected = CuhkDataset(ann_file=ann_file, pipeline=[])
+    # the first dataset compiles the cache, the second one reads it
+    for _ in range(2):
+        dataset = CuhkDataset(ann_file=ann_file, pipeline=[], ann_cache=True)
+        assert osp.isdir(ann_file + '.cache')
+        assert dataset._coco is None
+        assert dataset.img_ids == expected.img_ids
+        assert [info['id'] for info in dataset.data_infos
+                ] == [info['id'] for info in expected.data_infos]
+        for idx in range(len(dataset)):
+            ann = dataset.get_ann_info(idx)
+            expected_ann = expected.get_ann_info(idx)
+            assert ann.keys() == expected_ann.keys()
+            for key in ('bboxes', 'labels', 'ids', 'bboxes_ignore'):
+                assert ann[key].dtype == expected_ann[key].dtype
+                np.testing.assert_array_equal(ann[key], expected_ann[key])
+            assert ann['masks'] == expected_ann['masks']
+            assert ann['seg_map'] == expected_ann['seg_map']
+            assert dataset.get_cat_ids(idx) == expected.get_cat_ids(idx)
+
+    # workers reopen the arrays instead of receiving them
+    dataset.get_ann_info(0)
+    state = pickle.loads(pickle.dumps(dataset))
+    assert state._ann_cache._arrays is None
+    np.testing.assert_array_equal(state.get_ann_info(0)['bboxes'],
+                                  expected.get_ann_info(0)['bboxes'])
+
+    # the cache is rebuilt when the annotation file changes
+    stat = os.stat(ann_file)
+    os.utime(ann_file, (stat.st_atime, stat.st_mtime + 10))
+    dataset = CuhkDataset(ann_file=ann_file, pipeline=[], ann_cache=True)
+    assert dataset._ann_cache.meta['key']['mtime'] == stat.st_mtime + 10
+    # the COCO api is still available for evaluation
+    assert dataset.coco.get_img_ids() == expected.img_ids
+    tmp_dir.cleanup()
+
+
+def test_cuhk_load_query():
+    tmp_dir = tempfile.TemporaryDirectory()
+    ann_file = osp.join(tmp_dir.name, 'fake_data.json')
+    _create_cuhk_json(ann_file)
+    dataset = CuhkDataset(
+        ann_file=ann_file, pipeline=[], query_test_pipeline=[], test_mode=True)
+    dataset._query_infos = [
+        dict(
+            filename=f'img_{i}.jpg',
+            width=640,
+            height=480,
+            roi=np.array([[i, i, i + 10, i + 20]], dtype=np.float32))
+        for i in (0, 1, 0, 2, 1)
+    ]
+
+    dataset.load_query()
+    assert len(dataset) == 5
+    assert dataset.query_groups == [[0], [1], [2], [3], [4]]
+
+    # the probes sharing an image are one sample
+    dataset.load_query(group_by_image=True)
+    assert len(dataset) == 3
+    assert dataset.query_groups == [[0, 2], [1, 4], [3]]
+    assert [info['filename'] for info in dataset.data_infos
+            ] == ['img_0.jpg', 'img_1.jpg', 'img_2.jpg']
+    np.testing.assert_array_equal(
+        dataset.proposals[0],
+        np.concatenate(
+            [dataset._query_infos[0]['roi'], dataset._query_infos[2]['roi']]))
+    tmp_dir.cleanup()
@@ -1,12 +1,16 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import copy
+import os
 import os.path as osp
+import shutil
+import tempfile
 
 import mmcv
 import numpy as np
 
 from mmdet.datasets.pipelines import (LoadImageFromFile, LoadImageFromWebcam,
-                                      LoadMultiChannelImageFromFiles)
+                                      LoadMultiChannelImageFromFiles,
+                                      SharedImageCache)
 
 
 class TestLoading:
@@ -57,6 +61,61 @@ class TestLoading:
         assert results['img'].shape == (288, 512)
         assert results['img'].dtype == np.uint8
 
+    def test_load_img_with_cache(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        results = dict(
+            img_prefix=self.data_prefix, img_info=dict(filename='color.jpg'))
+        expected = LoadImageFromFile()(copy.deepcopy(results))['img']
+        transform = LoadImageFromFile(
+            cache_cfg=dict(cache_dir=tmp_dir.name))
+        for _ in range(3):
+            img = transform(copy.deepcopy(results))['img']
+            np.testing.assert_array_equal(img, expected)
+        stats = transform.cache.stats()
+        assert stats['hits'] == 2 and stats['misses'] == 1
+        assert stats['num_images'] == 1
+        assert stats['bytes_used'] >= expected.nbytes
+        assert 'cache_cfg' in repr(transform)
+
+        # the options of the decoding are part of the key
+        transform = LoadImageFromFile(
+            to_float32=True,
+            color_type='unchanged',
+            cache_cfg=dict(cache_dir=tmp_dir.name))
+        img = transform(copy.deepcopy(results))['img']
+        assert img.dtype == np.float32
+        assert transform.cache.stats()['num_images'] == 2
+
+        # a file replaced on disk is decoded again
+        shutil.copy(
+            osp.join(self.data_prefix, 'color.jpg'),
+            osp.join(tmp_dir.name, 'img.jpg'))
+        results = dict(
+            img_prefix=tmp_dir.name, img_info=dict(filename='img.jpg'))
+        transform = LoadImageFromFile(cache_cfg=dict(cache_dir=tmp_dir.name))
+        transform(copy.deepcopy(results))
+        shutil.copy(
+            osp.join(self.data_prefix, 'gray.jpg'),
+            osp.join(tmp_dir.name, 'img.jpg'))
+        img = transform(copy.deepcopy(results))['img']
+        np.testing.assert_array_equal(
+            img, LoadImageFromFile()(copy.deepcopy(results))['img'])
+        assert transform.cache.stats()['misses'] == 2
+
+        # the least recently used images are evicted
+        cache = SharedImageCache(cache_dir=tmp_dir.name)
+        cache.clear()
+        for i in range(4):
+            cache.put(str(i), expected)
+            os.utime(cache._path(str(i)), (i, i))
+        cache.get('0')
+        cache.max_bytes = expected.nbytes * 3
+        cache.evict()
+        assert cache.get('0') is not None
+        assert cache.get('1') is None
+        assert cache.get('3') is not None
+        tmp_dir.cleanup()
+
     def test_load_multi_channel_img(self):
         results = dict(
             img_prefix=self.data_prefix,
@@ -132,3 +132,46 @@ def test_voc_recall_overlaps():
     ious = recall_overlaps(bboxes1, bboxes2, 'iou', use_legacy_coordinate=True)
     assert ious.shape == (num_bbox, num_bbox)
     assert np.all(ious >= -1) and np.all(ious <= 1)
+
+
+def test_recall_overlaps_blocks(monkeypatch):
+    rng = np.random.RandomState(0)
+
+    def _random_bboxes(num):
+        x1y1 = rng.rand(num, 2) * 100
+        return np.hstack([x1y1, x1y1 + rng.rand(num, 2) * 50])
+
+    bboxes1 = _random_bboxes(37)
+    bboxes2 = _random_bboxes(11)
+    for mode in ['iou', 'iof']:
+        for use_legacy_coordinate in [False, True]:
+            ious = recall_overlaps(
+                bboxes1,
+                bboxes2,
+                mode,
+                use_legacy_coordinate=use_legacy_coordinate)
+            # pairwise reference
+            extra = 1. if use_legacy_coordinate else 0.
+            expected = np.zeros((37, 11), dtype=np.float32)
+            for i, b1 in enumerate(bboxes1.astype(np.float32)):
+                for j, b2 in enumerate(bboxes2.astype(np.float32)):
+                    w = max(min(b1[2], b2[2]) - max(b1[0], b2[0]) + extra, 0)
+                    h = max(min(b1[3], b2[3]) - max(b1[1], b2[1]) + extra, 0)
+                    area1 = (b1[2] - b1[0] + extra) * (b1[3] - b1[1] + extra)
+                    area2 = (b2[2] - b2[0] + extra) * (b2[3] - b2[1] + extra)
+                    union = area1 + area2 - w * h if mode == 'iou' else area1
+                    expected[i, j] = w * h / max(union, 1e-6)
+            assert np.allclose(ious, expected, atol=1e-6)
+
+            # computing a few rows at a time gives the same result
+            monkeypatch.setattr(
+                'mmdet.core.evaluation.bbox_overlaps._BLOCK_SIZE', 30)
+            assert np.array_equal(
+                recall_overlaps(
+                    bboxes1,
+                    bboxes2,
+                    mode,
+                    use_legacy_coordinate=use_legacy_coordinate), ious)
+            monkeypatch.undo()
+
+    assert recall_overlaps(bboxes1[:0], bboxes2).shape == (0, 11)
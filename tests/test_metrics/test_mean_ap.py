@@ -1,6 +1,6 @@
 import numpy as np
 
-from mmdet.core.evaluation.mean_ap import (eval_map, tpfp_default,
+from mmdet.core.evaluation.mean_ap import (_get_pool, eval_map, tpfp_default,
                                            tpfp_imagenet, tpfp_openimages)
 
 det_bboxes = np.array([
@@ -88,6 +88,39 @@ def test_eval_map():
     assert 0.291 < mean_ap < 0.293
 
 
+def test_eval_map_extra_columns():
+    rng = np.random.RandomState(0)
+    det_results, annotations = [], []
+    for _ in range(6):
+        dets = []
+        for _ in range(2):
+            num = rng.randint(0, 8)
+            x1y1 = rng.rand(num, 2) * 50
+            boxes = np.hstack([x1y1, x1y1 + 10 + rng.rand(num, 2) * 20])
+            dets.append(np.hstack([boxes, rng.rand(num, 1)]))
+        det_results.append(dets)
+        x1y1 = rng.rand(4, 2) * 50
+        annotations.append(
+            dict(
+                bboxes=np.hstack([x1y1, x1y1 + 10 + rng.rand(4, 2) * 20]),
+                labels=rng.randint(0, 2, 4)))
+
+    mean_ap, results = eval_map(det_results, annotations, nproc=1)
+    # ReID detections carry their embeddings after the score
+    reid_results = [[
+        np.hstack([dets, rng.rand(len(dets), 16)]) for dets in img_dets
+    ] for img_dets in det_results]
+    for nproc in [1, 2]:
+        reid_mean_ap, reid_results_ = eval_map(
+            reid_results, annotations, nproc=nproc)
+        assert reid_mean_ap == mean_ap
+        for result, reid_result in zip(results, reid_results_):
+            assert np.array_equal(result['precision'],
+                                  reid_result['precision'])
+    # the pool is kept for later calls
+    assert _get_pool(2) is _get_pool(2)
+
+
 def test_tpfp_openimages():
 
     det_bboxes = np.array([[10, 10, 15, 15, 1.0], [15, 15, 30, 30, 0.98],
@@ -0,0 +1,241 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import tempfile
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from mmdet.apis import single_gpu_test
+from mmdet.core.evaluation.person_search import GalleryIndex, eval_search
+from mmdet.core.evaluation.reid_result_store import (ReidResultStore,
+                                                     ReidResultWriter,
+                                                     load_results,
+                                                     merge_result_stores,
+                                                     unpack_reid_results)
+
+
+def _compute_iou(a, b):
+    x1 = max(a[0], b[0])
+    y1 = max(a[1], b[1])
+    x2 = min(a[2], b[2])
+    y2 = min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] -
+                                                             b[1]) - inter
+    return inter / union
+
+
+def _ap(y_true, y_score):
+    # sklearn.metrics.average_precision_score
+    desc = np.argsort(y_score, kind='mergesort')[::-1]
+    y_true, y_score = y_true[desc], y_score[desc]
+    precision, recall = [], []
+    for thr in np.unique(y_score)[::-1]:
+        keep = y_score >= thr
+        precision.append(y_true[keep].sum() / keep.sum())
+        recall.append(y_true[keep].sum() / y_true.sum())
+    return np.sum(np.diff(np.r_[0, recall]) * np.array(precision))
+
+
+def _loop_eval(dets, feats, query_feats, protocol, topk=(1, 5, 10)):
+    aps, accs = [], []
+    for feat_q, probe in zip(query_feats, protocol):
+        feat_q = feat_q / np.linalg.norm(feat_q)
+        y_true, y_score = [], []
+        count_gt, count_tp = 0, 0
+        tested = set()
+        for img_idx, gt in zip(probe['gallery_inds'], probe['gt_bboxes']):
+            count_gt += gt.any()
+            if img_idx < 0 or img_idx in tested or len(dets[img_idx]) == 0:
+                continue
+            tested.add(img_idx)
+            det = dets[img_idx]
+            feat_g = feats[img_idx]
+            feat_g = feat_g / np.linalg.norm(feat_g, axis=1, keepdims=True)
+            sim = feat_g.dot(feat_q)
+            label = np.zeros(len(sim), dtype=np.int64)
+            if gt.any():
+                w, h = gt[2] - gt[0], gt[3] - gt[1]
+                iou_thresh = min(0.5, (w * h) / ((w + 10) * (h + 10)))
+                inds = np.argsort(sim)[::-1]
+                sim, det = sim[inds], det[inds]
+                for j, roi in enumerate(det[:, :4]):
+                    if _compute_iou(roi, gt) >= iou_thresh:
+                        label[j] = 1
+                        count_tp += 1
+                        break
+            y_true.extend(label)
+            y_score.extend(sim)
+        y_true, y_score = np.array(y_true), np.array(y_score)
+        aps.append(0 if count_tp == 0 else _ap(y_true, y_score) * count_tp /
+                   count_gt)
+        y_true = y_true[np.argsort(y_score, kind='mergesort')[::-1]]
+        accs.append([min(1, y_true[:k].sum()) for k in topk])
+    return np.mean(aps), np.mean(accs, axis=0)
+
+
+def test_eval_search():
+    rng = np.random.RandomState(0)
+    num_imgs, num_probes, feat_dim = 30, 12, 16
+    results, dets, feats = [], [], []
+    for i in range(num_imgs):
+        n = rng.randint(0, 6)
+        xy = rng.rand(n, 2) * 100
+        wh = rng.rand(n, 2) * 50 + 20
+        det = np.concatenate(
+            [xy, xy + wh, rng.rand(n, 1),
+             rng.randn(n, feat_dim)], axis=1).astype(np.float32)
+        results.append([det])
+        keep = det[:, 4] >= 0.3
+        dets.append(det[keep, :5])
+        feats.append(det[keep, 5:])
+
+    protocol = []
+    for _ in range(num_probes):
+        gallery_inds = rng.choice(num_imgs, 8, replace=False)
+        gallery_inds[-1] = -1
+        gt_bboxes = np.zeros((8, 4), dtype=np.float32)
+        for j in range(3):
+            det = dets[gallery_inds[j]]
+            if len(det):
+                gt_bboxes[j] = det[0, :4] + rng.rand(4) * 10
+            else:
+                gt_bboxes[j] = [10, 10, 40, 90]
+        protocol.append(dict(gallery_inds=gallery_inds, gt_bboxes=gt_bboxes))
+    query_feats = rng.randn(num_probes, feat_dim).astype(np.float32)
+
+    gallery = GalleryIndex.from_results(results, det_thresh=0.3)
+    assert len(gallery) == num_imgs
+    assert gallery.num_boxes == sum(len(det) for det in dets)
+    boxes, scores, _ = gallery.image_slice(3)
+    assert np.allclose(boxes, dets[3][:, :4])
+    assert np.allclose(scores, dets[3][:, 4])
+
+    ref_map, ref_accs = _loop_eval(dets, feats, query_feats, protocol)
+    for block_size in [1, 5, 128]:
+        eval_results = eval_search(
+            gallery, query_feats, protocol, block_size=block_size)
+        assert np.isclose(eval_results['mAP'], ref_map)
+        for k, acc in zip((1, 5, 10), ref_accs):
+            assert np.isclose(eval_results[f'top{k}'], acc)
+
+
+def test_gallery_index_from_results():
+    rng = np.random.RandomState(0)
+    results_n = _random_results(rng, 5)
+    results_b = []
+    for result in results_n:
+        det = result[0].copy()
+        det[:, 5:] = rng.rand(len(det), det.shape[1] - 5)
+        results_b.append(det)
+    # the test results of two-stage detectors in batches of 2 images
+    results = []
+    for i in range(0, 5, 2):
+        results.extend((results_n[i:i + 2], results_b[i:i + 2]))
+
+    gallery = GalleryIndex.from_results(results, det_thresh=0.5, num_images=5)
+    ref_gallery = GalleryIndex.from_results(results_b, det_thresh=0.5)
+    assert len(gallery) == 5
+    assert np.array_equal(gallery.offsets, ref_gallery.offsets)
+    assert np.array_equal(gallery.boxes, ref_gallery.boxes)
+    assert np.array_equal(gallery.feats, ref_gallery.feats)
+
+    with pytest.raises(ValueError):
+        GalleryIndex.from_results(results_n, num_images=6)
+
+    gallery = GalleryIndex.from_results([], num_images=0)
+    assert len(gallery) == 0 and gallery.num_boxes == 0
+    assert gallery.boxes.shape == (0, 4)
+
+
+def _random_results(rng, num_imgs, num_classes=1, feat_dim=8):
+    results = []
+    for _ in range(num_imgs):
+        result = []
+        for _ in range(num_classes):
+            n = rng.randint(0, 4)
+            result.append(rng.rand(n, 5 + feat_dim).astype(np.float32))
+        results.append(result)
+    return results
+
+
+def test_reid_result_store():
+    rng = np.random.RandomState(0)
+    results = _random_results(rng, 10, num_classes=2)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        writer = ReidResultWriter(tmpdir)
+        for result in results:
+            writer.append(result)
+        store = writer.close()
+        assert isinstance(load_results(tmpdir), ReidResultStore)
+        assert len(store) == len(results)
+        for result, stored in zip(results, store):
+            for det, stored_det in zip(result, stored):
+                assert np.array_equal(det, stored_det)
+        boxes, scores, feats, labels = store.image_slice(4)
+        assert isinstance(boxes.base, np.memmap)
+        assert np.array_equal(feats[labels == 1], results[4][1][:, 5:])
+
+        gallery = GalleryIndex.from_results(store, det_thresh=0.5)
+        ref_gallery = GalleryIndex.from_results(results, det_thresh=0.5)
+        assert np.array_equal(gallery.offsets, ref_gallery.offsets)
+        assert np.array_equal(gallery.boxes, ref_gallery.boxes)
+        assert np.allclose(gallery.feats, ref_gallery.feats)
+
+    # ranks receive the samples in turn, the last one is padded
+    results = _random_results(rng, 7)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        part_dirs = [f'{tmpdir}/part_{i}' for i in range(3)]
+        for rank, part_dir in enumerate(part_dirs):
+            writer = ReidResultWriter(part_dir)
+            for idx in range(rank, 9, 3):
+                writer.append(results[idx % len(results)])
+            writer.close()
+        store = merge_result_stores(part_dirs, tmpdir, len(results))
+        assert len(store) == len(results)
+        for result, stored in zip(results, store):
+            assert np.array_equal(result[0], stored[0])
+
+
+class _TwoStageReidModel(nn.Module):
+    """Return the batch outputs of ``SingleTwoStageDetector176PRW``."""
+
+    def __init__(self, results_n, results_b):
+        super().__init__()
+        self.results_n = results_n
+        self.results_b = results_b
+
+    def forward(self, img, return_loss=False, rescale=True):
+        inds = img.tolist()
+        return ([self.results_n[i] for i in inds],
+                [self.results_b[i] for i in inds])
+
+
+def test_reid_result_store_two_stage():
+    rng = np.random.RandomState(0)
+    results_n = _random_results(rng, 5)
+    results_b = []
+    for result in results_n:
+        det = result[0].copy()
+        det[:, 5:] = rng.rand(len(det), det.shape[1] - 5)
+        results_b.append(det)
+
+    result = unpack_reid_results(([results_n[0]], [results_b[0]]))
+    assert len(result) == 1 and result[0][0] is results_b[0]
+    assert unpack_reid_results(results_n) is results_n
+
+    # batches of 2 images, the RoI embeddings are stored
+    model = _TwoStageReidModel(results_n, results_b)
+    data_loader = DataLoader(
+        list(range(5)),
+        batch_size=2,
+        collate_fn=lambda inds: dict(img=torch.tensor(inds)))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        writer = ReidResultWriter(tmpdir)
+        store = single_gpu_test(model, data_loader, result_writer=writer)
+        assert len(store) == 5
+        for det, stored in zip(results_b, store):
+            assert len(stored) == 1
+            assert np.array_equal(det, stored[0])
@@ -0,0 +1,108 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+
+from mmdet.models.dense_heads import FCOSReidHeadFocalSubTriQueue3
+
+
+def _build_head(active_levels=None):
+    # since Focal Loss is not supported on CPU
+    return FCOSReidHeadFocalSubTriQueue3(
+        num_classes=1,
+        in_channels=32,
+        feat_channels=32,
+        norm_on_bbox=True,
+        centerness_on_reg=True,
+        center_sampling=True,
+        conv_bias=True,
+        loss_cls=dict(
+            type='CrossEntropyLoss', use_sigmoid=True, loss_weight=1.0),
+        loss_bbox=dict(type='GIoULoss', loss_weight=1.0),
+        active_levels=active_levels)
+
+
+def test_fcos_reid_head_active_levels():
+    """Skipping levels without positives only drops background terms."""
+    s = 256
+    img_metas = [{
+        'img_shape': (s, s, 3),
+        'scale_factor': 1,
+        'pad_shape': (s, s, 3)
+    }] * 2
+    gt_bboxes = [
+        torch.Tensor([[23.6667, 23.8757, 138.6326, 238.8874],
+                      [100., 40., 180., 200.]]),
+        torch.Tensor([[60., 10., 120., 150.]])
+    ]
+    gt_labels = [torch.LongTensor([0, 0]), torch.LongTensor([0])]
+    gt_ids = [torch.LongTensor([3, -2]), torch.LongTensor([3])]
+
+    torch.manual_seed(0)
+    full_head = _build_head()
+    fast_head = _build_head(active_levels=(0, ))
+    fast_head.load_state_dict(full_head.state_dict())
+    assert full_head.assignable_levels() == [0]
+    assert full_head.active_levels == (0, 1, 2, 3, 4)
+
+    feats = [
+        torch.rand(2, 32, s // stride, s // stride)
+        for stride in full_head.strides
+    ]
+    full_outs = full_head(feats)
+    fast_outs = fast_head(feats[:1])
+    for full_out, fast_out in zip(full_outs, fast_outs):
+        assert len(fast_out) == 1
+        assert torch.allclose(full_out[0], fast_out[0])
+
+    # the targets of the active level are unchanged and the skipped levels
+    # only hold background
+    points = full_head.get_points([feat.shape[-2:] for feat in feats],
+                                  torch.float32, 'cpu')
+    full_targets = full_head.get_targets(points, gt_bboxes, gt_labels, gt_ids)
+    fast_targets = fast_head.get_targets(points[:1], gt_bboxes, gt_labels,
+                                         gt_ids)
+    for full_target, fast_target in zip(full_targets, fast_targets):
+        assert torch.equal(full_target[0], fast_target[0])
+    full_labels, full_ids, _ = full_targets
+    for lvl in range(1, 5):
+        assert (full_labels[lvl] == full_head.num_classes).all()
+        assert (full_ids[lvl] == full_head.background_id).all()
+
+    full_losses, _ = full_head.loss(*full_outs, gt_bboxes, gt_labels, gt_ids,
+                                    img_metas)
+    fast_losses, _ = fast_head.loss(*fast_outs, gt_bboxes, gt_labels, gt_ids,
+                                    img_metas)
+    assert full_losses['loss_bbox'] > 0
+    for name in ('loss_bbox', 'loss_centerness', 'loss_oim', 'loss_tri'):
+        assert torch.equal(full_losses[name], fast_losses[name])
+
+    num_pos = (full_labels[0] == 0).sum().item()
+    bg_scores = torch.cat([
+        cls_score.permute(0, 2, 3, 1).reshape(-1, 1)
+        for cls_score in full_outs[0][1:]
+    ])
+    bg_loss = full_head.loss_cls(
+        bg_scores,
+        bg_scores.new_full((len(bg_scores), ), 1, dtype=torch.long),
+        avg_factor=num_pos + 2)
+    assert torch.allclose(full_losses['loss_cls'],
+                          fast_losses['loss_cls'] + bg_loss)
+
+    # the scales of the skipped levels are not built, so that every
+    # parameter gets a gradient
+    assert [scale is not None
+            for scale in fast_head.scales] == [True] + [False] * 4
+    sum(fast_losses.values()).backward()
+    assert all(param.grad is not None for param in fast_head.parameters()
+               if param.requires_grad)
+    fast_head.eval()
+    with pytest.raises(AssertionError):
+        fast_head(feats)
+    fast_head.train()
+
+    # the neck must only output the active levels
+    with pytest.raises(AssertionError):
+        fast_head(feats)
+    # levels that can be assigned positives can not be skipped
+    with pytest.raises(AssertionError):
+        _build_head(active_levels=(1, 2))
@@ -0,0 +1,359 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import socket
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+
+from mmdet.models.dense_heads.hoim import HOIMLoss
+from mmdet.models.dense_heads.labeled_matching_layer_queue import \
+    LabeledMatchingLayerQueue
+from mmdet.models.dense_heads import oim_utils
+from mmdet.models.dense_heads.oim_utils import memory_mm, priority_enqueue_
+from mmdet.models.dense_heads.unlabeled_matching_layer import (
+    UnlabeledMatchingFullLayer, UnlabeledMatchingLayer)
+from mmdet.models.roi_heads.bbox_heads.oim_nae_new import OIMLoss
+
+
+def _loop_lut_update(lookup_table, features, pid_labels, momentum=0.5):
+    for indx, label in enumerate(pid_labels):
+        if label >= 0:
+            lookup_table[label] = (
+                momentum * lookup_table[label] +
+                (1 - momentum) * features[indx])
+
+
+def _loop_enqueue(queue, tail, features, pid_labels, num_dims=None):
+    num_dims = queue.size(1) if num_dims is None else num_dims
+    for indx, label in enumerate(pid_labels):
+        if label == -1:
+            queue[tail, :num_dims] = features[indx, :num_dims]
+            tail += 1
+            if tail >= queue.size(0):
+                tail -= queue.size(0)
+
+
+def _loop_priority_enqueue(queue, queue_omega, features, omegas):
+    for x, omega in zip(features, omegas):
+        if omega < queue_omega.min():
+            continue
+        header = queue_omega.argmin().item()
+        queue[header] = x
+        queue_omega[header] = omega
+
+
+def test_labeled_matching_update_parity():
+    torch.manual_seed(0)
+    layer = LabeledMatchingLayerQueue(num_persons=10, feat_len=8)
+    layer.lookup_table.normal_()
+    ref_table = layer.lookup_table.clone()
+
+    # duplicated ids, unlabeled (-1) and background (-2) samples
+    pid_labels = torch.tensor([3, 3, -1, 0, 7, 3, -2, 7, 9, 0, 3])
+    features = torch.randn(pid_labels.numel(), 8, requires_grad=True)
+    scores, _, _ = layer(features, pid_labels)
+    scores.sum().backward()
+
+    _loop_lut_update(ref_table, features.detach(), pid_labels)
+    assert torch.allclose(layer.lookup_table, ref_table, atol=1e-6)
+    assert features.grad.shape == features.shape
+
+    # no labeled sample leaves the table untouched
+    before = layer.lookup_table.clone()
+    features = torch.randn(3, 8, requires_grad=True)
+    scores, _, _ = layer(features, torch.tensor([-1, -2, -1]))
+    scores.sum().backward()
+    assert torch.equal(layer.lookup_table, before)
+
+
+def test_unlabeled_matching_update_parity():
+    torch.manual_seed(0)
+    for layer_cls, num_dims in [(UnlabeledMatchingLayer, 64),
+                                (UnlabeledMatchingFullLayer, None)]:
+        layer = layer_cls(queue_size=7, feat_len=80)
+        ref_queue = layer.queue.clone()
+        ref_tail = layer.tail.clone()
+        # the second step wraps around, the third overflows the queue
+        for num in [5, 6, 20]:
+            pid_labels = torch.randint(-2, 3, (num, ))
+            pid_labels[::2] = -1
+            features = torch.randn(num, 80, requires_grad=True)
+            scores = layer(features, pid_labels)
+            scores.sum().backward()
+
+            _loop_enqueue(ref_queue, ref_tail, features.detach(), pid_labels,
+                          num_dims)
+            assert torch.equal(layer.queue, ref_queue)
+            assert layer.tail.item() == ref_tail.item()
+
+
+def test_oim_loss_update_parity():
+    torch.manual_seed(0)
+    loss_func = OIMLoss(num_features=8, num_pids=10, num_cq_size=7)
+    loss_func.lut.copy_(
+        torch.nn.functional.normalize(torch.randn(10, 8), dim=1))
+    ref_lut = loss_func.lut.clone()
+    ref_cq = loss_func.cq.clone()
+    ref_header = 0
+    for _ in range(3):
+        roi_label = torch.tensor([3, 3, -1, 0, 7, 3, -2, 7, -1, 9, 0, 3, -1])
+        inputs = torch.randn(roi_label.numel(), 8, requires_grad=True)
+        loss_func(inputs, roi_label).backward()
+
+        for x, y in zip(inputs.detach(), roi_label):
+            if y >= 0:
+                ref_lut[y] = 0.5 * ref_lut[y] + 0.5 * x
+                ref_lut[y] /= ref_lut[y].norm()
+            elif y == -1:
+                ref_cq[ref_header] = x
+                ref_header = (ref_header + 1) % 7
+        assert torch.allclose(loss_func.lut, ref_lut, atol=1e-6)
+        assert torch.equal(loss_func.cq, ref_cq)
+        assert loss_func.header_cq.item() == ref_header
+
+
+def test_priority_enqueue_parity():
+    torch.manual_seed(0)
+    queue = torch.zeros(9, 4)
+    queue_omega = torch.zeros(9)
+    ref_queue, ref_omega = queue.clone(), queue_omega.clone()
+    # few distinct omegas to exercise the ties, the zero-initialized queue
+    # first takes every candidate in its first slot, then fills up; the last
+    # step has more candidates than slots
+    for num in [4, 6, 12, 30]:
+        features = torch.randn(num, 4)
+        omegas = torch.randint(0, 4, (num, )).float() / 2
+        if num == 4:
+            omegas.zero_()
+        priority_enqueue_(queue, queue_omega, features, omegas)
+        _loop_priority_enqueue(ref_queue, ref_omega, features, omegas)
+        assert torch.equal(queue, ref_queue)
+        assert torch.equal(queue_omega, ref_omega)
+        queue_omega *= 0.9
+        ref_omega *= 0.9
+
+    # no candidate above the lowest omega
+    priority_enqueue_(queue, queue_omega, torch.randn(3, 4), -torch.ones(3))
+    assert torch.equal(queue, ref_queue)
+    priority_enqueue_(queue, queue_omega, torch.randn(0, 4), torch.ones(0))
+    assert torch.equal(queue, ref_queue)
+
+
+def test_hoim_loss_update_parity():
+    torch.manual_seed(0)
+    loss_func = HOIMLoss(8, 10, 7, 5, 0.5, 30)
+    loss_func.lut.copy_(F.normalize(torch.randn(10, 8), dim=1))
+    ref_lut = loss_func.lut.clone()
+    ref_cq, ref_cq_omega = loss_func.cq.clone(), loss_func.cq_omega.clone()
+    ref_cqb, ref_cqb_omega = loss_func.cqb.clone(), loss_func.cqb_omega.clone()
+    for _ in range(4):
+        roi_label = torch.randint(-2, 12, (16, ))
+        roi_label[:3] = torch.tensor([-2, -1, 3])
+        inputs = F.normalize(torch.randn(16, 8), dim=1).requires_grad_()
+        with torch.no_grad():
+            labeled = inputs.mm(ref_lut.t())
+            unlabeled = inputs.mm(ref_cq.t())
+            background = inputs.mm(ref_cqb.t())
+            omegas = labeled.max(dim=1)[0] / (
+                unlabeled.max(dim=1)[0] + 1e-12)
+            omegas_b = torch.cat([labeled, unlabeled], dim=1).max(
+                dim=1)[0] / (background.max(dim=1)[0] + 1e-12)
+        _, loss_det, loss_oim = loss_func(inputs, roi_label)
+        (loss_det + loss_oim).backward()
+
+        x = inputs.detach()
+        for i, y in enumerate(roi_label):
+            if y == -2:
+                _loop_priority_enqueue(ref_cqb, ref_cqb_omega, x[i:i + 1],
+                                       omegas_b[i:i + 1])
+            elif 0 <= y < 10:
+                updated = 0.5 * ref_lut[y] + 0.5 * x[i]
+                ref_lut[y] = updated / updated.norm()
+            else:
+                _loop_priority_enqueue(ref_cq, ref_cq_omega, x[i:i + 1],
+                                       omegas[i:i + 1])
+        ref_cq_omega *= 0.99
+        ref_cqb_omega *= 0.99
+        assert torch.allclose(loss_func.lut, ref_lut, atol=1e-6)
+        assert torch.equal(loss_func.cq, ref_cq)
+        assert torch.equal(loss_func.cqb, ref_cqb)
+        assert torch.allclose(loss_func.cq_omega, ref_cq_omega)
+        assert torch.allclose(loss_func.cqb_omega, ref_cqb_omega)
+
+
+def _sync_memory_worker(rank, world_size, port):
+    dist.init_process_group(
+        'gloo',
+        init_method=f'tcp://127.0.0.1:{port}',
+        rank=rank,
+        world_size=world_size)
+    torch.manual_seed(0)
+    labeled = LabeledMatchingLayerQueue(
+        num_persons=10, feat_len=8, sync_memory=True)
+    unlabeled = UnlabeledMatchingLayer(
+        queue_size=7, feat_len=8, sync_memory=True)
+    oim_loss = OIMLoss(
+        num_features=8, num_pids=10, num_cq_size=7, sync_memory=True)
+    ref_labeled = LabeledMatchingLayerQueue(num_persons=10, feat_len=8)
+    ref_unlabeled = UnlabeledMatchingLayer(queue_size=7, feat_len=8)
+    ref_oim_loss = OIMLoss(num_features=8, num_pids=10, num_cq_size=7)
+
+    for step in range(3):
+        # every rank holds a different number of samples
+        all_feats, all_pids = [], []
+        for i in range(world_size):
+            generator = torch.Generator().manual_seed(step * world_size + i)
+            num = 3 + 2 * i + step
+            all_feats.append(torch.randn(num, 8, generator=generator))
+            all_pids.append(
+                torch.randint(-2, 10, (num, ), generator=generator))
+        feats = all_feats[rank].requires_grad_()
+        pids = all_pids[rank]
+        scores, _, _ = labeled(feats, pids)
+        scores.sum().backward()
+        unlabeled(feats, pids).sum().backward()
+        oim_loss(feats, pids).backward()
+
+        # a single process seeing all samples in rank order
+        feats = torch.cat(all_feats).requires_grad_()
+        pids = torch.cat(all_pids)
+        scores, _, _ = ref_labeled(feats, pids)
+        scores.sum().backward()
+        ref_unlabeled(feats, pids).sum().backward()
+        ref_oim_loss(feats, pids).backward()
+
+    memory = torch.cat([
+        labeled.lookup_table.flatten(),
+        unlabeled.queue.flatten(),
+        unlabeled.tail.float().flatten(),
+        oim_loss.lut.flatten(),
+        oim_loss.cq.flatten(),
+        oim_loss.header_cq.float().flatten()
+    ])
+    ref_memory = torch.cat([
+        ref_labeled.lookup_table.flatten(),
+        ref_unlabeled.queue.flatten(),
+        ref_unlabeled.tail.float().flatten(),
+        ref_oim_loss.lut.flatten(),
+        ref_oim_loss.cq.flatten(),
+        ref_oim_loss.header_cq.float().flatten()
+    ])
+    memories = [torch.empty_like(memory) for _ in range(world_size)]
+    dist.all_gather(memories, memory)
+    dist.destroy_process_group()
+    for other in memories:
+        assert torch.equal(other, memory)
+    assert torch.equal(memory, ref_memory)
+
+
+def test_sync_memory_gloo():
+    if not dist.is_available():
+        return
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    world_size = 2
+    mp.spawn(
+        _sync_memory_worker,
+        args=(world_size, port),
+        nprocs=world_size,
+        join=True)
+
+
+def _memory_scores(memory_dtype, device='cpu', steps=5):
+    torch.manual_seed(0)
+    labeled = LabeledMatchingLayerQueue(
+        num_persons=20, feat_len=32, memory_dtype=memory_dtype)
+    unlabeled = UnlabeledMatchingLayer(
+        queue_size=16, feat_len=64, memory_dtype=memory_dtype)
+    oim_loss = OIMLoss(
+        num_features=32,
+        num_pids=20,
+        num_cq_size=16,
+        memory_dtype=memory_dtype)
+    hoim_loss = HOIMLoss(
+        32, 20, 16, 8, 0.5, 30, memory_dtype=memory_dtype)
+    for layer in [labeled, unlabeled, oim_loss, hoim_loss]:
+        layer.to(device)
+    init = F.normalize(torch.randn(20, 32), dim=1).to(device)
+    for lut in [labeled.lookup_table, oim_loss.lut, hoim_loss.lut]:
+        lut.copy_(init)
+
+    for _ in range(steps):
+        pids = torch.randint(-2, 20, (24, )).to(device)
+        feats = F.normalize(
+            torch.randn(24, 64), dim=1).to(device).requires_grad_()
+        scores, _, _ = labeled(feats[:, :32], pids)
+        scores.sum().backward()
+        unlabeled(feats, pids).sum().backward()
+        oim_loss(feats[:, :32], pids).backward()
+        _, loss_det, loss_oim = hoim_loss(feats[:, :32], pids)
+        (loss_det + loss_oim).backward()
+
+    with torch.no_grad():
+        probes = F.normalize(torch.randn(50, 64), dim=1).to(device)
+        pids = torch.full((50, ), -1, device=device)
+        scores = torch.cat([
+            labeled(probes[:, :32], pids)[0],
+            unlabeled(probes, pids),
+            oim_loss.lut.float().mm(probes[:, :32].t()).t(),
+            oim_loss.cq.float().mm(probes[:, :32].t()).t(),
+            hoim_loss.lut.float().mm(probes[:, :32].t()).t(),
+        ], dim=1)
+    buffers = [
+        labeled.lookup_table, unlabeled.queue, oim_loss.lut, oim_loss.cq,
+        hoim_loss.lut, hoim_loss.cq, hoim_loss.cqb
+    ]
+    return scores, buffers
+
+
+@pytest.mark.parametrize('device', [
+    'cpu',
+    pytest.param(
+        'cuda',
+        marks=pytest.mark.skipif(
+            not torch.cuda.is_available(), reason='requires CUDA support'))
+])
+def test_low_precision_memory_drift(device):
+    ref_scores, ref_buffers = _memory_scores(None, device)
+    for memory_dtype, dtype, tol in [('float16', torch.float16, 1e-3),
+                                     ('bfloat16', torch.bfloat16, 1e-2)]:
+        scores, buffers = _memory_scores(memory_dtype, device)
+        assert scores.dtype == torch.float32
+        for buffer, ref_buffer in zip(buffers, ref_buffers):
+            assert buffer.dtype == dtype
+            assert buffer.element_size() * 2 == ref_buffer.element_size()
+        assert (scores - ref_scores).abs().max() < tol
+
+
+@pytest.mark.parametrize('device', [
+    'cpu',
+    pytest.param(
+        'cuda',
+        marks=pytest.mark.skipif(
+            not torch.cuda.is_available(), reason='requires CUDA support'))
+])
+def test_memory_mm(device, monkeypatch):
+    torch.manual_seed(0)
+    input = torch.randn(8, 32, device=device) * 1e-3
+    for dtype in (torch.float16, torch.bfloat16):
+        memory = torch.randn(32, 16, device=device).to(dtype)
+        scores = memory_mm(input, memory)
+        assert scores.dtype == torch.float32
+        if device == 'cuda':
+            # the half operands are multiplied with float32 accumulation
+            torch.testing.assert_close(
+                scores, input.to(dtype).mm(memory).float())
+            continue
+        # the inputs are not rounded to the memory dtype
+        torch.testing.assert_close(
+            scores, input.mm(memory.float()), rtol=1e-5, atol=1e-7)
+        assert not torch.equal(scores,
+                               input.to(dtype).mm(memory).float())
+        # the memory is upcast 3 columns at a time
+        monkeypatch.setattr(oim_utils, '_MEMORY_MM_CHUNK', 32 * 3)
+        torch.testing.assert_close(
+            memory_mm(input, memory), scores, rtol=1e-6, atol=1e-9)
+        monkeypatch.undo()
@@ -0,0 +1,54 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import torch
+import torch.nn as nn
+
+from mmdet.models.dense_heads.triplet_loss import TripletLossFilter
+
+
+def _loop_triplet_loss(inputs, targets, margin=0.3):
+    keep = [i for i in range(len(targets)) if targets[i] != -1]
+    if len(set(targets[keep].tolist())) < 2:
+        return inputs.new_zeros(())
+    inputs = inputs[keep]
+    targets = targets[keep]
+    n = inputs.size(0)
+    dist = torch.pow(inputs, 2).sum(dim=1, keepdim=True).expand(n, n)
+    dist = dist + dist.t()
+    dist = torch.addmm(dist, inputs, inputs.t(), beta=1, alpha=-2)
+    dist = dist.clamp(min=1e-12).sqrt()
+    mask = targets.expand(n, n).eq(targets.expand(n, n).t())
+    dist_ap, dist_an = [], []
+    for i in range(n):
+        dist_ap.append(dist[i][mask[i]].max())
+        dist_an.append(dist[i][mask[i] == 0].min())
+    dist_ap = torch.stack(dist_ap)
+    dist_an = torch.stack(dist_an)
+    y = torch.ones_like(dist_an)
+    return nn.MarginRankingLoss(margin=margin)(dist_an, dist_ap, y)
+
+
+def test_triplet_loss_filter():
+    torch.manual_seed(0)
+    targets = torch.randint(-1, 6, (40, ))
+    inputs = torch.randn(40, 16)
+    inputs = inputs / inputs.norm(dim=1, keepdim=True)
+    ref_inputs = inputs.clone().requires_grad_()
+    ref_loss = _loop_triplet_loss(ref_inputs, targets)
+    ref_loss.backward()
+
+    for chunk_size in [None, 7, 64]:
+        loss_func = TripletLossFilter(chunk_size=chunk_size)
+        inputs_ = inputs.clone().requires_grad_()
+        loss = loss_func(inputs_, targets)
+        loss.backward()
+        assert torch.allclose(loss, ref_loss, atol=1e-6)
+        assert torch.allclose(inputs_.grad, ref_inputs.grad, atol=1e-6)
+
+    # less than two identities besides noise gives zero loss
+    for chunk_size in [None, 7]:
+        loss_func = TripletLossFilter(chunk_size=chunk_size)
+        targets = torch.tensor([-1, 3, 3, -1, 3])
+        loss = loss_func(torch.randn(5, 16), targets)
+        assert loss.item() == 0
+        loss = loss_func(torch.randn(3, 16), torch.full((3, ), -1))
+        assert loss.item() == 0
@@ -922,3 +922,69 @@ def test_mask2former_forward():
                                       rescale=True,
                                       return_loss=False)
         batch_results.append(result)
+
+
+def test_reid_aug_test_parity(monkeypatch):
+    """Test that every augmentation gives the results of testing it alone."""
+    import torch.nn.functional as F
+
+    from mmdet.apis import init_detector
+    from mmdet.core import bbox_mapping
+    from mmdet.models.detectors import single_two_stage17_6_prw
+
+    config_file = join(
+        _get_config_directory(), 'person_search',
+        'faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py')
+    detector = init_detector(config_file, device='cpu')
+    detector.bbox_head.test_cfg.score_thr = 0.
+
+    aug_results, merged = [], []
+    merge_aug_reid_results = single_two_stage17_6_prw.merge_aug_reid_results
+
+    def record_aug_results(aug_bboxes, img_metas, test_cfg):
+        aug_results.append(aug_bboxes)
+        merged.append(
+            merge_aug_reid_results(aug_bboxes, img_metas, test_cfg))
+        return merged[-1]
+
+    monkeypatch.setattr(single_two_stage17_6_prw, 'merge_aug_reid_results',
+                        record_aug_results)
+
+    torch.manual_seed(0)
+    large = torch.randn(1, 3, 128, 128)
+    # the flip shares the shape of the large scale and is batched with it
+    imgs = [large, large.flip(3), torch.randn(1, 3, 96, 96)]
+    img_metas = [[
+        dict(
+            img_shape=(size, size, 3),
+            ori_shape=(96, 96, 3),
+            pad_shape=(size, size, 3),
+            scale_factor=np.array([size / 96] * 4, dtype=np.float32),
+            flip=flip,
+            flip_direction='horizontal' if flip else None)
+    ] for size, flip in ((128, False), (128, True), (96, False))]
+    with torch.no_grad():
+        bbox_results_n, bbox_results_b = detector.aug_test(
+            imgs, img_metas, rescale=True)
+
+        det_bboxes = merged[0][0]
+        assert len(det_bboxes) > 0
+        aug_feats = []
+        for img, metas, bbox_list in zip(imgs, img_metas, aug_results[0]):
+            xb, xn = detector.extract_feat(img)
+            (bboxes, labels, feats), = detector.bbox_head.get_bboxes(
+                *detector.bbox_head(xn), metas, rescale=False)
+            assert torch.allclose(bbox_list[0], bboxes, atol=1e-3)
+            assert torch.equal(bbox_list[1], labels)
+            assert torch.allclose(bbox_list[2], feats, atol=1e-4)
+
+            meta = metas[0]
+            proposals = bbox_mapping(det_bboxes[:, :4], meta['img_shape'],
+                                     meta['scale_factor'], meta['flip'],
+                                     meta['flip_direction'])
+            _, roi_feats = detector.roi_head.simple_test(
+                xb, [proposals], metas, rescale=False, use_rpn=False)
+            aug_feats.append(F.normalize(roi_feats))
+    roi_feats = F.normalize(torch.stack(aug_feats).mean(dim=0))
+    np.testing.assert_allclose(
+        bbox_results_b[0][:, 5:], roi_feats.numpy(), rtol=1e-4, atol=1e-5)
@@ -5,7 +5,8 @@ from torch.nn.modules.batchnorm import _BatchNorm
 
 from mmdet.models.necks import (FPG, FPN, FPN_CARAFE, NASFCOS_FPN, NASFPN,
                                 YOLOXPAFPN, ChannelMapper, CTResNetNeck,
-                                DilatedEncoder, DyHead, SSDNeck, YOLOV3Neck)
+                                DilatedEncoder, DyHead, FPNDcnLconv3Dcn,
+                                SSDNeck, YOLOV3Neck)
 
 
 def test_fpn():
@@ -670,3 +671,68 @@ def test_nasfcos_fpn():
             start_level=1,
             end_level=2,
             num_outs=3)
+
+
+def test_fpn_dcn_lconv3_dcn_active_levels():
+    s = 64
+    in_channels = [8, 16, 32, 64]
+    feats = [
+        torch.rand(1, in_channels[i], s // 2**i, s // 2**i)
+        for i in range(len(in_channels))
+    ]
+    for add_extra_convs in (False, 'on_input', 'on_output'):
+        neck = FPNDcnLconv3Dcn(
+            in_channels=in_channels,
+            out_channels=8,
+            start_level=1,
+            add_extra_convs=add_extra_convs,
+            num_outs=5)
+        outs = neck(feats)
+        assert len(outs) == 5
+        for active_levels in ((0, ), (1, 4), (3, )):
+            neck.active_levels = active_levels
+            active_outs = neck(feats)
+            assert len(active_outs) == len(active_levels)
+            for lvl, out in zip(active_levels, active_outs):
+                assert torch.equal(out, outs[lvl])
+        neck.active_levels = None
+
+    # only the first level is computed in test
+    neck.eval()
+    assert len(neck(feats)) == 1
+
+    # the fpn convs of the skipped levels are not built, so that every
+    # parameter gets a gradient
+    neck.train()
+    fast_neck = FPNDcnLconv3Dcn(
+        in_channels=in_channels,
+        out_channels=8,
+        start_level=1,
+        add_extra_convs='on_output',
+        num_outs=5,
+        active_levels=(0, 1))
+    assert [conv is not None for conv in fast_neck.fpn_convs
+            ] == [True, True, False, False, False]
+    fast_neck.load_state_dict(neck.state_dict())
+    outs = neck(feats)
+    fast_outs = fast_neck(feats)
+    for out, fast_out in zip(outs[:2], fast_outs):
+        assert torch.equal(out, fast_out)
+    sum(out.sum() for out in fast_outs).backward()
+    assert all(param.grad is not None for param in fast_neck.parameters())
+    fast_neck.eval()
+    assert torch.equal(fast_neck(feats)[0], neck.eval()(feats)[0])
+
+    with pytest.raises(AssertionError):
+        FPNDcnLconv3Dcn(
+            in_channels=in_channels,
+            out_channels=8,
+            num_outs=5,
+            active_levels=(5, ))
+    # level 0 is used in test
+    with pytest.raises(AssertionError):
+        FPNDcnLconv3Dcn(
+            in_channels=in_channels,
+            out_channels=8,
+            num_outs=5,
+            active_levels=(1, ))
@@ -0,0 +1,72 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+import torch.nn as nn
+
+from mmdet.models.backbones.replknet_strach import ReparamLargeKernelConv
+from mmdet.models.utils import check_deploy_equivalence, convert_to_deploy
+
+
+def _randomize_bns(model):
+    for m in model.modules():
+        if isinstance(m, nn.modules.batchnorm._BatchNorm):
+            m.running_mean.uniform_(-1, 1)
+            m.running_var.uniform_(0.5, 2)
+            if m.affine:
+                m.weight.data.uniform_(0.5, 2)
+                m.bias.data.uniform_(-1, 1)
+
+
+class ToyReidModel(nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.large_kernel = ReparamLargeKernelConv(
+            4, 4, kernel_size=7, stride=1, groups=4, small_kernel=3)
+        self.conv = nn.Conv2d(4, 8, 3, padding=1)
+        self.bn = nn.BatchNorm2d(8)
+        self.projector = nn.Sequential(nn.Linear(8, 6), nn.BatchNorm1d(6))
+        self.rescaler = nn.BatchNorm1d(1)
+
+    def forward(self, x):
+        x = self.bn(self.conv(self.large_kernel(x)))
+        x = x.mean(dim=(2, 3))
+        return self.projector(x), self.rescaler(x.norm(dim=1, keepdim=True))
+
+
+def test_convert_to_deploy():
+    model = ToyReidModel()
+    _randomize_bns(model)
+    model.eval()
+
+    deploy_model = ToyReidModel()
+    deploy_model.load_state_dict(model.state_dict())
+    deploy_model = convert_to_deploy(deploy_model)
+    assert not deploy_model.training
+    assert not hasattr(deploy_model.large_kernel, 'lkb_origin')
+    assert not hasattr(deploy_model.large_kernel, 'small_conv')
+    assert isinstance(deploy_model.bn, nn.Identity)
+    assert isinstance(deploy_model.projector[1], nn.Identity)
+    # a BN without a preceding layer is kept
+    assert isinstance(deploy_model.rescaler, nn.BatchNorm1d)
+
+    x = torch.rand(2, 4, 16, 16)
+    diff = check_deploy_equivalence(model, deploy_model, x, atol=1e-4)
+    assert diff <= 1e-4
+
+    # only the given converters are applied
+    partial_model = ToyReidModel()
+    partial_model.load_state_dict(model.state_dict())
+    partial_model = convert_to_deploy(partial_model, ['fold_linear_bn'])
+    assert hasattr(partial_model.large_kernel, 'lkb_origin')
+    assert isinstance(partial_model.bn, nn.BatchNorm2d)
+    assert isinstance(partial_model.projector[1], nn.Identity)
+    check_deploy_equivalence(model, partial_model, x)
+
+    with pytest.raises(KeyError):
+        convert_to_deploy(model, ['unknown'])
+
+    # a model computing something else fails the check
+    other_model = ToyReidModel().eval()
+    with pytest.raises(AssertionError):
+        check_deploy_equivalence(model, other_model, x)
@@ -3,7 +3,8 @@ import numpy as np
 import torch
 from torch.autograd import gradcheck
 
-from mmdet.models.utils import interpolate_as, sigmoid_geometric_mean
+from mmdet.models.utils import (interpolate_as, matched_identity_centroids,
+                                sigmoid_geometric_mean)
 
 
 def test_interpolate_as():
@@ -34,3 +35,52 @@ def test_sigmoid_geometric_mean():
     inputs = (x, y)
     test = gradcheck(sigmoid_geometric_mean, inputs, eps=1e-6, atol=1e-4)
     assert test
+
+
+def test_matched_identity_centroids(monkeypatch):
+
+    def _loop_centroids(feats1, pids1, feats2, pids2):
+        groups1, groups2 = {}, {}
+        for feat, pid in zip(feats1, pids1.tolist()):
+            if pid >= 0:
+                groups1.setdefault(pid, []).append(feat)
+        for feat, pid in zip(feats2, pids2.tolist()):
+            if pid >= 0:
+                groups2.setdefault(pid, []).append(feat)
+        means1, means2 = [], []
+        for pid, group in groups1.items():
+            if pid in groups2:
+                means1.append(torch.stack(group).mean(0))
+                means2.append(torch.stack(groups2[pid]).mean(0))
+        if not means1:
+            return feats1.new_zeros(0, feats1.size(1)), feats2.new_zeros(
+                0, feats2.size(1))
+        return (torch.nn.functional.normalize(torch.stack(means1)),
+                torch.nn.functional.normalize(torch.stack(means2)))
+
+    def scatter_reduce_(*args, **kwargs):
+        raise AttributeError('scatter_reduce_ needs PyTorch >= 1.12')
+
+    monkeypatch.setattr(torch.Tensor, 'scatter_reduce_', scatter_reduce_)
+    torch.manual_seed(0)
+    feats1 = torch.randn(50, 16, requires_grad=True)
+    feats2 = torch.randn(30, 16)
+    pids1 = torch.randint(-2, 12, (50, ))
+    pids2 = torch.randint(-2, 12, (30, ))
+    centroids1, centroids2 = matched_identity_centroids(
+        feats1, pids1, feats2, pids2)
+    ref1, ref2 = _loop_centroids(feats1, pids1, feats2, pids2)
+    assert torch.allclose(centroids1, ref1, atol=1e-6)
+    assert torch.allclose(centroids2, ref2, atol=1e-6)
+
+    grad, = torch.autograd.grad(centroids1.sum(), feats1)
+    ref_grad, = torch.autograd.grad(ref1.sum(), feats1)
+    assert torch.allclose(grad, ref_grad, atol=1e-6)
+
+    # no identity in common
+    centroids1, centroids2 = matched_identity_centroids(
+        feats1, torch.full((50, ), -1), feats2, pids2)
+    assert centroids1.shape == (0, 16) and centroids2.shape == (0, 16)
+    centroids1, centroids2 = matched_identity_centroids(
+        feats1[:0], pids1[:0], feats2, pids2)
+    assert centroids1.shape == (0, 16) and centroids2.shape == (0, 16)
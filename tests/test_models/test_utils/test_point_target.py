@@ -0,0 +1,104 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+
+from mmdet.models.utils import fcos_point_targets, get_point_chunk_size
+
+INF = 1e8
+
+
+def _dense_point_targets(points, gt_bboxes, regress_ranges,
+                         num_points_per_lvl, strides, radius):
+    """Reference assignment materializing all (point, gt) pairs."""
+    num_points = points.size(0)
+    num_gts = gt_bboxes.size(0)
+    areas = (gt_bboxes[:, 2] - gt_bboxes[:, 0]) * (
+        gt_bboxes[:, 3] - gt_bboxes[:, 1])
+    areas = areas[None].repeat(num_points, 1)
+    regress_ranges = regress_ranges[:, None, :].expand(num_points, num_gts, 2)
+    gt_bboxes = gt_bboxes[None].expand(num_points, num_gts, 4)
+    xs = points[:, 0, None].expand(num_points, num_gts)
+    ys = points[:, 1, None].expand(num_points, num_gts)
+    bbox_targets = torch.stack(
+        (xs - gt_bboxes[..., 0], ys - gt_bboxes[..., 1],
+         gt_bboxes[..., 2] - xs, gt_bboxes[..., 3] - ys), -1)
+    if radius is not None:
+        center_xs = (gt_bboxes[..., 0] + gt_bboxes[..., 2]) / 2
+        center_ys = (gt_bboxes[..., 1] + gt_bboxes[..., 3]) / 2
+        stride = center_xs.new_zeros(center_xs.shape)
+        lvl_begin = 0
+        for lvl_idx, num_points_lvl in enumerate(num_points_per_lvl):
+            lvl_end = lvl_begin + num_points_lvl
+            stride[lvl_begin:lvl_end] = strides[lvl_idx] * radius
+            lvl_begin = lvl_end
+        center_gts = torch.stack(
+            (torch.max(center_xs - stride, gt_bboxes[..., 0]),
+             torch.max(center_ys - stride, gt_bboxes[..., 1]),
+             torch.min(center_xs + stride, gt_bboxes[..., 2]),
+             torch.min(center_ys + stride, gt_bboxes[..., 3])), -1)
+        center_bbox = torch.stack(
+            (xs - center_gts[..., 0], ys - center_gts[..., 1],
+             center_gts[..., 2] - xs, center_gts[..., 3] - ys), -1)
+        inside_gt_bbox_mask = center_bbox.min(-1)[0] > 0
+    else:
+        inside_gt_bbox_mask = bbox_targets.min(-1)[0] > 0
+    max_regress_distance = bbox_targets.max(-1)[0]
+    inside_regress_range = (
+        (max_regress_distance >= regress_ranges[..., 0])
+        & (max_regress_distance <= regress_ranges[..., 1]))
+    areas[inside_gt_bbox_mask == 0] = INF
+    areas[inside_regress_range == 0] = INF
+    min_area, min_area_inds = areas.min(dim=1)
+    return min_area, min_area_inds, bbox_targets[range(num_points),
+                                                 min_area_inds]
+
+
+@pytest.mark.parametrize('radius', [None, 1.5])
+@pytest.mark.parametrize('memory_budget', [None, 0.01, 1e-6])
+def test_fcos_point_targets(radius, memory_budget):
+    torch.manual_seed(0)
+    s = 256
+    strides = [8, 16, 32, 64, 128]
+    regress_ranges = [(-1, 64), (64, 128), (128, 256), (256, 512),
+                      (512, INF)]
+    points, ranges = [], []
+    for stride, regress_range in zip(strides, regress_ranges):
+        ys, xs = torch.meshgrid(
+            torch.arange(0, s, stride).float(),
+            torch.arange(0, s, stride).float())
+        lvl_points = torch.stack((xs.reshape(-1), ys.reshape(-1)),
+                                 -1) + stride // 2
+        points.append(lvl_points)
+        ranges.append(lvl_points.new_tensor(regress_range)[None].expand_as(
+            lvl_points))
+    num_points_per_lvl = [len(lvl_points) for lvl_points in points]
+    points = torch.cat(points)
+    ranges = torch.cat(ranges)
+
+    xy1 = torch.rand(30, 2) * s * 0.8
+    wh = torch.rand(30, 2) * s * 0.5 + 4
+    # duplicated boxes have equal areas
+    gt_bboxes = torch.cat([xy1, xy1 + wh], dim=1).repeat(2, 1)
+
+    expected = _dense_point_targets(points, gt_bboxes, ranges,
+                                    num_points_per_lvl, strides, radius)
+    results = fcos_point_targets(
+        points,
+        gt_bboxes,
+        ranges,
+        num_points_per_lvl,
+        strides,
+        center_sample_radius=radius,
+        memory_budget=memory_budget,
+        inf=INF)
+    assert (expected[0] < INF).any()
+    for result, expected_result in zip(results, expected):
+        assert torch.equal(result, expected_result)
+
+
+def test_get_point_chunk_size():
+    assert get_point_chunk_size(10) is None
+    assert get_point_chunk_size(16, memory_budget=1) == 2**20 // (16 * 64)
+    # at least one point per chunk
+    assert get_point_chunk_size(1000, memory_budget=1e-9) == 1
+    assert get_point_chunk_size(0, memory_budget=1) > 0
@@ -1,9 +1,13 @@
 import os
 from pathlib import Path
 
+import mmcv
+import numpy as np
 import pytest
+import torch
+import torch.nn as nn
 
-from mmdet.apis import init_detector
+from mmdet.apis import InferenceEngine, init_detector
 
 
 def test_init_detector():
@@ -30,3 +34,41 @@ def test_init_detector():
     with pytest.raises(TypeError):
         config_list = [config_file]
         model = init_detector(config_list)  # noqa: F841
+
+
+def test_inference_engine():
+    project_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+    project_dir = os.path.join(project_dir, '..')
+    model = nn.Conv2d(3, 3, 1)
+    model.cfg = mmcv.Config.fromfile(
+        os.path.join(project_dir,
+                     'configs/retinanet/retinanet_r50_fpn_1x_coco.py'))
+    model.cfg.data.test.pipeline[1].img_scale = (320, 200)
+
+    rng = np.random.RandomState(0)
+    imgs = [
+        rng.randint(0, 256, (100, 150, 3)).astype(np.uint8),
+        rng.randint(0, 256, (240, 120, 3)).astype(np.uint8),
+        os.path.join(project_dir, 'tests/data/color.jpg')
+    ]
+    engine = InferenceEngine(model)
+    assert engine.batched
+    data = engine.preprocess(imgs)
+    # the reference is the test pipeline run image by image
+    engine.batched = False
+    expected = engine.preprocess(imgs)
+    assert data['img'][0].shape == expected['img'][0].shape
+    assert torch.allclose(data['img'][0], expected['img'][0], atol=1e-4)
+    for img_meta, expected_meta in zip(data['img_metas'][0],
+                                       expected['img_metas'][0]):
+        assert img_meta.keys() == expected_meta.keys()
+        for key, value in expected_meta.items():
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    np.testing.assert_array_equal(img_meta[key][k], v)
+            else:
+                np.testing.assert_array_equal(img_meta[key], value)
+
+    # flip augmentation is not batched
+    model.cfg.data.test.pipeline[1].flip = True
+    assert not InferenceEngine(model).batched
@@ -0,0 +1,175 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os
+import os.path as osp
+import tempfile
+
+import mmcv
+import numpy as np
+import torch
+
+from mmdet.apis import init_detector
+from mmdet.apis.query import (_select_query_dets, extract_query_features,
+                              query_cache_key)
+from mmdet.core import ReidResultStore
+from mmdet.datasets import CuhkDataset
+
+
+def test_select_query_dets():
+    rois = [[0, 0, 10, 20], [50, 50, 60, 80], [20, 0, 30, 20]]
+    query_infos = [
+        dict(roi=np.array([roi], dtype=np.float32)) for roi in rois
+    ]
+    dets = np.zeros((3, 5 + 2), dtype=np.float32)
+    dets[:, :4] = [[49, 51, 61, 80], [1, 0, 10, 21], [100, 100, 120, 140]]
+    dets[:, 5] = [1, 2, 3]
+
+    # one sample per probe
+    results = [[dets], [dets], [dets[:0]]]
+    query_dets = _select_query_dets(results, query_infos)
+    assert [det[0][0, 5] for det in query_dets[:2]] == [2, 1]
+    # probes without detections keep their roi and a zero feature
+    np.testing.assert_array_equal(query_dets[2][0][0, :4], rois[2])
+    assert (query_dets[2][0][0, 4:] == 0).all()
+
+    # probes 0 and 1 share an image
+    grouped = _select_query_dets([[dets], [dets[:0]]], query_infos,
+                                 [[1, 0], [2]])
+    for det, expected in zip(grouped, query_dets):
+        np.testing.assert_array_equal(det[0], expected[0])
+
+
+def test_simple_test_query():
+    project_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+    project_dir = os.path.join(project_dir, '..')
+    config_file = os.path.join(
+        project_dir, 'configs/person_search/'
+        'faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py')
+    model = init_detector(config_file, device='cpu')
+    model.eval()
+
+    torch.manual_seed(0)
+    img = torch.randn(2, 3, 128, 128)
+    img_metas = [
+        dict(
+            img_shape=(128, 128, 3),
+            ori_shape=(116, 106, 3),
+            pad_shape=(128, 128, 3),
+            scale_factor=np.array([1.1, 1.2, 1.1, 1.2], dtype=np.float32),
+            flip=False) for _ in range(2)
+    ]
+    boxes = torch.tensor([[10., 10., 60., 100.], [40., 20., 100., 120.],
+                          [10., 10., 60., 100.]])
+    with torch.no_grad():
+        results = model.simple_test_query(
+            img, img_metas, [boxes, boxes[1:2]], rescale=True)
+        single = model.simple_test_query(
+            img[1:], img_metas[1:], [boxes[1:2]], rescale=False)
+        # ``simple_test`` forwards given boxes to ``simple_test_query``
+        forwarded = model.simple_test(
+            img[1:], img_metas[1:], proposals=[boxes[1:2]], rescale=False)
+
+    assert [len(result[0]) for result in results] == [3, 1]
+    dets = results[0][0]
+    assert dets.dtype == np.float32
+    # the given boxes are returned in the original image space
+    np.testing.assert_allclose(
+        dets[:, :4], boxes.numpy() / img_metas[0]['scale_factor'], rtol=1e-6)
+    assert (dets[:, 4] == 1).all()
+    # the feature of every box is pooled from its own RoI
+    feats = dets[:, 5:]
+    assert feats.shape[1] > 0
+    np.testing.assert_allclose(feats[0], feats[2], rtol=1e-5, atol=1e-6)
+    assert not np.allclose(feats[0], feats[1])
+
+    np.testing.assert_array_equal(single[0][0][:, :4], boxes[1:2].numpy())
+    # the images of a batch are pooled separately
+    np.testing.assert_allclose(
+        results[1][0][:, 5:], single[0][0][:, 5:], rtol=1e-4, atol=1e-5)
+    np.testing.assert_array_equal(forwarded[0][0], single[0][0])
+
+
+def _create_query_dataset(tmp_dir):
+    ann_file = osp.join(tmp_dir, 'fake_data.json')
+    images = [
+        dict(id=i, width=640, height=480, file_name=f'img_{i}.jpg')
+        for i in range(3)
+    ]
+    categories = [dict(id=1, name='person', supercategory='person')]
+    mmcv.dump(
+        dict(images=images, annotations=[], categories=categories), ann_file)
+    dataset = CuhkDataset(
+        ann_file=ann_file, pipeline=[], query_test_pipeline=[], test_mode=True)
+    dataset._query_infos = [
+        dict(
+            filename=f'img_{i}.jpg',
+            width=640,
+            height=480,
+            roi=np.array([[i, i, i + 10, i + 20]], dtype=np.float32))
+        for i in (0, 1, 0)
+    ]
+    return dataset
+
+
+def test_extract_query_features(monkeypatch):
+    tmp_dir = tempfile.TemporaryDirectory()
+    dataset = _create_query_dataset(tmp_dir.name)
+    gallery_infos = dataset.data_infos
+    gallery_pipeline = dataset.pipeline
+
+    calls = []
+
+    def fake_build_dataloader(dataset, **kwargs):
+        return dataset
+
+    def fake_single_gpu_test(model, data_loader):
+        calls.append(list(data_loader.query_groups))
+        results = []
+        for rois in data_loader.proposals:
+            dets = np.zeros((len(rois), 5 + 2), dtype=np.float32)
+            dets[:, :4] = rois
+            dets[:, 5] = rois[:, 0]
+            results.append([dets])
+        return results
+
+    monkeypatch.setattr('mmdet.apis.query.build_dataloader',
+                        fake_build_dataloader)
+    monkeypatch.setattr('mmdet.apis.query.single_gpu_test',
+                        fake_single_gpu_test)
+
+    query_results = extract_query_features(None, dataset, group_by_image=True)
+    assert calls == [[[0, 2], [1]]]
+    assert [det[0][0, 5] for det in query_results] == [0, 1, 0]
+    # the dataset keeps its gallery samples
+    assert not dataset.query_mode
+    assert dataset.data_infos is gallery_infos
+    assert dataset.pipeline is gallery_pipeline
+    assert dataset.proposals is None
+    assert len(dataset) == 3
+
+    # the features are cached per checkpoint content and probe list
+    checkpoint = osp.join(tmp_dir.name, 'model.pth')
+    with open(checkpoint, 'wb') as f:
+        f.write(b'weights')
+    cache_dir = osp.join(tmp_dir.name, 'cache')
+    kwargs = dict(checkpoint=checkpoint, cache_dir=cache_dir)
+    key = query_cache_key(checkpoint, dataset.load_query_infos())
+    written = extract_query_features(None, dataset, **kwargs)
+    assert len(calls) == 2
+    assert ReidResultStore.is_store(osp.join(cache_dir, key))
+
+    cached = extract_query_features(None, dataset, **kwargs)
+    assert len(calls) == 2
+    assert isinstance(cached, ReidResultStore)
+    for det, expected in zip(cached, written):
+        np.testing.assert_array_equal(det[0], expected[0])
+
+    # another checkpoint or probe list misses the cache
+    with open(checkpoint, 'wb') as f:
+        f.write(b'other weights')
+    assert query_cache_key(checkpoint, dataset.load_query_infos()) != key
+    extract_query_features(None, dataset, **kwargs)
+    assert len(calls) == 3
+    dataset._query_infos[0]['roi'] += 1
+    extract_query_features(None, dataset, **kwargs)
+    assert len(calls) == 4
+    tmp_dir.cleanup()
@@ -0,0 +1,89 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import json
+import os.path as osp
+import tempfile
+
+import numpy as np
+
+from mmdet.apis import GallerySearchIndex, build_search_index
+
+
+def _random_results(rng, num_imgs, feat_dim=16):
+    results = []
+    for _ in range(num_imgs):
+        n = rng.randint(0, 8)
+        xy = rng.rand(n, 2) * 100
+        dets = np.concatenate(
+            [xy, xy + 20, rng.rand(n, 1),
+             rng.randn(n, feat_dim)], axis=1).astype(np.float32)
+        results.append([dets])
+    return results
+
+
+def _brute_force(results, query_feats, topk, det_thresh):
+    dets = np.concatenate([result[0] for result in results])
+    dets = dets[dets[:, 4] >= det_thresh]
+    feats = dets[:, 5:] / np.linalg.norm(dets[:, 5:], axis=1, keepdims=True)
+    queries = query_feats / np.linalg.norm(
+        query_feats, axis=1, keepdims=True)
+    sims = queries.dot(feats.T)
+    inds = np.argsort(-sims, axis=1, kind='stable')[:, :topk]
+    return np.take_along_axis(sims, inds, axis=1), inds, dets
+
+
+def test_gallery_search_index():
+    rng = np.random.RandomState(0)
+    results = _random_results(rng, 40)
+    img_names = [f'{i:04d}.jpg' for i in range(40)]
+    query_feats = rng.randn(7, 16).astype(np.float32)
+    ref_sims, ref_inds, ref_dets = _brute_force(results, query_feats, 5, 0.3)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = build_search_index(
+            results[:25], img_names[:25], tmpdir, det_thresh=0.3,
+            block_size=16)
+        # incremental appends to a reopened index
+        index = GallerySearchIndex(tmpdir)
+        for result, img_name in zip(results[25:], img_names[25:]):
+            index.add_image(img_name, result, det_thresh=0.3)
+        assert len(index) == len(ref_dets)
+        assert index.num_images == 40
+
+        sims, inds = index.search(query_feats, topk=5, query_block_size=3)
+        assert np.array_equal(inds, ref_inds)
+        assert np.allclose(sims, ref_sims, atol=1e-6)
+        assert all(size == 16 for size in index.meta['block_sizes'][:-1])
+
+        boxes = GallerySearchIndex(tmpdir).get_boxes(inds[0])
+        for box, ind in zip(boxes, ref_inds[0]):
+            assert np.allclose(box['bbox'], ref_dets[ind, :4])
+            assert box['img_name'] in img_names
+
+        # the image ids are stored exactly
+        ids = np.load(osp.join(tmpdir, 'ids_00000.npy'))
+        assert ids.dtype == np.int64
+        # the image names are appended one per line
+        with open(osp.join(tmpdir, 'images.jsonl')) as f:
+            assert [json.loads(line) for line in f] == img_names
+        # names appended without their boxes are dropped when reopening
+        index.add_image('lost.jpg', results[0])
+        index._save_meta()
+        index.meta['num_images'] = 40
+        with open(osp.join(tmpdir, 'index.json'), 'w') as f:
+            json.dump(index.meta, f)
+        assert GallerySearchIndex(tmpdir).img_names == img_names
+        with open(osp.join(tmpdir, 'images.jsonl')) as f:
+            assert len(f.readlines()) == 40
+
+    # fewer boxes than topk and float16 storage
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = build_search_index(
+            results[:2], img_names[:2], tmpdir, det_thresh=0.,
+            feat_dtype='float16')
+        num_boxes = len(index)
+        sims, inds = index.search(query_feats, topk=num_boxes + 3)
+        assert (inds[:, num_boxes:] == -1).all()
+        assert np.isneginf(sims[:, num_boxes:]).all()
+        ref_sims, ref_inds, _ = _brute_force(results[:2], query_feats,
+                                             num_boxes, 0.)
+        assert np.allclose(sims[:, :num_boxes], ref_sims, atol=1e-2)
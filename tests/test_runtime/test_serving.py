@@ -0,0 +1,238 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import asyncio
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from mmdet.apis import (MicroBatchServer, ServerOverloadedError,
+                        decode_detections, encode_detections,
+                        request_detections)
+
+
+class FakeEngine:
+    """Detects one box per frame whose score and embedding are the mean
+    pixel value of the frame."""
+
+    def __init__(self, delay=0., feat_dim=4):
+        self.delay = delay
+        self.feat_dim = feat_dim
+        self.batch_sizes = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, imgs):
+        self.release.wait()
+        time.sleep(self.delay)
+        self.batch_sizes.append(len(imgs))
+        results = []
+        for img in imgs:
+            value = float(img.mean())
+            dets = np.full((2, 5 + self.feat_dim), value, dtype=np.float32)
+            dets[1, 4] = -1
+            results.append([dets])
+        return results
+
+
+class TwoStageFakeEngine(FakeEngine):
+    """Answers a batch with one tuple of the detection results and of the
+    same boxes with their RoI embeddings, the latter offset by 1."""
+
+    def __call__(self, imgs):
+        results_n = super().__call__(imgs)
+        results_b = []
+        for result in results_n:
+            dets = result[0].copy()
+            dets[:, 5:] += 1
+            results_b.append(dets)
+        return results_n, results_b
+
+
+def test_encode_detections():
+    dets = np.random.rand(6, 5 + 16).astype(np.float32)
+    boxes, feats = decode_detections(encode_detections(dets, 'float32'))
+    np.testing.assert_array_equal(boxes, dets[:, :5])
+    np.testing.assert_array_equal(feats, dets[:, 5:])
+    buf = encode_detections(dets)
+    assert len(buf) == 12 + 6 * (5 * 4 + 16 * 2)
+    boxes, feats = decode_detections(buf)
+    np.testing.assert_array_equal(boxes, dets[:, :5])
+    np.testing.assert_allclose(feats, dets[:, 5:], atol=1e-3)
+    boxes, feats = decode_detections(encode_detections(dets[:0]))
+    assert boxes.shape == (0, 5) and feats.shape == (0, 16)
+
+
+def test_micro_batch_server():
+    engine = FakeEngine(delay=0.01)
+    server = MicroBatchServer(
+        engine, max_batch_size=4, max_latency=0.05, feat_dtype='float32')
+    frames = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(10)]
+
+    async def run():
+        async with server:
+            return await asyncio.gather(
+                *[server.infer(frame) for frame in frames])
+
+    bufs = asyncio.run(run())
+    for i, buf in enumerate(bufs):
+        boxes, feats = decode_detections(buf)
+        # the detections below det_thresh are dropped
+        assert len(boxes) == 1
+        assert boxes[0, 4] == i and (feats == i).all()
+    assert sum(engine.batch_sizes) == 10
+    assert max(engine.batch_sizes) == 4
+    metrics = server.metrics()
+    assert metrics['frames'] == 10 and metrics['requests'] == 10
+    assert metrics['batches'] == len(engine.batch_sizes)
+    assert metrics['rejected'] == 0
+    assert metrics['latency_p99'] >= metrics['queue_time_p99'] > 0
+
+
+def test_micro_batch_server_two_stage():
+    engine = TwoStageFakeEngine()
+    server = MicroBatchServer(
+        engine, max_batch_size=4, max_latency=0.05, feat_dtype='float32')
+    frames = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(6)]
+
+    async def run():
+        async with server:
+            return await asyncio.gather(
+                *[server.infer(frame) for frame in frames])
+
+    bufs = asyncio.run(run())
+    for i, buf in enumerate(bufs):
+        boxes, feats = decode_detections(buf)
+        # every frame gets its own RoI embeddings
+        assert len(boxes) == 1
+        assert boxes[0, 4] == i and (feats == i + 1).all()
+    assert max(engine.batch_sizes) > 1
+
+
+def test_micro_batch_server_backpressure():
+    engine = FakeEngine()
+    engine.release.clear()
+    server = MicroBatchServer(engine, max_batch_size=1, max_queue_size=2)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    async def run():
+        async with server:
+            # the first frame is being run, two are queued
+            tasks = [asyncio.ensure_future(server.infer(frame))]
+            await asyncio.sleep(0.05)
+            tasks += [
+                asyncio.ensure_future(server.infer(frame)) for _ in range(2)
+            ]
+            await asyncio.sleep(0)
+            with pytest.raises(ServerOverloadedError):
+                await server.infer(frame)
+            assert server.metrics()['queue_depth'] == 2
+            engine.release.set()
+            return await asyncio.gather(*tasks)
+
+    assert len(asyncio.run(run())) == 3
+    metrics = server.metrics()
+    assert metrics['rejected'] == 1 and metrics['max_queue_depth'] == 2
+
+
+def test_micro_batch_server_errors():
+
+    def engine(imgs):
+        raise RuntimeError('out of memory')
+
+    async def run():
+        async with MicroBatchServer(engine) as server:
+            with pytest.raises(RuntimeError, match='out of memory'):
+                await server.infer(np.zeros((8, 8, 3), dtype=np.uint8))
+            with pytest.raises(ValueError):
+                await server.infer(b'not an image')
+
+    asyncio.run(run())
+
+
+def test_micro_batch_server_connection():
+    server = MicroBatchServer(FakeEngine(), max_latency=0.01)
+    frame = np.full((16, 16, 3), 100, dtype=np.uint8)
+    img_bytes = cv2.imencode('.png', frame)[1].tobytes()
+
+    async def run():
+        async with server:
+            tcp_server = await asyncio.start_server(server.handle_connection,
+                                                    '127.0.0.1', 0)
+            port = tcp_server.sockets[0].getsockname()[1]
+            async with tcp_server:
+                reader, writer = await asyncio.open_connection(
+                    '127.0.0.1', port)
+                results = [
+                    await request_detections(reader, writer, img_bytes)
+                    for _ in range(3)
+                ]
+                with pytest.raises(RuntimeError):
+                    await request_detections(reader, writer, b'not an image')
+                writer.close()
+                await writer.wait_closed()
+                return results
+
+    for boxes, feats in asyncio.run(run()):
+        assert boxes.shape == (1, 5) and boxes[0, 4] == 100
+        assert feats.shape == (1, 4)
+
+
+def test_micro_batch_server_stop():
+    engine = FakeEngine()
+    engine.release.clear()
+    server = MicroBatchServer(engine, max_batch_size=2, max_latency=0.01)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    async def run():
+        await server.start()
+        try:
+            # the first two frames are being run, the last one is queued
+            tasks = [
+                asyncio.ensure_future(server.infer(frame)) for _ in range(2)
+            ]
+            await asyncio.sleep(0.05)
+            tasks.append(asyncio.ensure_future(server.infer(frame)))
+            await asyncio.sleep(0)
+            await server.stop()
+            return await asyncio.wait_for(
+                asyncio.gather(*tasks, return_exceptions=True), 1)
+        finally:
+            engine.release.set()
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+def test_micro_batch_server_disconnect():
+    server = MicroBatchServer(FakeEngine(), max_latency=0.01)
+    errors = []
+
+    async def run():
+        closed = asyncio.Event()
+
+        async def handle_connection(reader, writer):
+            try:
+                await server.handle_connection(reader, writer)
+            except Exception as e:
+                errors.append(e)
+            closed.set()
+
+        async with server:
+            tcp_server = await asyncio.start_server(handle_connection,
+                                                    '127.0.0.1', 0)
+            port = tcp_server.sockets[0].getsockname()[1]
+            async with tcp_server:
+                reader, writer = await asyncio.open_connection(
+                    '127.0.0.1', port)
+                # the client disconnects in the middle of the image
+                writer.write(struct.pack('<I', 100) + b'0' * 10)
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+                await asyncio.wait_for(closed.wait(), 1)
+
+    asyncio.run(run())
+    assert errors == []
@@ -5,6 +5,7 @@ import sys
 import tempfile
 from unittest.mock import MagicMock, Mock, call, patch
 
+import mmcv
 import numpy as np
 import pytest
 import torch
@@ -239,6 +240,73 @@ def test_ema_hook():
     shutil.rmtree(work_dir)
 
 
+def test_ema_hook_fused_update():
+
+    class DemoModel(nn.Module):
+
+        def __init__(self):
+            super().__init__()
+            self.conv = nn.Conv2d(3, 4, 3)
+            self.bn = nn.BatchNorm2d(4)
+            self.linear = nn.Linear(4, 2)
+
+    torch.manual_seed(0)
+    model = DemoModel()
+    ref_model = DemoModel()
+    ref_model.load_state_dict(model.state_dict())
+    ref_state = ref_model.state_dict()
+    ref_ema = {name: value.clone() for name, value in ref_state.items()}
+
+    def ref_swap():
+        # the per-name loop of the original hook
+        for name, value in ref_state.items():
+            temp = value.clone()
+            value.copy_(ref_ema[name])
+            ref_ema[name].copy_(temp)
+
+    runner = Mock(model=model, iter=0)
+    ema_hook = ExpMomentumEMAHook(momentum=0.1, total_iter=5)
+    ema_hook.before_run(runner)
+    # one buffer per name, as in older checkpoints
+    assert torch.equal(model.ema_conv_weight, model.conv.weight)
+    assert torch.equal(model.ema_bn_num_batches_tracked,
+                       model.bn.num_batches_tracked)
+
+    for epoch in range(2):
+        ema_hook.before_train_epoch(runner)
+        ref_swap()
+        for i in range(3):
+            runner.iter = epoch * 3 + i
+            state_dict = model.state_dict()
+            for name, ref_value in ref_state.items():
+                delta = torch.randint_like(ref_value, 0, 3)
+                state_dict[name].add_(delta)
+                ref_value.add_(delta)
+            ema_hook.after_train_iter(runner)
+            momentum = ema_hook.get_momentum(runner)
+            for name, value in ref_state.items():
+                if value.dtype.is_floating_point:
+                    ref_ema[name].mul_(1 - momentum).add_(
+                        value, alpha=momentum)
+        ema_hook.after_train_epoch(runner)
+        ref_swap()
+        # the model holds the ema and the buffers the trained weights
+        state_dict = model.state_dict()
+        for name, value in ref_state.items():
+            ema_name = f"ema_{name.replace('.', '_')}"
+            assert torch.equal(state_dict[name], value)
+            assert torch.equal(state_dict[ema_name], ref_ema[name])
+
+    # loading a checkpoint writes into the flattened buffers
+    ema_hook.before_train_epoch(runner)
+    model.load_state_dict(
+        {name: torch.ones_like(v)
+         for name, v in model.state_dict().items()})
+    ema_hook.after_train_iter(runner)
+    assert (model.ema_linear_weight == 1).all()
+    assert (model.linear.weight == 1).all()
+
+
 def test_sync_norm_hook():
     # Only used to prevent program errors
     SyncNormHook()
@@ -413,3 +481,76 @@ def test_memory_profiler_hook():
         assert mock_memory_usage.called
 
     _test_memory_profiler_hook()
+
+
+def test_step_profiler_hook():
+    from mmdet.core.hook.step_profiler_hook import _HostSyncCounter
+
+    class DemoHead(nn.Module):
+
+        def __init__(self):
+            super().__init__()
+            self.fc = nn.Linear(4, 1)
+            self.loss_cls = nn.L1Loss()
+
+        def forward_train(self, x):
+            loss = self.loss_cls(self.fc(x), torch.zeros(x.size(0), 1))
+            # a host synchronization on a device tensor
+            loss.item()
+            return loss
+
+    class DemoModel(nn.Module):
+
+        def __init__(self):
+            super().__init__()
+            self.backbone = nn.Linear(2, 4)
+            self.neck = nn.ReLU()
+            self.bbox_head = DemoHead()
+
+        def train_step(self, x, optimizer, **kwargs):
+            loss = self.bbox_head.forward_train(self.neck(self.backbone(x)))
+            return dict(
+                loss=loss, log_vars=dict(loss=loss.item()), num_samples=1)
+
+    loader = DataLoader(torch.ones((5, 2)))
+    runner = _build_demo_runner(max_epochs=2)
+    runner.model = DemoModel()
+    runner.optimizer = torch.optim.SGD(runner.model.parameters(), lr=0.01)
+    runner.register_optimizer_hook(dict(grad_clip=None))
+    runner.register_hook_from_cfg(
+        dict(type='StepProfilerHook', profile_iters=2, profile_start=1))
+    runner.run([loader], [('train', 1)])
+
+    for epoch in (1, 2):
+        summary = mmcv.load(
+            f'{runner.work_dir}/step_profile_epoch_{epoch}.json')
+        assert summary['num_iters'] == 5
+        assert set(summary['stages']) == {
+            'data_wait', 'forward', 'backbone', 'neck', 'bbox_head',
+            'bbox_head.loss_cls', 'backward', 'optimizer', 'total'
+        }
+        stages = summary['stages']
+        assert stages['bbox_head']['total'] >= stages['bbox_head.loss_cls'][
+            'total']
+        assert stages['forward']['total'] <= stages['total']['total']
+        # the model is on the CPU, so nothing is copied from a device
+        assert summary['host_syncs']['total'] == 0
+        assert len(summary['profiler_ops']) > 0
+    # the model is restored
+    assert 'forward_train' not in vars(runner.model.bbox_head)
+    assert 'step' not in vars(runner.optimizer)
+    shutil.rmtree(runner.work_dir)
+
+    # count the copies of the tensors of some device types to the host
+    x = torch.ones(3)
+    item = torch.Tensor.item
+    with _HostSyncCounter(device_types=('cpu', )) as counter:
+        x.sum().item()
+        x.tolist()
+        x.to('cpu')
+        x.to(torch.float64)
+        if x.any():
+            pass
+    assert sum(counter.sites.values()) == 4
+    assert all(site.startswith(__file__) for site in counter.sites)
+    assert torch.Tensor.item is item
@@ -0,0 +1,116 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import mmcv
+import torch
+import torch.nn.functional as F
+
+from mmdet.core import bbox_mapping, merge_aug_reid_results
+from mmdet.models.utils import group_aug_imgs
+
+
+def test_merge_aug_reid_results():
+    cfg = mmcv.Config(
+        dict(nms=dict(type='nms', iou_threshold=0.5), max_per_img=100))
+    img_metas = [
+        dict(
+            img_shape=(100, 200, 3),
+            scale_factor=[1., 1., 1., 1.],
+            flip=False,
+            flip_direction=None),
+        dict(
+            img_shape=(200, 400, 3),
+            scale_factor=[2., 2., 2., 2.],
+            flip=True,
+            flip_direction='horizontal')
+    ]
+    bboxes = torch.Tensor([[10., 10., 50., 90.], [120., 5., 160., 80.]])
+    scores = torch.Tensor([0.9, 0.6])
+    labels = torch.LongTensor([0, 0])
+    feats = [torch.rand(2, 8), torch.rand(2, 8)]
+
+    # the same boxes seen by both augmentations
+    aug_results = []
+    for img_meta, aug_feats, aug_scores in zip(img_metas, feats,
+                                               [scores, scores * 0.5]):
+        aug_bboxes = bbox_mapping(bboxes, img_meta['img_shape'],
+                                  img_meta['scale_factor'], img_meta['flip'],
+                                  img_meta['flip_direction'])
+        aug_results.append(
+            (torch.cat([aug_bboxes, aug_scores[:, None]], -1), labels,
+             aug_feats))
+    det_bboxes, det_labels, det_feats = merge_aug_reid_results(
+        aug_results, img_metas, cfg)
+
+    assert det_bboxes.shape == (2, 5)
+    assert torch.allclose(det_bboxes[:, :4], bboxes)
+    assert torch.allclose(det_bboxes[:, 4], scores)
+    assert torch.equal(det_labels, labels)
+    # weighted by the scores of the matches, on the scale of the embeddings
+    expected = F.normalize(
+        F.normalize(feats[0]) * scores[:, None] +
+        F.normalize(feats[1]) * scores[:, None] * 0.5)
+    expected *= (feats[0].norm(dim=1, keepdim=True) +
+                 feats[1].norm(dim=1, keepdim=True) * 0.5) / 1.5
+    assert torch.allclose(det_feats, expected, atol=1e-6)
+
+    # boxes without matches keep their own embedding
+    aug_results[1] = (aug_results[1][0][:0], labels[:0], feats[1][:0])
+    _, _, det_feats = merge_aug_reid_results(aug_results, img_metas, cfg)
+    assert torch.allclose(det_feats, feats[0], atol=1e-6)
+
+    # no detection at all
+    empty = [(result[0][:0], labels[:0], result[2][:0])
+             for result in aug_results]
+    det_bboxes, det_labels, det_feats = merge_aug_reid_results(
+        empty, img_metas, cfg)
+    assert det_bboxes.shape == (0, 5)
+    assert det_feats.shape == (0, 8)
+
+
+def test_merge_aug_reid_results_degenerate_boxes():
+    cfg = mmcv.Config(
+        dict(nms=dict(type='nms', iou_threshold=0.5), max_per_img=100))
+    img_metas = [
+        dict(
+            img_shape=(200, 200, 3),
+            scale_factor=[1., 1., 1., 1.],
+            flip=flip,
+            flip_direction='horizontal') for flip in (False, True)
+    ]
+    # boxes clipped to a line or a point at the image edge, and a box with
+    # its corners swapped
+    bboxes = torch.Tensor([[0., 120., 0., 120.], [0., 10., 0., 60.],
+                           [80., 80., 40., 40.], [20., 20., 60., 90.]])
+    labels = torch.zeros(4, dtype=torch.long)
+    aug_results = []
+    for i, img_meta in enumerate(img_metas):
+        aug_bboxes = bbox_mapping(bboxes, img_meta['img_shape'],
+                                  img_meta['scale_factor'], img_meta['flip'],
+                                  img_meta['flip_direction'])
+        scores = torch.Tensor([0.9, 0.8, 0.7, 0.6]) - 0.05 * i
+        aug_results.append((torch.cat([aug_bboxes, scores[:, None]], -1),
+                            labels, torch.rand(4, 8) + 0.1))
+    det_bboxes, _, det_feats = merge_aug_reid_results(aug_results, img_metas,
+                                                      cfg)
+    assert len(det_bboxes) == len(det_feats) > 4
+    assert torch.isfinite(det_feats).all()
+    assert (det_feats.norm(dim=1) > 0).all()
+
+    # a box without weight keeps its own embedding
+    aug_results = aug_results[:1]
+    aug_results[0][0][:, 4] = 0
+    det_bboxes, _, det_feats = merge_aug_reid_results(aug_results,
+                                                      img_metas[:1], cfg)
+    for feat in det_feats:
+        assert (aug_results[0][2] == feat).all(dim=1).any()
+
+
+def test_group_aug_imgs():
+    imgs = [
+        torch.rand(2, 3, 32, 64),
+        torch.rand(2, 3, 64, 96),
+        torch.rand(2, 3, 32, 64)
+    ]
+    groups = group_aug_imgs(imgs)
+    assert [inds for inds, _ in groups] == [[0, 2], [1]]
+    assert torch.equal(groups[0][1], torch.cat([imgs[0], imgs[2]]))
+    assert torch.equal(groups[1][1], imgs[1])
@@ -0,0 +1,62 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import pytest
+import torch
+
+from mmdet.core import ReidResultPacker, bbox2result_reid
+
+
+def _random_dets(num, num_classes, feat_dim, device):
+    bboxes = torch.rand(num, 5, device=device)
+    labels = torch.randint(num_classes, (num, ), device=device)
+    reid_feats = torch.rand(num, feat_dim, device=device)
+    return bboxes, labels, reid_feats
+
+
+@pytest.mark.parametrize('device', [
+    'cpu',
+    pytest.param(
+        'cuda',
+        marks=pytest.mark.skipif(
+            not torch.cuda.is_available(), reason='requires CUDA support'))
+])
+def test_reid_result_packer(device):
+    torch.manual_seed(0)
+    num_classes, feat_dim = 3, 32
+    packer = ReidResultPacker(num_classes)
+    for nums in ([5, 0, 12], [20, 7], [0, 3]):
+        bbox_list = [
+            _random_dets(num, num_classes, feat_dim, device) for num in nums
+        ]
+        results = packer(bbox_list)
+        assert len(results) == len(nums)
+        for result, dets in zip(results, bbox_list):
+            expected = bbox2result_reid(*dets, num_classes)
+            assert len(result) == num_classes
+            for cls_result, cls_expected in zip(result, expected):
+                assert cls_result.shape == cls_expected.shape
+                np.testing.assert_array_equal(cls_result, cls_expected)
+
+    # the feature width of empty results is inferred
+    results = packer([_random_dets(0, num_classes, 16, device)])
+    assert results[0][0].shape == (0, 5 + 16)
+    assert bbox2result_reid(
+        *_random_dets(0, num_classes, 16, device),
+        num_classes)[0].shape == (0, 5 + 16)
+
+    # or given when the detections have no feature dimension
+    no_dets = (torch.zeros(0, 5), torch.zeros(0, dtype=torch.long),
+               torch.zeros(0))
+    assert ReidResultPacker(num_classes, feat_dim=24)(
+        [no_dets])[0][0].shape == (0, 5 + 24)
+    assert bbox2result_reid(
+        *no_dets, num_classes, feat_dim=24)[0].shape == (0, 5 + 24)
+    with pytest.raises(AssertionError):
+        bbox2result_reid(*no_dets, num_classes)
+
+    # numpy detections fall back to bbox2result_reid
+    dets = [t.cpu().numpy() for t in _random_dets(4, num_classes, 8, 'cpu')]
+    result = packer([dets])[0]
+    for cls_result, cls_expected in zip(
+            result, bbox2result_reid(*dets, num_classes)):
+        np.testing.assert_array_equal(cls_result, cls_expected)
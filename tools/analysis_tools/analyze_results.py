@@ -6,7 +6,7 @@ import mmcv
 import numpy as np
 from mmcv import Config, DictAction
 
-from mmdet.core.evaluation import eval_map
+from mmdet.core.evaluation import eval_map, load_results
 from mmdet.core.visualization import imshow_gt_det_bboxes
 from mmdet.datasets import build_dataset, get_loading_pipeline
 from mmdet.utils import update_data_root
@@ -198,7 +198,7 @@ def main():
     cfg.data.test.pop('samples_per_gpu', 0)
     cfg.data.test.pipeline = get_loading_pipeline(cfg.data.train.pipeline)
     dataset = build_dataset(cfg.data.test)
-    outputs = mmcv.load(args.prediction_path)
+    outputs = load_results(args.prediction_path)
 
     result_visualizer = ResultVisualizer(args.show, args.wait_time,
                                          args.show_score_thr)
@@ -0,0 +1,132 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Measure the training step time with and without skipping the pyramid
+levels that can never be assigned positives.
+
+The active levels are derived from the ``regress_ranges`` of the head and set
+on both the neck and the head. Synthetic images and boxes are used, e.g.::
+
+    python tools/analysis_tools/benchmark_active_levels.py \\
+        configs/person_search/faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py \\
+        --device cuda
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+from mmcv import Config, DictAction
+
+from mmdet.models import build_detector
+from mmdet.utils import update_data_root
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark training step with active levels')
+    parser.add_argument('config', help='train config file path')
+    parser.add_argument(
+        '--batch-size', type=int, default=2, help='images per step')
+    parser.add_argument(
+        '--img-scale',
+        type=int,
+        nargs=2,
+        default=[1333, 800],
+        help='width and height of the synthetic images')
+    parser.add_argument(
+        '--num-gts', type=int, default=5, help='number of boxes per image')
+    parser.add_argument(
+        '--num-iters', type=int, default=10, help='number of measured steps')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='number of warmup steps')
+    parser.add_argument('--device', default='cpu', help='device to run on')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    return parser.parse_args()
+
+
+def synthetic_batch(args, rng):
+    width, height = args.img_scale
+    pad_w = int(np.ceil(width / 32)) * 32
+    pad_h = int(np.ceil(height / 32)) * 32
+    img = torch.randn(args.batch_size, 3, pad_h, pad_w, device=args.device)
+    img_metas = [
+        dict(
+            img_shape=(height, width, 3),
+            ori_shape=(height, width, 3),
+            pad_shape=(pad_h, pad_w, 3),
+            scale_factor=np.array([1., 1., 1., 1.], dtype=np.float32),
+            flip=False,
+            flip_direction=None) for _ in range(args.batch_size)
+    ]
+    gt_bboxes, gt_labels, gt_ids = [], [], []
+    for _ in range(args.batch_size):
+        x1 = rng.uniform(0, width * 0.8, args.num_gts)
+        y1 = rng.uniform(0, height * 0.5, args.num_gts)
+        w = rng.uniform(20, width * 0.2, args.num_gts)
+        h = rng.uniform(50, height * 0.5, args.num_gts)
+        boxes = np.stack([x1, y1, x1 + w, y1 + h], axis=1)
+        gt_bboxes.append(torch.tensor(boxes, dtype=torch.float32,
+                                      device=args.device))
+        gt_labels.append(
+            torch.zeros(args.num_gts, dtype=torch.long, device=args.device))
+        gt_ids.append(
+            torch.tensor(rng.randint(-1, 100, args.num_gts),
+                         device=args.device))
+    return img, img_metas, gt_bboxes, gt_labels, gt_ids
+
+
+def measure_step_time(model, batch, args):
+    img, img_metas, gt_bboxes, gt_labels, gt_ids = batch
+    elapsed = 0
+    for i in range(args.num_warmup + args.num_iters):
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        losses = model.forward_train(img, img_metas, gt_bboxes, gt_labels,
+                                     gt_ids)
+        loss, _ = model._parse_losses(losses)
+        model.zero_grad()
+        loss.backward()
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        if i >= args.num_warmup:
+            elapsed += time.perf_counter() - start
+    return elapsed / args.num_iters
+
+
+def main():
+    args = parse_args()
+
+    cfg = Config.fromfile(args.config)
+    update_data_root(cfg)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    cfg.model.pretrained = None
+
+    model = build_detector(cfg.model)
+    active_levels = tuple(model.bbox_head.assignable_levels())
+    fast_cfg = copy.deepcopy(cfg.model)
+    fast_cfg.neck.active_levels = active_levels
+    fast_cfg.bbox_head.active_levels = active_levels
+    fast_model = build_detector(fast_cfg)
+    fast_model.load_state_dict(model.state_dict())
+
+    batch = synthetic_batch(args, np.random.RandomState(0))
+    print(f'active levels: {active_levels}')
+    print(f'{"levels":>8} {"step (ms)":>10}')
+    times = []
+    for name, m in (('all', model), ('active', fast_model)):
+        m = m.to(args.device).train()
+        times.append(measure_step_time(m, batch, args))
+        print(f'{name:>8} {times[-1] * 1000:>10.1f}')
+        m.cpu()
+    print(f'speedup: {times[0] / times[1]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Measure test throughput of a detector against the test batch size.
+
+Synthetic images are used, so no dataset is needed, e.g.::
+
+    python tools/analysis_tools/benchmark_batch_test.py \\
+        configs/person_search/faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py \\
+        --batch-sizes 1 2 4 --img-scale 750 450
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from mmcv import Config, DictAction
+from mmcv.runner import load_checkpoint
+
+from mmdet.models import build_detector
+from mmdet.utils import update_data_root
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark test throughput against batch size')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--batch-sizes',
+        type=int,
+        nargs='+',
+        default=[1, 2, 4, 8],
+        help='batch sizes to measure')
+    parser.add_argument(
+        '--img-scale',
+        type=int,
+        nargs=2,
+        default=[1500, 900],
+        help='width and height of the synthetic images')
+    parser.add_argument(
+        '--num-images',
+        type=int,
+        default=16,
+        help='number of images measured per batch size')
+    parser.add_argument(
+        '--num-warmup', type=int, default=1, help='number of warmup batches')
+    parser.add_argument('--device', default='cpu', help='device to run on')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    return parser.parse_args()
+
+
+def synthetic_batch(batch_size, width, height, device):
+    pad_w = int(np.ceil(width / 32)) * 32
+    pad_h = int(np.ceil(height / 32)) * 32
+    img = torch.randn(batch_size, 3, pad_h, pad_w, device=device)
+    img_metas = [
+        dict(
+            img_shape=(height, width, 3),
+            ori_shape=(height, width, 3),
+            pad_shape=(pad_h, pad_w, 3),
+            scale_factor=np.array([1., 1., 1., 1.], dtype=np.float32),
+            flip=False,
+            flip_direction=None) for _ in range(batch_size)
+    ]
+    return img, img_metas
+
+
+def measure_throughput(model, batch_size, args):
+    width, height = args.img_scale
+    img, img_metas = synthetic_batch(batch_size, width, height, args.device)
+    num_iters = max(1, args.num_images // batch_size)
+    elapsed = 0
+    with torch.no_grad():
+        for i in range(args.num_warmup + num_iters):
+            if args.device.startswith('cuda'):
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            model.simple_test(img, img_metas, rescale=True)
+            if args.device.startswith('cuda'):
+                torch.cuda.synchronize()
+            if i >= args.num_warmup:
+                elapsed += time.perf_counter() - start
+    return num_iters * batch_size / elapsed
+
+
+def main():
+    args = parse_args()
+
+    cfg = Config.fromfile(args.config)
+    update_data_root(cfg)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    model = build_detector(cfg.model, test_cfg=cfg.get('test_cfg'))
+    if args.checkpoint:
+        load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model = model.to(args.device).eval()
+
+    print(f'{"batch size":>10} {"img / s":>10}')
+    for batch_size in args.batch_sizes:
+        fps = measure_throughput(model, batch_size, args)
+        print(f'{batch_size:>10} {fps:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
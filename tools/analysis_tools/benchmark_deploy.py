@@ -0,0 +1,130 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""CPU latency of a detector before and after :func:`convert_to_deploy`.
+
+The converted detector is first checked to compute the same features as the
+original one, then both are timed on a synthetic image, e.g.::
+
+    python tools/analysis_tools/benchmark_deploy.py \\
+        configs/person_search/faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py \\
+        --img-size 1500 900
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+from mmcv import Config, DictAction
+
+from mmdet.apis import init_detector
+from mmdet.models.utils import (DEPLOY_CONVERTERS, check_deploy_equivalence,
+                                convert_to_deploy)
+from mmdet.utils import update_data_root
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark the deploy conversion of a detector')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--converters',
+        nargs='+',
+        choices=list(DEPLOY_CONVERTERS.module_dict),
+        help='deploy converters to apply, all of them by default')
+    parser.add_argument(
+        '--img-size',
+        type=int,
+        nargs=2,
+        default=[1333, 800],
+        help='width and height of the synthetic image')
+    parser.add_argument(
+        '--num-iters', type=int, default=10, help='number of measured runs')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='number of warmup runs')
+    parser.add_argument(
+        '--num-threads', type=int, help='number of threads used by torch')
+    parser.add_argument(
+        '--atol',
+        type=float,
+        default=1e-3,
+        help='largest absolute difference of the features allowed')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    return parser.parse_args()
+
+
+def measure(fn, num_warmup, num_iters):
+    times = []
+    for i in range(num_warmup + num_iters):
+        start = time.perf_counter()
+        fn()
+        if i >= num_warmup:
+            times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def main():
+    args = parse_args()
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    cfg = Config.fromfile(args.config)
+    update_data_root(cfg)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    model = init_detector(cfg, args.checkpoint, device='cpu')
+    deploy_model = convert_to_deploy(
+        copy.deepcopy(model), converters=args.converters)
+
+    width, height = args.img_size
+    img = torch.randn(1, 3, height, width)
+    img_metas = [
+        dict(
+            img_shape=(height, width, 3),
+            ori_shape=(height, width, 3),
+            pad_shape=(height, width, 3),
+            batch_input_shape=(height, width),
+            scale_factor=np.ones(4, dtype=np.float32),
+            flip=False,
+            flip_direction=None)
+    ]
+
+    diff = check_deploy_equivalence(
+        model,
+        deploy_model,
+        img,
+        forward=lambda m, x: m.extract_feat(x),
+        atol=args.atol)
+    print(f'max abs difference of the features: {diff:.2e}')
+
+    num_params = [
+        sum(p.numel() for p in m.parameters()) for m in (model, deploy_model)
+    ]
+    print(f'{"model":>8} {"params":>10} {"mean":>9} {"p50":>9} {"p90":>9}'
+          '   (ms per image)')
+    means = []
+    for name, m, n in zip(('original', 'deploy'), (model, deploy_model),
+                          num_params):
+
+        def forward():
+            with torch.no_grad():
+                m(return_loss=False,
+                  rescale=True,
+                  img=[img],
+                  img_metas=[img_metas])
+
+        times = measure(forward, args.num_warmup, args.num_iters)
+        means.append(times.mean())
+        print(f'{name:>8} {n:>10} {times.mean():>9.1f} '
+              f'{np.percentile(times, 50):>9.1f} '
+              f'{np.percentile(times, 90):>9.1f}')
+    print(f'speedup: {means[0] / means[1]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
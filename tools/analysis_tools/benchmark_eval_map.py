@@ -0,0 +1,161 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Benchmark ``bbox_overlaps`` and ``eval_map`` on synthetic detections.
+
+The ``legacy`` rows reproduce the previous implementation: the IoU looping
+over the boxes, and ``eval_map`` forking a new pool per call and sending the
+full detection arrays, embeddings included, to the workers. E.g. for a PRW
+sized gallery::
+
+    python tools/analysis_tools/benchmark_eval_map.py --num-imgs 6000 \\
+        --feat-dim 256 --nproc 4
+"""
+import argparse
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from mmdet.core.evaluation import mean_ap
+from mmdet.core.evaluation.bbox_overlaps import bbox_overlaps
+from mmdet.core.evaluation.mean_ap import eval_map, tpfp_default
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark bbox_overlaps and eval_map')
+    parser.add_argument(
+        '--num-imgs', type=int, default=6000, help='number of images')
+    parser.add_argument(
+        '--num-dets', type=int, default=50, help='detections per image')
+    parser.add_argument(
+        '--num-gts', type=int, default=5, help='ground truths per image')
+    parser.add_argument(
+        '--feat-dim',
+        type=int,
+        default=256,
+        help='width of the embeddings after the scores')
+    parser.add_argument(
+        '--nproc', type=int, default=4, help='processes of eval_map')
+    parser.add_argument(
+        '--overlap-sizes',
+        type=int,
+        nargs='+',
+        default=[100, 1000, 5000],
+        help='numbers of boxes of the bbox_overlaps benchmark')
+    parser.add_argument(
+        '--repeat-num', type=int, default=3, help='number of measurements')
+    return parser.parse_args()
+
+
+def legacy_bbox_overlaps(bboxes1, bboxes2, mode='iou', eps=1e-6,
+                         use_legacy_coordinate=False):
+    extra_length = 1. if use_legacy_coordinate else 0.
+    bboxes1 = bboxes1.astype(np.float32)
+    bboxes2 = bboxes2.astype(np.float32)
+    rows, cols = bboxes1.shape[0], bboxes2.shape[0]
+    ious = np.zeros((rows, cols), dtype=np.float32)
+    if rows * cols == 0:
+        return ious
+    exchange = False
+    if rows > cols:
+        bboxes1, bboxes2 = bboxes2, bboxes1
+        ious = np.zeros((cols, rows), dtype=np.float32)
+        exchange = True
+    area1 = (bboxes1[:, 2] - bboxes1[:, 0] + extra_length) * (
+        bboxes1[:, 3] - bboxes1[:, 1] + extra_length)
+    area2 = (bboxes2[:, 2] - bboxes2[:, 0] + extra_length) * (
+        bboxes2[:, 3] - bboxes2[:, 1] + extra_length)
+    for i in range(bboxes1.shape[0]):
+        x_start = np.maximum(bboxes1[i, 0], bboxes2[:, 0])
+        y_start = np.maximum(bboxes1[i, 1], bboxes2[:, 1])
+        x_end = np.minimum(bboxes1[i, 2], bboxes2[:, 2])
+        y_end = np.minimum(bboxes1[i, 3], bboxes2[:, 3])
+        overlap = np.maximum(x_end - x_start + extra_length, 0) * np.maximum(
+            y_end - y_start + extra_length, 0)
+        if mode == 'iou':
+            union = area1[i] + area2 - overlap
+        else:
+            union = area1[i] if not exchange else area2
+        ious[i, :] = overlap / np.maximum(union, eps)
+    return ious.T if exchange else ious
+
+
+def legacy_eval_map(det_results, annotations, nproc):
+    # the workers are forked, so they see the patched function
+    mean_ap.bbox_overlaps = legacy_bbox_overlaps
+    try:
+        pool = Pool(nproc)
+        num_imgs = len(det_results)
+        for i in range(len(det_results[0])):
+            cls_dets = [img_res[i] for img_res in det_results]
+            cls_gts = [ann['bboxes'][ann['labels'] == i] for ann in annotations]
+            cls_gts_ignore = [np.zeros((0, 4), dtype=np.float32)] * num_imgs
+            pool.starmap(
+                tpfp_default,
+                zip(cls_dets, cls_gts, cls_gts_ignore, [0.5] * num_imgs,
+                    [None] * num_imgs, [False] * num_imgs))
+        pool.close()
+    finally:
+        mean_ap.bbox_overlaps = bbox_overlaps
+
+
+def random_bboxes(rng, num):
+    x1y1 = rng.rand(num, 2).astype(np.float32) * 1000
+    return np.hstack([x1y1, x1y1 + 20 + rng.rand(num, 2) * 200])
+
+
+def measure(fn, repeat_num):
+    elapsed = []
+    for _ in range(repeat_num):
+        start = time.perf_counter()
+        fn()
+        elapsed.append(time.perf_counter() - start)
+    return sum(elapsed) / len(elapsed) * 1000
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(0)
+
+    print(f'{"boxes":>12} {"legacy (ms)":>12} {"broadcast (ms)":>15} '
+          f'{"speedup":>8}')
+    for num in args.overlap_sizes:
+        bboxes1 = random_bboxes(rng, num)
+        bboxes2 = random_bboxes(rng, num // 10 + 1)
+        legacy_ms = measure(lambda: legacy_bbox_overlaps(bboxes1, bboxes2),
+                            args.repeat_num)
+        new_ms = measure(lambda: bbox_overlaps(bboxes1, bboxes2),
+                         args.repeat_num)
+        size = f'{num}x{num // 10 + 1}'
+        print(f'{size:>12} {legacy_ms:>12.2f} {new_ms:>15.2f} '
+              f'{legacy_ms / new_ms:>7.1f}x')
+
+    det_results, annotations = [], []
+    for _ in range(args.num_imgs):
+        dets = np.hstack([
+            random_bboxes(rng, args.num_dets),
+            rng.rand(args.num_dets, 1 + args.feat_dim)
+        ]).astype(np.float32)
+        det_results.append([dets])
+        annotations.append(
+            dict(
+                bboxes=random_bboxes(rng, args.num_gts),
+                labels=np.zeros(args.num_gts, dtype=np.int64)))
+
+    legacy_ms = measure(
+        lambda: legacy_eval_map(det_results, annotations, args.nproc),
+        args.repeat_num)
+    # the first call creates the pool that the measured calls reuse
+    eval_map(det_results, annotations, nproc=args.nproc, logger='silent')
+    new_ms = measure(
+        lambda: eval_map(
+            det_results, annotations, nproc=args.nproc, logger='silent'),
+        args.repeat_num)
+    print(f'\neval_map of {args.num_imgs} images with {args.num_dets} '
+          f'detections of {5 + args.feat_dim} columns, {args.nproc} '
+          f'processes:\nlegacy {legacy_ms:.0f} ms, new {new_ms:.0f} ms, '
+          f'{legacy_ms / new_ms:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
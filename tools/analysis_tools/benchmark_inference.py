@@ -0,0 +1,164 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Per-stage latency of batched inference with :class:`InferenceEngine`.
+
+Three ways of running a batch of frames are compared:
+
+- ``per_call``: the test pipeline is rebuilt for every batch and run image by
+  image, followed by ``collate``, as ``inference_detector`` used to do.
+- ``cached``: the engine with its cached ``Compose``, image by image.
+- ``batched``: the engine loading and resizing image by image, then
+  normalizing and padding the whole batch at once.
+
+Synthetic frames are used unless ``--imgs`` is given, e.g.::
+
+    python tools/analysis_tools/benchmark_inference.py \\
+        configs/person_search/faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py \\
+        --batch-size 4 --device cpu
+"""
+import argparse
+import copy
+import time
+from collections import defaultdict
+
+import mmcv
+import numpy as np
+import torch
+from mmcv import Config, DictAction
+from mmcv.parallel import collate
+
+from mmdet.apis import InferenceEngine, init_detector
+from mmdet.datasets import replace_ImageToTensor
+from mmdet.datasets.pipelines import Compose
+from mmdet.utils import update_data_root
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark per-stage inference latency')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument('--imgs', nargs='+', help='image files to run')
+    parser.add_argument(
+        '--batch-size', type=int, default=4, help='images per batch')
+    parser.add_argument(
+        '--img-size',
+        type=int,
+        nargs=2,
+        default=[1920, 1080],
+        help='width and height of the synthetic frames')
+    parser.add_argument(
+        '--num-iters', type=int, default=10, help='number of measured batches')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='number of warmup batches')
+    parser.add_argument('--device', default='cpu', help='device to run on')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    return parser.parse_args()
+
+
+class StageTimer:
+    """Accumulate the wall time of named stages."""
+
+    def __init__(self, device):
+        self.sync = torch.device(device).type == 'cuda'
+        self.times = defaultdict(float)
+        self.enabled = True
+
+    def __call__(self, stage, fn, *args):
+        if self.sync:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        out = fn(*args)
+        if self.sync:
+            torch.cuda.synchronize()
+        if self.enabled:
+            self.times[stage] += time.perf_counter() - start
+        return out
+
+
+def run_per_call(model, imgs, timer):
+    device = next(model.parameters()).device
+
+    def build():
+        pipeline = copy.deepcopy(model.cfg.data.test.pipeline)
+        pipeline[0].type = 'LoadImageFromWebcam'
+        return Compose(replace_ImageToTensor(pipeline))
+
+    def pipeline(test_pipeline):
+        return [test_pipeline(dict(img=img)) for img in imgs]
+
+    def to_batch(datas):
+        data = collate(datas, samples_per_gpu=len(imgs))
+        data['img_metas'] = [m.data[0] for m in data['img_metas']]
+        data['img'] = [img.data[0].to(device) for img in data['img']]
+        return data
+
+    def forward(data):
+        with torch.no_grad():
+            return model(return_loss=False, rescale=True, **data)
+
+    test_pipeline = timer('build', build)
+    datas = timer('pipeline', pipeline, test_pipeline)
+    data = timer('collate', to_batch, datas)
+    timer('forward', forward, data)
+
+
+def run_engine(engine, imgs, timer):
+    if engine.batched:
+        results = timer('pipeline', engine.load, imgs)
+        data = timer('collate', engine.collate, results)
+    else:
+        data = timer('pipeline', engine.preprocess, imgs)
+    timer('forward', engine.forward, data)
+
+
+def main():
+    args = parse_args()
+
+    cfg = Config.fromfile(args.config)
+    update_data_root(cfg)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    model = init_detector(cfg, args.checkpoint, device=args.device)
+
+    if args.imgs:
+        imgs = [mmcv.imread(f) for f in args.imgs]
+        imgs = [imgs[i % len(imgs)] for i in range(args.batch_size)]
+    else:
+        rng = np.random.RandomState(0)
+        width, height = args.img_size
+        imgs = [
+            rng.randint(0, 256, (height, width, 3), dtype=np.uint8)
+            for _ in range(args.batch_size)
+        ]
+
+    engine = InferenceEngine(model)
+    cached = InferenceEngine(model)
+    cached.batched = False
+    methods = dict(
+        per_call=lambda timer: run_per_call(model, imgs, timer),
+        cached=lambda timer: run_engine(cached, imgs, timer),
+        batched=lambda timer: run_engine(engine, imgs, timer))
+    if not engine.batched:
+        print('the test pipeline can not be batched, '
+              '"batched" runs the cached pipeline')
+
+    stages = ('build', 'pipeline', 'collate', 'forward')
+    print(f'{"method":>9} ' + ' '.join(f'{s:>9}' for s in stages) +
+          f' {"total":>9}   (ms per batch of {args.batch_size})')
+    for name, run in methods.items():
+        timer = StageTimer(args.device)
+        for i in range(args.num_warmup + args.num_iters):
+            timer.enabled = i >= args.num_warmup
+            run(timer)
+        times = [timer.times[s] / args.num_iters * 1000 for s in stages]
+        print(f'{name:>9} ' + ' '.join(f'{t:>9.1f}' for t in times) +
+              f' {sum(times):>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
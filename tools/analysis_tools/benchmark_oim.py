@@ -0,0 +1,138 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Micro-benchmark of the OIM memory updates on synthetic features.
+
+The lookup table and circular queue updates of OIM are measured for every
+``--num-samples``, then the omega-ranked queues of HOIM for every
+``--omega-queue-sizes`` as well.
+"""
+import argparse
+import time
+
+import torch
+
+from mmdet.models.dense_heads.oim_utils import (circular_enqueue_,
+                                                momentum_update_,
+                                                priority_enqueue_)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark the OIM lookup-table/queue updates')
+    parser.add_argument(
+        '--num-samples',
+        type=int,
+        nargs='+',
+        default=[256, 1024, 4096],
+        help='number of features per update')
+    parser.add_argument(
+        '--num-pids', type=int, default=5532, help='lookup table size')
+    parser.add_argument(
+        '--queue-size', type=int, default=5000, help='circular queue size')
+    parser.add_argument(
+        '--omega-queue-sizes',
+        type=int,
+        nargs='+',
+        default=[5000, 20000, 50000],
+        help='sizes of the omega-ranked queue of HOIM')
+    parser.add_argument(
+        '--feat-len', type=int, default=256, help='feature length')
+    parser.add_argument(
+        '--repeat-num', type=int, default=10, help='number of measurements')
+    parser.add_argument('--device', default='cpu', help='device to run on')
+    return parser.parse_args()
+
+
+def loop_update(lookup_table, queue, tail, features, pid_labels, momentum):
+    for indx, label in enumerate(pid_labels):
+        if label >= 0:
+            lookup_table[label] = (
+                momentum * lookup_table[label] +
+                (1 - momentum) * features[indx])
+    for indx, label in enumerate(pid_labels):
+        if label == -1:
+            queue[tail] = features[indx]
+            tail += 1
+            if tail >= queue.size(0):
+                tail -= queue.size(0)
+
+
+def batched_update(lookup_table, queue, tail, features, pid_labels,
+                   momentum):
+    valid = pid_labels >= 0
+    momentum_update_(lookup_table, features[valid], pid_labels[valid],
+                     momentum)
+    circular_enqueue_(queue, tail, features[pid_labels == -1])
+
+
+def loop_priority_update(queue, queue_omega, features, omegas):
+    for x, omega in zip(features, omegas):
+        if omega < queue_omega.min():
+            continue
+        header = queue_omega.argmin().item()
+        queue[header] = x
+        queue_omega[header] = omega
+
+
+def time_update(update, device, repeat_num):
+    elapsed = []
+    for _ in range(repeat_num):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        update()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        elapsed.append(time.perf_counter() - start)
+    return sum(elapsed) / len(elapsed) * 1000
+
+
+def measure_priority(update, args, queue_size, num_samples):
+    device = torch.device(args.device)
+    queue = torch.zeros(queue_size, args.feat_len, device=device)
+    # a warmed up queue, about half of the candidates are taken
+    queue_omega = torch.rand(queue_size, device=device)
+    features = torch.randn(num_samples, args.feat_len, device=device)
+    omegas = torch.rand(num_samples, device=device) * 2
+    return time_update(
+        lambda: update(queue, queue_omega.clone(), features, omegas), device,
+        args.repeat_num)
+
+
+def measure(update, args, num_samples):
+    device = torch.device(args.device)
+    lookup_table = torch.zeros(args.num_pids, args.feat_len, device=device)
+    queue = torch.zeros(args.queue_size, args.feat_len, device=device)
+    tail = torch.tensor(0, device=device)
+    features = torch.randn(num_samples, args.feat_len, device=device)
+    pid_labels = torch.randint(
+        -2, args.num_pids, (num_samples, ), device=device)
+
+    return time_update(
+        lambda: update(lookup_table, queue, tail, features, pid_labels, 0.5),
+        device, args.repeat_num)
+
+
+def main():
+    args = parse_args()
+    print(f'{"samples":>8} {"loop (ms)":>12} {"batched (ms)":>14} '
+          f'{"speedup":>8}')
+    for num_samples in args.num_samples:
+        loop_ms = measure(loop_update, args, num_samples)
+        batched_ms = measure(batched_update, args, num_samples)
+        print(f'{num_samples:>8} {loop_ms:>12.2f} {batched_ms:>14.2f} '
+              f'{loop_ms / batched_ms:>7.1f}x')
+
+    print(f'\n{"queue":>8} {"samples":>8} {"loop (ms)":>12} '
+          f'{"batched (ms)":>14} {"speedup":>8}')
+    for queue_size in args.omega_queue_sizes:
+        for num_samples in args.num_samples:
+            loop_ms = measure_priority(loop_priority_update, args, queue_size,
+                                       num_samples)
+            batched_ms = measure_priority(priority_enqueue_, args,
+                                          queue_size, num_samples)
+            print(f'{queue_size:>8} {num_samples:>8} {loop_ms:>12.2f} '
+                  f'{batched_ms:>14.2f} {loop_ms / batched_ms:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
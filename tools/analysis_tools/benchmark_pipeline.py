@@ -0,0 +1,218 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Throughput of the training data pipeline of a config, on the CPU.
+
+The transforms of ``cfg.data.train`` are first timed per sample in the main
+process, along with the collate of a batch. Then the data loader is swept
+over ``workers_per_gpu``, ``persistent_workers`` and ``pin_memory``, and its
+samples per second and CPU utilization are measured over a few epochs, e.g.::
+
+    python tools/analysis_tools/benchmark_pipeline.py \\
+        configs/person_search/faster_rcnn_r50_caffe_c4_1x_cuhk_single_two_stage17_6_nae1.py \\
+        --workers 0 2 5 --num-batches 40
+
+The CPU time of the workers is read from the resource usage of the
+terminated child processes, so this tool runs on Unix only.
+"""
+import argparse
+import gc
+import itertools
+import resource
+import time
+from collections import defaultdict
+
+import numpy as np
+from mmcv import Config, DictAction
+from mmcv.parallel import collate
+
+from mmdet.datasets import build_dataloader, build_dataset
+from mmdet.utils import setup_multi_processes, update_data_root
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark the training data pipeline')
+    parser.add_argument('config', help='train config file path')
+    parser.add_argument(
+        '--num-samples',
+        type=int,
+        default=100,
+        help='number of samples whose transforms are timed')
+    parser.add_argument(
+        '--samples-per-gpu',
+        type=int,
+        help='batch size, that of the config by default')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        help='values of workers_per_gpu swept, 0 and that of the config by '
+        'default')
+    parser.add_argument(
+        '--num-batches',
+        type=int,
+        default=20,
+        help='number of batches loaded per epoch of the sweep')
+    parser.add_argument(
+        '--num-epochs',
+        type=int,
+        default=2,
+        help='number of epochs per setting of the sweep, more than one shows '
+        'the startup of the workers saved by persistent_workers')
+    parser.add_argument(
+        '--skip-sweep',
+        action='store_true',
+        help='only time the transforms')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    return parser.parse_args()
+
+
+class TimedTransform:
+    """Call a transform and record its time in ``times[name]``."""
+
+    def __init__(self, transform, name, times):
+        self.transform = transform
+        self.name = name
+        self.times = times
+
+    def __call__(self, results):
+        start = time.perf_counter()
+        results = self.transform(results)
+        self.times[self.name].append(time.perf_counter() - start)
+        return results
+
+    def __repr__(self):
+        return repr(self.transform)
+
+
+def get_pipeline_dataset(dataset):
+    """The dataset applying the pipeline, under the dataset wrappers."""
+    while not hasattr(dataset, 'pipeline'):
+        if hasattr(dataset, 'datasets'):
+            dataset = dataset.datasets[0]
+        else:
+            dataset = dataset.dataset
+    return dataset
+
+
+def time_transforms(dataset, num_samples, samples_per_gpu):
+    pipeline = get_pipeline_dataset(dataset).pipeline
+    transforms = pipeline.transforms
+    times = defaultdict(list)
+    pipeline.transforms = [
+        TimedTransform(t, f'{i}: {type(t).__name__}', times)
+        for i, t in enumerate(transforms)
+    ]
+    samples = []
+    try:
+        rng = np.random.RandomState(0)
+        indices = rng.choice(
+            len(dataset), min(num_samples, len(dataset)), replace=False)
+        for idx in indices:
+            # the dataset draws another sample when the pipeline drops one
+            start = time.perf_counter()
+            samples.append(dataset[idx])
+            times['sample'].append(time.perf_counter() - start)
+    finally:
+        pipeline.transforms = transforms
+
+    for i in range(0, len(samples) - samples_per_gpu + 1, samples_per_gpu):
+        start = time.perf_counter()
+        collate(samples[i:i + samples_per_gpu], samples_per_gpu)
+        times['collate (batch)'].append(time.perf_counter() - start)
+    return times
+
+
+def measure_loader(dataset, samples_per_gpu, workers, persistent_workers,
+                   pin_memory, num_batches, num_epochs):
+    data_loader = build_dataloader(
+        dataset,
+        samples_per_gpu,
+        workers,
+        dist=False,
+        seed=0,
+        persistent_workers=persistent_workers,
+        pin_memory=pin_memory)
+    self_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    num_samples = 0
+    first_batch = []
+    data = None
+    start = time.perf_counter()
+    for _ in range(num_epochs):
+        epoch_start = time.perf_counter()
+        for i, data in enumerate(data_loader):
+            if i == 0:
+                first_batch.append(time.perf_counter() - epoch_start)
+            num_samples += sum(len(d) for d in data['img_metas'].data)
+            if i + 1 == num_batches:
+                break
+    elapsed = time.perf_counter() - start
+    self_end = resource.getrusage(resource.RUSAGE_SELF)
+    # the workers are accounted once they are terminated and joined
+    del data, data_loader
+    gc.collect()
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def cpu_time(end, begin):
+        return (end.ru_utime - begin.ru_utime) + (
+            end.ru_stime - begin.ru_stime)
+
+    main_cpu = cpu_time(self_end, self_start) / elapsed
+    worker_cpu = cpu_time(children_end, children_start) / elapsed / max(
+        workers, 1)
+    return (num_samples / elapsed, np.mean(first_batch) * 1000,
+            main_cpu * 100, worker_cpu * 100)
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    update_data_root(cfg)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    setup_multi_processes(cfg)
+
+    samples_per_gpu = args.samples_per_gpu or cfg.data.samples_per_gpu
+    dataset = build_dataset(cfg.data.train)
+
+    times = time_transforms(dataset, args.num_samples, samples_per_gpu)
+    total = np.sum(times['sample'])
+    print(f'{len(times["sample"])} samples, batches of {samples_per_gpu}')
+    print(f'{"transform":>28} {"mean":>9} {"p50":>9} {"p99":>9} '
+          f'{"share":>7}   (ms)')
+    for name, values in times.items():
+        values = np.array(values) * 1000
+        # the sample time is that of the whole pipeline and of the loading
+        # of the annotations
+        share = f'{values.sum() / 1000 / total:>7.1%}' if name not in (
+            'sample', 'collate (batch)') else f'{"":>7}'
+        print(f'{name:>28} {values.mean():>9.2f} '
+              f'{np.percentile(values, 50):>9.2f} '
+              f'{np.percentile(values, 99):>9.2f} {share}')
+    if args.skip_sweep:
+        return
+
+    workers = args.workers or sorted({0, cfg.data.workers_per_gpu})
+    print(f'\n{"workers":>8} {"persistent":>11} {"pin_memory":>11} '
+          f'{"samples/s":>10} {"first (ms)":>11} {"main CPU":>9} '
+          f'{"CPU/worker":>11}')
+    for num_workers, persistent_workers, pin_memory in itertools.product(
+            workers, (False, True), (False, True)):
+        if persistent_workers and num_workers == 0:
+            continue
+        throughput, first_batch, main_cpu, worker_cpu = measure_loader(
+            dataset, samples_per_gpu, num_workers, persistent_workers,
+            pin_memory, args.num_batches, args.num_epochs)
+        worker_cpu = f'{worker_cpu:>10.0f}%' if num_workers else f'{"-":>11}'
+        print(f'{num_workers:>8} {str(persistent_workers):>11} '
+              f'{str(pin_memory):>11} {throughput:>10.1f} '
+              f'{first_batch:>11.1f} {main_cpu:>8.0f}% {worker_cpu}')
+
+
+if __name__ == '__main__':
+    main()
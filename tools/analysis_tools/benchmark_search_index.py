@@ -0,0 +1,95 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Benchmark top-k search of a GallerySearchIndex on synthetic galleries."""
+import argparse
+import os
+import os.path as osp
+import tempfile
+import time
+
+import numpy as np
+
+from mmdet.apis import GallerySearchIndex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet benchmark the person search index')
+    parser.add_argument(
+        '--num-boxes',
+        type=int,
+        nargs='+',
+        default=[100000, 1000000],
+        help='gallery sizes to measure')
+    parser.add_argument(
+        '--boxes-per-image',
+        type=int,
+        default=10,
+        help='number of boxes of every synthetic image')
+    parser.add_argument(
+        '--feat-dim', type=int, default=256, help='embedding dimension')
+    parser.add_argument(
+        '--num-queries', type=int, default=100, help='number of queries')
+    parser.add_argument('--topk', type=int, default=10, help='top-k')
+    parser.add_argument(
+        '--block-size', type=int, default=65536, help='boxes per block')
+    parser.add_argument(
+        '--feat-dtype',
+        default='float32',
+        choices=['float32', 'float16'],
+        help='storage dtype of the embeddings')
+    parser.add_argument(
+        '--work-dir',
+        help='directory of the indices, a temporary one by default')
+    return parser.parse_args()
+
+
+def build_index(index_dir, args, num_boxes, rng):
+    index = GallerySearchIndex(
+        index_dir,
+        feat_dim=args.feat_dim,
+        block_size=args.block_size,
+        feat_dtype=args.feat_dtype)
+    num_imgs = num_boxes // args.boxes_per_image
+    boxes = np.tile(
+        np.array([[0, 0, 50, 100]], dtype=np.float32),
+        (args.boxes_per_image, 1))
+    scores = np.ones(args.boxes_per_image, dtype=np.float32)
+    for i in range(num_imgs):
+        feats = rng.randn(args.boxes_per_image,
+                          args.feat_dim).astype(np.float32)
+        index._add(f'{i:08d}.jpg', boxes, scores, feats)
+    index.flush()
+    return index
+
+
+def index_size(index_dir):
+    return sum(
+        osp.getsize(osp.join(index_dir, name))
+        for name in os.listdir(index_dir)) / 2**20
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    query_feats = rng.randn(args.num_queries,
+                            args.feat_dim).astype(np.float32)
+    print(f'{"boxes":>9} {"build (s)":>10} {"size (MB)":>10} '
+          f'{"search (s)":>11} {"ms / query":>11}')
+    for num_boxes in args.num_boxes:
+        with tempfile.TemporaryDirectory(dir=args.work_dir) as tmpdir:
+            start = time.perf_counter()
+            build_index(tmpdir, args, num_boxes, rng)
+            build_time = time.perf_counter() - start
+
+            # reopen so that blocks are read from disk
+            index = GallerySearchIndex(tmpdir)
+            start = time.perf_counter()
+            index.search(query_feats, topk=args.topk)
+            search_time = time.perf_counter() - start
+            print(f'{len(index):>9} {build_time:>10.2f} '
+                  f'{index_size(tmpdir):>10.1f} {search_time:>11.3f} '
+                  f'{search_time / args.num_queries * 1000:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,9 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import argparse
 
-import mmcv
 from mmcv import Config, DictAction
 
+from mmdet.core import load_results
 from mmdet.datasets import build_dataset
 from mmdet.utils import update_data_root
 
@@ -12,7 +12,10 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Evaluate metric of the '
                                      'results saved in pkl format')
     parser.add_argument('config', help='Config of the model')
-    parser.add_argument('pkl_results', help='Results in pickle format')
+    parser.add_argument(
+        'pkl_results',
+        help='Results in pickle format, or the directory of a ReID result '
+        'store')
     parser.add_argument(
         '--format-only',
         action='store_true',
@@ -64,7 +67,7 @@ def main():
     cfg.data.test.test_mode = True
 
     dataset = build_dataset(cfg.data.test)
-    outputs = mmcv.load(args.pkl_results)
+    outputs = load_results(args.pkl_results)
 
     kwargs = {} if args.eval_options is None else args.eval_options
     if args.format_only:
@@ -6,7 +6,7 @@ import mmcv
 import torch
 from ts.torch_handler.base_handler import BaseHandler
 
-from mmdet.apis import inference_detector, init_detector
+from mmdet.apis import InferenceEngine, init_detector
 
 
 class MMdetHandler(BaseHandler):
@@ -26,6 +26,9 @@ class MMdetHandler(BaseHandler):
         self.config_file = os.path.join(model_dir, 'config.py')
 
         self.model = init_detector(self.config_file, checkpoint, self.device)
+        # the pipeline is compiled once and each request batch is run as a
+        # single forward
+        self.engine = InferenceEngine(self.model)
         self.initialized = True
 
     def preprocess(self, data):
@@ -41,7 +44,7 @@ class MMdetHandler(BaseHandler):
         return images
 
     def inference(self, data, *args, **kwargs):
-        results = inference_detector(self.model, data)
+        results = self.engine(data)
         return results
 
     def postprocess(self, data):
@@ -11,6 +11,7 @@ from mmcv import Config, DictAction
 
 from mmdet.core.export import build_model_from_cfg, preprocess_example_input
 from mmdet.core.export.model_wrappers import ONNXRuntimeDetector
+from mmdet.models.utils import convert_to_deploy
 
 
 def pytorch2onnx(model,
@@ -288,6 +289,11 @@ def parse_args():
         help='Whether to export model without post process. Experimental '
         'option. We do not guarantee the correctness of the exported '
         'model.')
+    parser.add_argument(
+        '--deploy',
+        nargs='*',
+        help='convert the model to its inference graph with the given deploy '
+        'converters before exporting, all of them if none is given')
     args = parser.parse_args()
     return args
 
@@ -323,6 +329,8 @@ if __name__ == '__main__':
     # build the model and load checkpoint
     model = build_model_from_cfg(args.config, args.checkpoint,
                                  args.cfg_options)
+    if args.deploy is not None:
+        model = convert_to_deploy(model, args.deploy or None)
 
     if not args.input_img:
         args.input_img = osp.join(osp.dirname(__file__), '../../demo/demo.jpg')
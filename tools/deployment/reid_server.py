@@ -0,0 +1,76 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Serve a person search detector with dynamic micro-batching.
+
+Frames are sent over TCP as a 4-byte little-endian length followed by the
+encoded image, and answered with the boxes, scores and ReID embeddings, see
+:meth:`mmdet.apis.MicroBatchServer.handle_connection`.
+"""
+import argparse
+import asyncio
+
+from mmcv.utils import print_log
+
+from mmdet.apis import MicroBatchServer, init_detector
+from mmdet.utils import get_root_logger
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMDet person search micro-batching server')
+    parser.add_argument('config', help='Config file')
+    parser.add_argument('checkpoint', help='Checkpoint file')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind')
+    parser.add_argument(
+        '--device', default='cuda:0', help='Device used for inference')
+    parser.add_argument(
+        '--max-batch-size', type=int, default=8, help='Frames per forward')
+    parser.add_argument(
+        '--max-latency',
+        type=float,
+        default=0.01,
+        help='Seconds a frame waits for its batch to fill up')
+    parser.add_argument(
+        '--max-queue-size',
+        type=int,
+        default=64,
+        help='Queued frames beyond which requests are rejected')
+    parser.add_argument(
+        '--det-thresh', type=float, default=0.5, help='bbox score threshold')
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=60,
+        help='Seconds between two logs of the metrics, 0 means never')
+    return parser.parse_args()
+
+
+async def serve(args):
+    model = init_detector(args.config, args.checkpoint, device=args.device)
+    server = MicroBatchServer(
+        model,
+        max_batch_size=args.max_batch_size,
+        max_latency=args.max_latency,
+        max_queue_size=args.max_queue_size,
+        det_thresh=args.det_thresh)
+    logger = get_root_logger()
+    async with server:
+        tcp_server = await asyncio.start_server(server.handle_connection,
+                                                args.host, args.port)
+        print_log(f'serving on {args.host}:{args.port}', logger=logger)
+        async with tcp_server:
+            while True:
+                if args.metrics_interval <= 0:
+                    await tcp_server.serve_forever()
+                await asyncio.sleep(args.metrics_interval)
+                metrics = ', '.join(
+                    f'{k}: {v:.4g}' for k, v in server.metrics().items())
+                print_log(metrics, logger=logger)
+
+
+def main():
+    asyncio.run(serve(parse_args()))
+
+
+if __name__ == '__main__':
+    main()
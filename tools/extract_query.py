@@ -0,0 +1,107 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import argparse
+
+import mmcv
+from mmcv import Config, DictAction
+from mmcv.runner import load_checkpoint
+
+from mmdet.apis import extract_query_features
+from mmdet.core import load_results
+from mmdet.datasets import build_dataset, replace_ImageToTensor
+from mmdet.models import build_detector
+from mmdet.utils import build_dp, compat_cfg, get_device, update_data_root
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Extract (and cache) the probe features of a person '
+        'search test set')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--cache-dir',
+        help='directory of the probe feature cache, features are reused '
+        'when the checkpoint and the probes did not change')
+    parser.add_argument(
+        '--out', help='output file (pickle) of the probe features')
+    parser.add_argument(
+        '--samples-per-gpu',
+        type=int,
+        default=4,
+        help='number of probes per forward')
+    parser.add_argument(
+        '--workers-per-gpu', type=int, default=2, help='data loader workers')
+    parser.add_argument(
+        '--group-by-image',
+        action='store_true',
+        help='run the probes sharing an image in a single forward')
+    parser.add_argument(
+        '--gallery-results',
+        help='gallery results (pickle file or result store) of the same '
+        'checkpoint, to evaluate person search with the extracted probes')
+    parser.add_argument(
+        '--gallery-size',
+        type=int,
+        nargs='+',
+        default=[100],
+        help='gallery sizes of the search protocol to evaluate')
+    parser.add_argument(
+        '--gpu-id', type=int, default=0, help='id of gpu to use')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    cfg = Config.fromfile(args.config)
+    update_data_root(cfg)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    cfg = compat_cfg(cfg)
+    cfg.gpu_ids = [args.gpu_id]
+    cfg.device = get_device()
+
+    cfg.data.test.test_mode = True
+    if args.samples_per_gpu > 1:
+        cfg.data.test.query_test_pipeline = replace_ImageToTensor(
+            cfg.data.test.query_test_pipeline)
+    dataset = build_dataset(cfg.data.test)
+
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    model = build_detector(cfg.model, test_cfg=cfg.get('test_cfg'))
+    checkpoint = load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model.CLASSES = checkpoint.get('meta', {}).get('CLASSES',
+                                                   dataset.CLASSES)
+    model = build_dp(model, cfg.device, device_ids=cfg.gpu_ids)
+
+    query_results = extract_query_features(
+        model,
+        dataset,
+        checkpoint=args.checkpoint,
+        cache_dir=args.cache_dir,
+        samples_per_gpu=args.samples_per_gpu,
+        workers_per_gpu=args.workers_per_gpu,
+        group_by_image=args.group_by_image)
+    if args.out:
+        print(f'\nwriting probe features to {args.out}')
+        mmcv.dump(list(query_results), args.out)
+
+    if args.gallery_results:
+        results = load_results(args.gallery_results)
+        metric = dataset.evaluate(
+            results,
+            metric='search',
+            query_results=query_results,
+            gallery_size=args.gallery_size)
+        print(metric)
+
+
+if __name__ == '__main__':
+    main()